@@ -4,12 +4,20 @@ Provides administrator-friendly database access and management
 """
 
 from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash
-from models import db, User, Conversation, AdminUser
-from database import get_database_stats, backup_database_to_json
+from models import db, User, Conversation, ArchivedConversation, AdminUser, DailyConversationStat, DailyUserStat
+from database import get_database_stats
+from backup import get_backup_manager, list_backups
 from datetime import datetime, timedelta
 from functools import wraps
-import csv
-import io
+from sqlalchemy.orm import joinedload
+from pagination import keyset_paginate
+from search import search_conversations, search_archive, search_users, user_search_filter
+from rollups import refresh_days, user_days
+from counters import recount_users
+from archive import delete_archived_for_user
+from db_routing import use_replica
+from exports import (USER_HEADER, CONVERSATION_HEADER, user_export_rows, conversation_export_rows,
+                     csv_chunks, ndjson_chunks, export_response, export_options, dated_filename)
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -59,12 +67,15 @@ def admin_logout():
 
 @admin_bp.route('/dashboard')
 @admin_required
+@use_replica
 def dashboard():
     """Main admin dashboard."""
     stats = get_database_stats()
     
     # Get recent activity
-    recent_conversations = Conversation.query.order_by(
+    recent_conversations = Conversation.query.options(
+        joinedload(Conversation.user)
+    ).order_by(
         Conversation.timestamp.desc()
     ).limit(10).all()
     
@@ -78,11 +89,20 @@ def dashboard():
                          recent_users=recent_users)
 
 
+def _keyset_page(query, sort_column, id_column, cursor, per_page, count_key):
+    """Keyset page for an admin listing; a stale or mangled cursor falls back to the first page."""
+    try:
+        return keyset_paginate(query, sort_column, id_column, cursor=cursor, per_page=per_page, count_key=count_key)
+    except ValueError:
+        return keyset_paginate(query, sort_column, id_column, per_page=per_page, count_key=count_key)
+
+
 @admin_bp.route('/users')
 @admin_required
+@use_replica
 def list_users():
     """List all users."""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = 20
     
     search = request.args.get('search', '')
@@ -90,18 +110,10 @@ def list_users():
     query = User.query
     
     if search:
-        query = query.filter(
-            db.or_(
-                User.email.ilike(f'%{search}%'),
-                User.first_name.ilike(f'%{search}%'),
-                User.last_name.ilike(f'%{search}%'),
-                User.student_id.ilike(f'%{search}%')
-            )
-        )
+        query = query.filter(user_search_filter(search))
     
-    pagination = query.order_by(User.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    pagination = _keyset_page(query, User.created_at, User.id, cursor, per_page,
+                              count_key=('admin_users', search))
     
     return render_template('admin/users.html',
                          users=pagination.items,
@@ -111,16 +123,16 @@ def list_users():
 
 @admin_bp.route('/users/<int:user_id>')
 @admin_required
+@use_replica
 def user_detail(user_id):
     """View user details and their conversations."""
     user = User.query.get_or_404(user_id)
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = 20
     
-    pagination = user.conversations.order_by(
-        Conversation.timestamp.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    pagination = _keyset_page(user.conversations, Conversation.timestamp, Conversation.id, cursor, per_page,
+                              count_key=('admin_user_conversations', user_id))
     
     return render_template('admin/user_detail.html',
                          user=user,
@@ -130,15 +142,32 @@ def user_detail(user_id):
 
 @admin_bp.route('/conversations')
 @admin_required
+@use_replica
 def list_conversations():
-    """List all conversations."""
-    page = request.args.get('page', 1, type=int)
+    """List all conversations (archived ones with ?archive=1)."""
+    cursor = request.args.get('cursor')
     per_page = 20
     
-    search = request.args.get('search', '')
+    search = request.args.get('search', '').strip()
     filter_type = request.args.get('filter', 'all')
+    archive = request.args.get('archive') == '1'
+    model = ArchivedConversation if archive else Conversation
     
-    query = Conversation.query
+    if search:
+        # Ranked full-text search (a LIKE scan in the archive), paged by number
+        search_function = search_archive if archive else search_conversations
+        results = search_function(search, filter_type,
+                                  page=request.args.get('page', 1, type=int), per_page=per_page)
+        return render_template('admin/conversations.html',
+                             conversations=results.conversations,
+                             hits={hit.conversation.id: hit for hit in results.hits},
+                             results=results,
+                             pagination=None,
+                             search=search,
+                             filter_type=filter_type,
+                             archive=archive)
+    
+    query = model.query.options(joinedload(model.user))
     
     # Apply filters
     if filter_type == 'registered':
@@ -146,73 +175,85 @@ def list_conversations():
     elif filter_type == 'guest':
         query = query.filter_by(is_guest=True)
     
-    if search:
-        query = query.filter(
-            db.or_(
-                Conversation.question.ilike(f'%{search}%'),
-                Conversation.answer.ilike(f'%{search}%')
-            )
-        )
-    
-    pagination = query.order_by(Conversation.timestamp.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    pagination = _keyset_page(query, model.timestamp, model.id, cursor, per_page,
+                              count_key=('admin_conversations', filter_type, archive))
     
     return render_template('admin/conversations.html',
                          conversations=pagination.items,
+                         hits={},
+                         results=None,
                          pagination=pagination,
                          search=search,
-                         filter_type=filter_type)
+                         filter_type=filter_type,
+                         archive=archive)
 
 
 @admin_bp.route('/analytics')
 @admin_required
+@use_replica
 def analytics():
-    """Analytics dashboard."""
+    """Analytics dashboard, read entirely from the daily rollup tables."""
     # Get date range
     days = request.args.get('days', 30, type=int)
-    start_date = datetime.utcnow() - timedelta(days=days)
+    start_day = datetime.utcnow().date() - timedelta(days=days - 1)
     
     # Conversations over time
     conversations_by_date = db.session.query(
-        db.func.date(Conversation.timestamp).label('date'),
-        db.func.count(Conversation.id).label('count')
+        DailyConversationStat.day,
+        db.func.sum(DailyConversationStat.count)
     ).filter(
-        Conversation.timestamp >= start_date
+        DailyConversationStat.day >= start_day
     ).group_by(
-        db.func.date(Conversation.timestamp)
+        DailyConversationStat.day
+    ).order_by(
+        DailyConversationStat.day
     ).all()
     
-    # Top users by conversation count
-    top_users = db.session.query(
-        User,
-        db.func.count(Conversation.id).label('conversation_count')
-    ).join(
-        Conversation
+    # Registered/guest split and per-section totals in one pass over the range
+    by_section = db.session.query(
+        DailyConversationStat.course_section,
+        DailyConversationStat.is_guest,
+        db.func.sum(DailyConversationStat.count)
+    ).filter(
+        DailyConversationStat.day >= start_day
     ).group_by(
-        User.id
-    ).order_by(
-        db.desc('conversation_count')
-    ).limit(10).all()
+        DailyConversationStat.course_section,
+        DailyConversationStat.is_guest
+    ).all()
+    
+    registered_count = sum(count for _, is_guest, count in by_section if not is_guest)
+    guest_count = sum(count for _, is_guest, count in by_section if is_guest)
+    total_conversations = registered_count + guest_count
     
-    # Most common questions (simplified - just counts)
-    total_conversations = Conversation.query.filter(
-        Conversation.timestamp >= start_date
-    ).count()
+    section_totals = {}
+    for section, _, count in by_section:
+        section_totals[section or 'Unknown'] = section_totals.get(section or 'Unknown', 0) + count
+    sections = sorted(section_totals.items(), key=lambda item: -item[1])
     
-    registered_count = Conversation.query.filter(
-        Conversation.timestamp >= start_date,
-        Conversation.is_guest == False
-    ).count()
+    # Top users by conversation count in the range
+    top_counts = db.session.query(
+        DailyUserStat.user_id,
+        db.func.sum(DailyUserStat.count).label('conversation_count')
+    ).filter(
+        DailyUserStat.day >= start_day
+    ).group_by(
+        DailyUserStat.user_id
+    ).order_by(
+        db.desc('conversation_count')
+    ).limit(10).subquery()
     
-    guest_count = Conversation.query.filter(
-        Conversation.timestamp >= start_date,
-        Conversation.is_guest == True
-    ).count()
+    top_users = db.session.query(
+        User, top_counts.c.conversation_count
+    ).join(
+        top_counts, top_counts.c.user_id == User.id
+    ).order_by(
+        top_counts.c.conversation_count.desc()
+    ).all()
     
     return render_template('admin/analytics.html',
                          conversations_by_date=conversations_by_date,
                          top_users=top_users,
+                         sections=sections,
                          total_conversations=total_conversations,
                          registered_count=registered_count,
                          guest_count=guest_count,
@@ -221,99 +262,92 @@ def analytics():
 
 @admin_bp.route('/export/users')
 @admin_required
+@use_replica
 def export_users():
-    """Export users to CSV."""
-    users = User.query.all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow(['ID', 'Email', 'First Name', 'Last Name', 'Student ID', 
-                    'Course Section', 'Semester', 'Created At', 'Conversation Count'])
-    
-    # Data
-    for user in users:
-        writer.writerow([
-            user.id,
-            user.email,
-            user.first_name,
-            user.last_name,
-            user.student_id,
-            user.course_section or '',
-            user.semester or '',
-            user.created_at.strftime('%Y-%m-%d %H:%M:%S') if user.created_at else '',
-            user.conversations.count()
-        ])
-    
-    output.seek(0)
-    return output.getvalue(), 200, {
-        'Content-Type': 'text/csv',
-        'Content-Disposition': f'attachment; filename=users_{datetime.now().strftime("%Y%m%d")}.csv'
-    }
+    """Export users to CSV (or NDJSON with ?format=ndjson; add ?gzip=1 to compress)."""
+    fmt, compress = export_options(request)
+    rows = user_export_rows()
+    chunks = csv_chunks(USER_HEADER, rows) if fmt == 'csv' else ndjson_chunks(rows)
+    return export_response(chunks, fmt, dated_filename('users'), compress)
 
 
 @admin_bp.route('/export/conversations')
 @admin_required
+@use_replica
 def export_conversations():
-    """Export conversations to CSV."""
-    conversations = Conversation.query.all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow(['ID', 'User Email', 'Student ID', 'Question', 'Answer', 
-                    'Timestamp', 'Is Guest', 'Session ID'])
-    
-    # Data
-    for conv in conversations:
-        if conv.is_guest:
-            user_email = conv.guest_email or 'Guest'
-            student_id = conv.guest_student_id or 'N/A'
-        else:
-            user_email = conv.user.email if conv.user else 'N/A'
-            student_id = conv.user.student_id if conv.user else 'N/A'
-        
-        writer.writerow([
-            conv.id,
-            user_email,
-            student_id,
-            conv.question,
-            conv.answer,
-            conv.timestamp.strftime('%Y-%m-%d %H:%M:%S') if conv.timestamp else '',
-            'Yes' if conv.is_guest else 'No',
-            conv.session_id
-        ])
-    
-    output.seek(0)
-    return output.getvalue(), 200, {
-        'Content-Type': 'text/csv',
-        'Content-Disposition': f'attachment; filename=conversations_{datetime.now().strftime("%Y%m%d")}.csv'
-    }
+    """
+    Export conversations to CSV (or NDJSON with ?format=ndjson; add ?gzip=1 to compress).
+    Add ?archive=1 to include archived conversations.
+    """
+    fmt, compress = export_options(request)
+    rows = conversation_export_rows(include_archive=request.args.get('archive') == '1')
+    chunks = csv_chunks(CONVERSATION_HEADER, rows) if fmt == 'csv' else ndjson_chunks(rows)
+    return export_response(chunks, fmt, dated_filename('conversations'), compress)
 
 
 @admin_bp.route('/backup')
 @admin_required
 def create_backup():
-    """Create database backup."""
-    try:
-        backup_database_to_json()
-        flash('Backup created successfully!', 'success')
-    except Exception as e:
-        flash(f'Backup failed: {str(e)}', 'error')
+    """Start a database backup in the background (?type=incremental for changes since the last one)."""
+    incremental = request.args.get('type') == 'incremental'
+    if get_backup_manager().start(incremental=incremental):
+        flash(f'{"Incremental" if incremental else "Full"} backup started. Progress is shown below.', 'success')
+    else:
+        flash('A backup is already running.', 'error')
     
     return redirect(url_for('admin.dashboard'))
 
 
+@admin_bp.route('/api/backup_status')
+@admin_required
+def api_backup_status():
+    """API endpoint for backup progress and completed backups."""
+    backups = [
+        {
+            'name': manifest['name'],
+            'type': manifest['type'],
+            'created_at': manifest['created_at'],
+            'rows': sum(entry['rows'] for entry in manifest['tables'].values()),
+            'bytes': sum(entry['bytes'] for entry in manifest['tables'].values())
+        }
+        for manifest in list_backups()[-10:]
+    ]
+    return jsonify({'status': get_backup_manager().status(), 'backups': backups[::-1]})
+
+
+@admin_bp.route('/api/users/search')
+@admin_required
+@use_replica
+def api_user_search():
+    """API endpoint for user typeahead: top matches for ?q= by email, name or student ID."""
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    return jsonify({'users': search_users(request.args.get('q', ''), limit=limit)})
+
+
 @admin_bp.route('/api/stats')
 @admin_required
+@use_replica
 def api_stats():
     """API endpoint for dashboard stats."""
     stats = get_database_stats()
     return jsonify(stats)
 
 
+@admin_bp.route('/api/llm_stats')
+@admin_required
+def api_llm_stats():
+    """API endpoint for upstream LLM provider, hedging and routing statistics."""
+    # Import chatbot (lazy load to avoid circular imports)
+    from web_app_sql import chatbot
+    
+    return jsonify({
+        'provider': chatbot.provider.info(),
+        'hedging': chatbot.llm.stats(),
+        'routing': chatbot.router.stats(),
+        'model_routing': chatbot.model_router.stats()
+    })
+
+
 @admin_bp.route('/users/<int:user_id>/edit', methods=['GET', 'POST'])
 @admin_required
 def edit_user(user_id):
@@ -355,7 +389,8 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     
     try:
-        # Conversations will be deleted automatically due to cascade
+        # Conversations will be deleted automatically due to cascade; archived ones are not in it
+        delete_archived_for_user(user_id)
         db.session.delete(user)
         db.session.commit()
         flash(f'User {user.email} deleted successfully!', 'success')
@@ -433,23 +468,31 @@ def merge_users():
         target_user = User.query.get_or_404(target_id)
         
         try:
-            # Move all conversations from source to target
-            conversations = Conversation.query.filter_by(user_id=source_id).all()
-            for conv in conversations:
-                conv.user_id = target_id
+            days = user_days(source_id)
+            
+            # Move all conversations from source to target in one statement. Re-pointing
+            # loaded objects left them in the source's delete-orphan cascade.
+            transferred = Conversation.query.filter_by(user_id=source_id).update(
+                {'user_id': target_id}, synchronize_session=False
+            )
+            transferred += ArchivedConversation.query.filter_by(user_id=source_id).update(
+                {'user_id': target_id}, synchronize_session=False
+            )
+            # The bulk update skips the ORM listeners; recount what it moved
+            refresh_days(days)
+            recount_users([target_id])
             
             # Delete source user
             db.session.delete(source_user)
             db.session.commit()
             
             flash(f'Successfully merged {source_user.email} into {target_user.email}. '
-                  f'{len(conversations)} conversations transferred.', 'success')
+                  f'{transferred} conversations transferred.', 'success')
             return redirect(url_for('admin.user_detail', user_id=target_id))
             
         except Exception as e:
             db.session.rollback()
             flash(f'Error merging users: {str(e)}', 'error')
     
-    # Get all users for the merge form
-    users = User.query.order_by(User.email).all()
-    return render_template('admin/merge_users.html', users=users)
+    # Users are looked up on demand through /admin/api/users/search
+    return render_template('admin/merge_users.html')
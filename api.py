@@ -6,8 +6,13 @@ Version 1.0 - /api/v1/
 
 from flask import Blueprint, request, jsonify, session
 from functools import wraps
+from sqlalchemy.orm import joinedload
 from datetime import datetime
-from models import db, User, Conversation, AdminUser
+from models import db, User, Conversation, AdminUser, ContextAdjustment
+from persistence import get_conversation_writer, conversation_row, adjustment_row
+from pagination import keyset_paginate
+from search import user_search_filter
+from db_routing import use_replica
 
 # Create API Blueprint with version prefix
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
@@ -77,6 +82,19 @@ def admin_api_auth(f):
     return decorated_function
 
 
+def _keyset_page(query, sort_column, id_column, per_page, count_key):
+    """
+    Keyset page from the request's ?cursor=, ?include_total= and legacy ?page=.
+    Raises ValueError for a bad cursor.
+    """
+    include_total = request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
+    return keyset_paginate(query, sort_column, id_column,
+                           cursor=request.args.get('cursor'),
+                           per_page=max(per_page, 1),
+                           page=request.args.get('page', type=int),
+                           count_key=count_key if include_total else None)
+
+
 # ============================================================================
 # API INFO & DOCUMENTATION
 # ============================================================================
@@ -102,8 +120,10 @@ def api_info():
                 'description': 'Get all conversations for authenticated user',
                 'auth_required': True,
                 'parameters': {
-                    'page': 'Page number (optional, default: 1)',
-                    'per_page': 'Items per page (optional, default: 20, max: 100)'
+                    'cursor': 'Opaque cursor from pagination.next_cursor / prev_cursor (optional)',
+                    'per_page': 'Items per page (optional, default: 20, max: 100)',
+                    'include_total': 'Add an approximate total_items (optional, default: false)',
+                    'page': 'Deprecated page number, used only when no cursor is given'
                 }
             },
             'conversation_detail': {
@@ -117,7 +137,13 @@ def api_info():
                 'method': 'GET',
                 'description': 'Get all users (admin only)',
                 'auth_required': True,
-                'admin_only': True
+                'admin_only': True,
+                'parameters': {
+                    'cursor': 'Opaque cursor from pagination.next_cursor / prev_cursor (optional)',
+                    'per_page': 'Items per page (optional, default: 20, max: 100)',
+                    'search': 'Search term for email, name, or student ID (optional)',
+                    'include_total': 'Add an approximate total_items (optional, default: false)'
+                }
             },
             'user_detail': {
                 'path': '/api/v1/users/<id>',
@@ -160,46 +186,30 @@ def api_info():
 def get_conversations():
     """
     Get all conversations for the authenticated user.
-    Supports pagination.
+    Supports cursor pagination.
     """
     try:
-        # Get pagination parameters
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
-        
-        # Limit per_page to prevent abuse
-        if per_page > 100:
-            per_page = 100
-        
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
         user_id = session.get('user_id')
         
-        # Query conversations for this user with pagination
-        pagination = Conversation.query.filter_by(
-            user_id=user_id
-        ).order_by(
-            Conversation.timestamp.desc()
-        ).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
-        
-        conversations = pagination.items
+        query = Conversation.query.options(joinedload(Conversation.user)).filter_by(user_id=user_id)
+        pagination = _keyset_page(query, Conversation.timestamp, Conversation.id, per_page,
+                                  count_key=('api_conversations', user_id))
         
         return jsonify({
             'success': True,
-            'data': [conv.to_dict() for conv in conversations],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total_items': pagination.total,
-                'total_pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            },
+            'data': [conv.to_dict() for conv in pagination.items],
+            'pagination': pagination.to_dict(),
             'timestamp': datetime.utcnow().isoformat()
         }), 200
     
+    except ValueError as e:
+        return jsonify({
+            'error': 'Bad request',
+            'message': str(e),
+            'status': 400
+        }), 400
+    
     except Exception as e:
         return jsonify({
             'error': 'Internal server error',
@@ -251,57 +261,42 @@ def get_conversation(conversation_id):
 
 @api_bp.route('/users', methods=['GET'])
 @admin_api_auth
+@use_replica
 def get_users():
     """
     Get all users (admin only).
-    Supports pagination and search.
+    Supports cursor pagination and search.
     """
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
         search = request.args.get('search', '', type=str)
         
-        if per_page > 100:
-            per_page = 100
-        
         # Build query
         query = User.query
         
         # Apply search filter if provided
         if search:
-            query = query.filter(
-                db.or_(
-                    User.email.ilike(f'%{search}%'),
-                    User.first_name.ilike(f'%{search}%'),
-                    User.last_name.ilike(f'%{search}%'),
-                    User.student_id.ilike(f'%{search}%')
-                )
-            )
+            query = query.filter(user_search_filter(search))
         
         # Paginate
-        pagination = query.order_by(User.created_at.desc()).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
-        
-        users = pagination.items
+        pagination = _keyset_page(query, User.created_at, User.id, per_page,
+                                  count_key=('api_users', search))
         
         return jsonify({
             'success': True,
-            'data': [user.to_dict() for user in users],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total_items': pagination.total,
-                'total_pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            },
+            'data': [user.to_dict() for user in pagination.items],
+            'pagination': pagination.to_dict(),
             'search': search if search else None,
             'timestamp': datetime.utcnow().isoformat()
         }), 200
     
+    except ValueError as e:
+        return jsonify({
+            'error': 'Bad request',
+            'message': str(e),
+            'status': 400
+        }), 400
+    
     except Exception as e:
         return jsonify({
             'error': 'Internal server error',
@@ -312,6 +307,7 @@ def get_users():
 
 @api_bp.route('/users/<int:user_id>', methods=['GET'])
 @admin_api_auth
+@use_replica
 def get_user(user_id):
     """
     Get a specific user by ID (admin only).
@@ -382,30 +378,41 @@ def ask_question():
         from web_app_sql import chatbot
         
         # Get AI response
-        answer = chatbot.get_ai_response(question)
+        result = chatbot.get_answer(question, history_length=session.get('question_count', 0))
+        answer = result['answer']
+        session['question_count'] = session.get('question_count', 0) + 1
         
         # Save conversation
         user_id = session.get('user_id')
         session_id = session.get('session_id')
         
-        conversation = Conversation(
-            user_id=user_id,
-            session_id=session_id,
-            question=question,
-            answer=answer,
-            is_guest=False
-        )
-        
-        db.session.add(conversation)
-        db.session.commit()
+        adjustment = adjustment_row(session_id, result['context'])
+        row = conversation_row(question, answer, session_id, user_id=user_id, adjustment=adjustment)
+        
+        # With write-behind the insert happens off the request path, so the id isn't known yet
+        writer = get_conversation_writer()
+        if writer:
+            writer.enqueue(Conversation.__tablename__, row)
+            if adjustment:
+                writer.enqueue(ContextAdjustment.__tablename__, adjustment)
+            conversation_id = None
+        else:
+            conversation = Conversation(**row)
+            db.session.add(conversation)
+            if adjustment:
+                db.session.add(ContextAdjustment(**adjustment))
+            db.session.commit()
+            conversation_id = conversation.id
         
         return jsonify({
             'success': True,
             'data': {
-                'conversation_id': conversation.id,
+                'conversation_id': conversation_id,
                 'question': question,
                 'answer': answer,
-                'timestamp': conversation.timestamp.isoformat()
+                'fallback': result['fallback'],
+                'sources': result['sources'],
+                'timestamp': row['timestamp'].isoformat()
             },
             'timestamp': datetime.utcnow().isoformat()
         }), 201
@@ -440,21 +447,6 @@ def get_user_stats():
                 'status': 404
             }), 404
         
-        # Get conversation statistics
-        total_conversations = user.conversations.count()
-        
-        # Get recent conversations (last 7 days)
-        from datetime import timedelta
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        recent_conversations = user.conversations.filter(
-            Conversation.timestamp >= seven_days_ago
-        ).count()
-        
-        # Get latest conversation
-        latest_conversation = user.conversations.order_by(
-            Conversation.timestamp.desc()
-        ).first()
-        
         return jsonify({
             'success': True,
             'data': {
@@ -466,10 +458,11 @@ def get_user_stats():
                     'student_id': user.student_id
                 },
                 'statistics': {
-                    'total_conversations': total_conversations,
-                    'conversations_last_7_days': recent_conversations,
+                    # Counters stored on the user row; no conversation queries needed
+                    'total_conversations': user.conversation_count or 0,
+                    'conversations_last_7_days': user.recent_conversation_count(7),
                     'member_since': user.created_at.isoformat() if user.created_at else None,
-                    'last_activity': latest_conversation.timestamp.isoformat() if latest_conversation else None
+                    'last_activity': user.last_activity_at.isoformat() if user.last_activity_at else None
                 }
             },
             'timestamp': datetime.utcnow().isoformat()
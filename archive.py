@@ -0,0 +1,172 @@
+"""
+Conversation Archival for Student Q&A Chatbot
+Moves conversations from closed semesters out of the hot conversations table into conversations_archive
+
+Usage:
+    python archive.py --closed [--dry-run]
+    python archive.py --semester "Spring 2025" [--dry-run]
+    python archive.py --before 2025-08-15 [--batch-size 5000] [--dry-run]
+
+Conversations are picked by timestamp, not by the free-text semester a
+student typed in: --semester archives everything up to the end of that
+semester, --closed everything before the current semester started.
+Archived conversations keep their ids and stay in the analytics rollups,
+the user counters, admin search (?archive=1) and exports (?archive=1).
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime
+
+from flask import Flask
+from dotenv import load_dotenv
+
+from models import db, Conversation, ArchivedConversation, CONVERSATION_COLUMNS
+from rollups import refresh_days
+from backup import record_deletes
+
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 5000))
+
+
+def _semester_starts():
+    """Term name -> (month, day) it starts, in calendar order, from SEMESTER_STARTS."""
+    starts = {}
+    for part in os.getenv('SEMESTER_STARTS', 'Spring:01-01,Summer:05-01,Fall:08-15').split(','):
+        name, _, month_day = part.strip().partition(':')
+        month, day = month_day.split('-')
+        starts[name.strip().title()] = (int(month), int(day))
+    return dict(sorted(starts.items(), key=lambda item: item[1]))
+
+
+def semester_range(name):
+    """[start, end) datetimes of a semester such as 'Fall 2025'; each one ends when the next begins."""
+    starts = _semester_starts()
+    try:
+        term, year = name.split()
+        term, year = term.title(), int(year)
+        month, day = starts[term]
+    except (ValueError, KeyError):
+        raise ValueError(f"Unknown semester {name!r}; expected one of {', '.join(starts)} followed by a year")
+
+    terms = list(starts)
+    position = terms.index(term)
+    if position + 1 < len(terms):
+        end = date(year, *starts[terms[position + 1]])
+    else:
+        end = date(year + 1, *starts[terms[0]])
+    return (datetime.combine(date(year, month, day), datetime.min.time()),
+            datetime.combine(end, datetime.min.time()))
+
+
+def current_semester_start(now=None):
+    """When the semester in progress at `now` (default: today) began."""
+    now = now or datetime.utcnow()
+    started = [datetime(year, month, day) for year in (now.year - 1, now.year)
+               for month, day in _semester_starts().values()]
+    return max(start for start in started if start <= now)
+
+
+def archive_conversations(before, batch_size=None, dry_run=False):
+    """
+    Move conversations with timestamp < `before` into the archive table.
+
+    Works through them `batch_size` at a time, oldest first, committing each
+    batch so locks stay short and an interrupted run resumes where it
+    stopped. The full-text index drops the rows with them. Rollups and user
+    counters count archived conversations, so they need no change. Returns
+    the number of conversations moved (or that would be, with dry_run).
+    """
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    live = Conversation.__table__
+    archive = ArchivedConversation.__table__
+    due = live.c.timestamp < before
+
+    if dry_run:
+        return db.session.execute(db.select(db.func.count()).select_from(live).where(due)).scalar()
+
+    moved = 0
+    while True:
+        ids = db.session.execute(
+            db.select(live.c.id).where(due).order_by(live.c.timestamp).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        archived_at = db.literal(datetime.utcnow(), db.DateTime)
+        db.session.execute(archive.insert().from_select(
+            [*CONVERSATION_COLUMNS, 'archived_at', 'updated_at'],
+            db.select(*[live.c[name] for name in CONVERSATION_COLUMNS], archived_at, archived_at)
+            .where(live.c.id.in_(ids))
+        ))
+        db.session.execute(live.delete().where(live.c.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+        print(f"  {moved:,} conversations archived")
+
+    if moved:
+        from database import invalidate_database_stats
+        invalidate_database_stats()
+    return moved
+
+
+def delete_archived_for_user(user_id):
+    """
+    Delete a user's archived conversations and recount the days they were on.
+    Call in the transaction that deletes the user; the ORM cascade only covers live conversations.
+    """
+    archive = ArchivedConversation.__table__
+    day = db.func.date(archive.c.timestamp)
+    days = [value for value, in db.session.execute(
+        db.select(day).where(archive.c.user_id == user_id, archive.c.timestamp.isnot(None)).distinct()
+    )]
+    ids = db.session.execute(db.select(archive.c.id).where(archive.c.user_id == user_id)).scalars().all()
+    record_deletes(ArchivedConversation, ids)
+    deleted = db.session.execute(archive.delete().where(archive.c.user_id == user_id)).rowcount
+    refresh_days(date.fromisoformat(str(value)[:10]) for value in days)
+    return deleted
+
+
+def main():
+    """Command-line entry point."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Move old conversations into the archive table")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--closed', action='store_true',
+                       help="Archive every semester that ended before the current one started")
+    group.add_argument('--semester', help='Archive up to the end of this semester, e.g. "Spring 2025"')
+    group.add_argument('--before', help="Archive conversations older than this day (YYYY-MM-DD)")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help=f"Conversations moved per transaction (default {ARCHIVE_BATCH_SIZE})")
+    parser.add_argument('--dry-run', action='store_true', help="Only report how many conversations would move")
+    args = parser.parse_args()
+
+    try:
+        if args.closed:
+            before = current_semester_start()
+        elif args.semester:
+            before = semester_range(args.semester)[1]
+            if before > datetime.utcnow():
+                print(f"✗ {args.semester} has not ended yet")
+                sys.exit(1)
+        else:
+            before = datetime.combine(date.fromisoformat(args.before), datetime.min.time())
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+    from database import init_db
+    app = Flask(__name__)
+    init_db(app)
+
+    with app.app_context():
+        start = time.monotonic()
+        print(f"Archiving conversations before {before:%Y-%m-%d}...")
+        moved = archive_conversations(before, batch_size=args.batch_size, dry_run=args.dry_run)
+        action = "would be archived" if args.dry_run else "archived"
+        print(f"✓ {moved:,} conversations {action} ({time.monotonic() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
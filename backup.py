@@ -0,0 +1,352 @@
+"""
+Database Backups for Student Q&A Chatbot
+Streams tables into gzip-compressed NDJSON with a checksummed manifest, fully or incrementally
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, User, Conversation, ArchivedConversation, ContextAdjustment, AdminUser, DeletedRow
+from db_routing import replica_reads
+
+# (table name, model, watermark column). Incremental backups copy rows whose
+# watermark is past the previous backup's; None means the table is always copied whole.
+# Watermarks are write times, not ids: on PostgreSQL a lower id can commit after a higher one.
+BACKUP_TABLES = [
+    ('users', User, 'updated_at'),
+    ('conversations', Conversation, 'updated_at'),
+    ('conversations_archive', ArchivedConversation, 'updated_at'),
+    ('context_adjustments', ContextAdjustment, 'created_at'),
+    ('admin_users', AdminUser, None),
+]
+
+# Incrementals reach this far back past the previous watermark, for rows stamped before it that
+# committed after that backup read (long transactions, write-behind batches). Restore dedupes by id.
+BACKUP_OVERLAP = timedelta(seconds=float(os.getenv('BACKUP_OVERLAP_SECONDS', 600)))
+
+# Deletes from the watermarked tables, recorded in deleted_rows and replayed by restore
+TOMBSTONE_TABLE = DeletedRow.__tablename__
+_TOMBSTONED = {model: table for table, model, column in BACKUP_TABLES if column}
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _watermark_to_json(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _watermark_from_json(value):
+    # Backups from before watermarks were times stored ids; the next incremental copies those tables whole
+    if not isinstance(value, str):
+        return None
+    return datetime.fromisoformat(value)
+
+
+def record_deletes(model, ids, connection=None):
+    """Record rows about to be deleted by a bulk statement, which the flush listener cannot see."""
+    if not ids or model not in _TOMBSTONED:
+        return
+    connection = connection or db.session.connection()
+    deleted_at = datetime.utcnow()
+    connection.execute(DeletedRow.__table__.insert(),
+                       [{'table_name': _TOMBSTONED[model], 'row_id': row_id, 'deleted_at': deleted_at}
+                        for row_id in ids])
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_deletes_after_flush(session, flush_context):
+    """Record ORM deletes (admin deletes, user deletes and their cascades, merges) in the same transaction."""
+    deleted = {}
+    for obj in session.deleted:
+        if type(obj) in _TOMBSTONED:
+            deleted.setdefault(type(obj), []).append(obj.id)
+    for model, ids in deleted.items():
+        record_deletes(model, ids, session.connection())
+
+
+class _HashingWriter:
+    """Binary file wrapper that tracks a sha256 and byte count of what is written."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+def list_backups(backup_dir=None):
+    """Return manifests of completed backups, oldest first."""
+    backup_dir = Path(backup_dir or os.getenv('BACKUP_DIR', 'backups'))
+    manifests = []
+    for manifest_path in sorted(backup_dir.glob(f'*/{MANIFEST_NAME}')):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        manifest['path'] = str(manifest_path.parent)
+        manifests.append(manifest)
+    return manifests
+
+
+def verify_backup(path):
+    """Check every file in a backup against its manifest checksum. Returns a list of problems."""
+    path = Path(path)
+    with open(path / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    problems = []
+    for table, entry in manifest['tables'].items():
+        sha256 = hashlib.sha256()
+        try:
+            with open(path / entry['file'], 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha256.update(block)
+        except FileNotFoundError:
+            problems.append(f"{table}: {entry['file']} missing")
+            continue
+        if sha256.hexdigest() != entry['sha256']:
+            problems.append(f"{table}: checksum mismatch")
+    return problems
+
+
+class BackupManager:
+    """
+    Runs one backup at a time, in the calling thread or in the background.
+
+    Each table is read in `batch_size` chunks from a server-side cursor and
+    written as gzip NDJSON, one row per line, so memory stays flat no matter
+    how large the tables get. All tables are read in one snapshot, so the
+    files agree with each other however busy the site is. A backup
+    directory is only considered complete once its manifest (row counts,
+    watermarks, sha256 of every file) has been written. Incremental backups
+    copy rows written since the previous manifest's watermarks, less
+    BACKUP_OVERLAP, and the deletes recorded since; restoring replays the
+    last full backup and the incrementals after it. Progress is kept in memory and mirrored to a
+    status file so any worker can show it.
+    """
+
+    def __init__(self, app=None, backup_dir=None, batch_size=None):
+        self.app = app
+        self.backup_dir = Path(backup_dir or os.getenv('BACKUP_DIR', 'backups'))
+        self.batch_size = batch_size or int(os.getenv('BACKUP_BATCH_SIZE', 1000))
+        self.status_path = self.backup_dir / 'status.json'
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {'state': 'idle'}
+
+    def start(self, incremental=False):
+        """Start a backup in a background thread. Returns False if one is already running."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            app = self.app or current_app._get_current_object()
+            # Report as running straight away, before the thread has planned its work
+            self._status = {'state': 'running', 'type': 'incremental' if incremental else 'full',
+                            'backup': 'starting', 'rows_done': 0, 'rows_total': 0, 'table': None}
+            self._thread = threading.Thread(target=self._run_in_context, args=(app, incremental),
+                                            name='database-backup', daemon=True)
+            self._thread.start()
+            return True
+
+    def run(self, incremental=False):
+        """Run a backup in the current app context and return its manifest."""
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        previous = list_backups(self.backup_dir)
+        if incremental and not previous:
+            print("No previous backup found; taking a full backup instead")
+            incremental = False
+
+        started = datetime.utcnow()
+        name = started.strftime('%Y%m%d_%H%M%S') + ('_incremental' if incremental else '_full')
+        target = self.backup_dir / name
+        target.mkdir(parents=True, exist_ok=True)
+        since = previous[-1]['watermarks'] if incremental else {}
+
+        manifest = {
+            'name': name,
+            'type': 'incremental' if incremental else 'full',
+            'created_at': started.isoformat(),
+            'base': previous[-1]['name'] if incremental else None,
+            'since': since,
+            'watermarks': {},
+            'tables': {},
+        }
+
+        with self._snapshot() as conn:
+            plan = []
+            for table, model, column in BACKUP_TABLES:
+                statement = db.select(model.__table__)
+                lower = _watermark_from_json(since.get(table)) if column else None
+                if lower is not None:
+                    # Rows with no watermark predate the column and are in the full backup
+                    statement = statement.where(getattr(model, column) > lower - BACKUP_OVERLAP)
+                total = conn.scalar(db.select(db.func.count()).select_from(statement.subquery()))
+                plan.append((table, model, column, statement.order_by(*model.__table__.primary_key.columns), total))
+
+            self._update_status(state='running', backup=name, type=manifest['type'],
+                                started_at=started.isoformat(), finished_at=None, error=None,
+                                rows_total=sum(step[-1] for step in plan), rows_done=0, table=None)
+
+            for table, model, column, statement, total in plan:
+                self._update_status(table=table)
+                entry = self._dump_table(conn, target / f'{table}.ndjson.gz', statement)
+                entry['expected_rows'] = total
+                manifest['tables'][table] = entry
+                if column:
+                    # Taken from the snapshot, so a lagging replica cannot move it past rows it has not received
+                    latest = conn.scalar(db.select(db.func.max(getattr(model, column))))
+                    manifest['watermarks'][table] = _watermark_to_json(latest) if latest else since.get(table)
+                else:
+                    manifest['watermarks'][table] = None
+
+            # Deletes since the previous backup; a full backup only starts the count
+            tombstones = DeletedRow.__table__
+            lower = _watermark_from_json(since.get(TOMBSTONE_TABLE))
+            if incremental:
+                statement = db.select(tombstones.c.table_name, tombstones.c.row_id, tombstones.c.deleted_at)
+                if lower is not None:
+                    statement = statement.where(tombstones.c.deleted_at > lower - BACKUP_OVERLAP)
+                manifest['tables'][TOMBSTONE_TABLE] = self._dump_table(
+                    conn, target / f'{TOMBSTONE_TABLE}.ndjson.gz', statement.order_by(tombstones.c.id)
+                )
+            latest = conn.scalar(db.select(db.func.max(tombstones.c.deleted_at)))
+            manifest['watermarks'][TOMBSTONE_TABLE] = (_watermark_to_json(latest) if latest
+                                                       else since.get(TOMBSTONE_TABLE))
+
+        manifest['finished_at'] = datetime.utcnow().isoformat()
+        temp_path = target / (MANIFEST_NAME + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, target / MANIFEST_NAME)
+
+        if not incremental and manifest['watermarks'][TOMBSTONE_TABLE]:
+            # Incrementals after this backup never reach further back than this
+            cutoff = _watermark_from_json(manifest['watermarks'][TOMBSTONE_TABLE]) - BACKUP_OVERLAP
+            db.session.execute(DeletedRow.__table__.delete().where(DeletedRow.deleted_at < cutoff))
+            db.session.commit()
+
+        rows = sum(entry['rows'] for entry in manifest['tables'].values())
+        self._update_status(state='finished', finished_at=manifest['finished_at'], table=None)
+        print(f"Backup created: {target} ({manifest['type']}, {rows} rows)")
+        return manifest
+
+    def status(self):
+        """Progress of the current or last backup, from this process or the status file."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return dict(self._status)
+        try:
+            with open(self.status_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict(self._status)
+
+    def _run_in_context(self, app, incremental):
+        with app.app_context():
+            try:
+                # Keep the table scans off the primary when a replica is configured
+                with replica_reads():
+                    self.run(incremental=incremental)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Backup failed: {e}")
+                self._update_status(state='failed', error=str(e), finished_at=datetime.utcnow().isoformat())
+            finally:
+                db.session.remove()
+
+    @contextmanager
+    def _snapshot(self):
+        """
+        A connection whose reads all see one committed state: REPEATABLE READ on
+        PostgreSQL, a single read transaction on SQLite. Nothing is written through it.
+        """
+        engine = db.session().read_bind()
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                conn = conn.execution_options(isolation_level='REPEATABLE READ')
+                conn.exec_driver_sql('SET TRANSACTION READ ONLY')
+            elif engine.dialect.name == 'sqlite':
+                # The driver only begins transactions for writes; without this each SELECT sees the latest data
+                conn.exec_driver_sql('BEGIN')
+            try:
+                yield conn
+            finally:
+                conn.rollback()
+
+    def _dump_table(self, conn, path, statement):
+        """Stream one table's rows into gzip NDJSON; returns its manifest entry."""
+        rows = 0
+        with open(path, 'wb') as raw:
+            hashing = _HashingWriter(raw)
+            with gzip.GzipFile(fileobj=hashing, mode='wb', mtime=0) as out:
+                result = conn.execute(statement.execution_options(yield_per=self.batch_size))
+                for partition in result.partitions():
+                    lines = [json.dumps(dict(row._mapping), default=_json_default, ensure_ascii=False)
+                             for row in partition]
+                    out.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                    rows += len(lines)
+                    self._advance(len(lines))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        return {'file': path.name, 'rows': rows, 'bytes': hashing.bytes, 'sha256': hashing.sha256.hexdigest()}
+
+    def _advance(self, count):
+        with self._lock:
+            self._status['rows_done'] = self._status.get('rows_done', 0) + count
+            self._status['updated_at'] = time.time()
+        self._write_status()
+
+    def _update_status(self, **changes):
+        with self._lock:
+            self._status.update(changes)
+            self._status['updated_at'] = time.time()
+        self._write_status()
+
+    def _write_status(self):
+        with self._lock:
+            status = dict(self._status)
+        try:
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            temp_path = self.status_path.with_name(f'status.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(status, f)
+            os.replace(temp_path, self.status_path)
+        except OSError as e:
+            print(f"Could not write backup status: {e}")
+
+
+_manager = None
+
+
+def get_backup_manager():
+    """Return the process-wide backup manager."""
+    global _manager
+    if _manager is None:
+        _manager = BackupManager()
+    return _manager
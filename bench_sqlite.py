@@ -0,0 +1,140 @@
+"""
+SQLite Throughput Benchmark for Student Q&A Chatbot
+Compares the default SQLite settings with the tuned profile under concurrent worker processes
+
+Usage:
+    python bench_sqlite.py [--workers 4] [--seconds 10] [--write-ratio 0.2]
+
+Each worker process stands in for a gunicorn worker: it saves conversations
+and reads conversation pages against one shared SQLite file, the way the
+app does. The run is repeated with SQLITE_TUNING off and on, on fresh files
+in a temporary directory.
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+USERS = 100
+CONVERSATIONS_PER_USER = 20
+
+
+def _app(database_url, tuned):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['SQLITE_TUNING'] = 'true' if tuned else 'false'
+    from flask import Flask
+    from database import init_db
+    app = Flask(__name__)
+    with contextlib.redirect_stdout(io.StringIO()):  # one "Database initialized" per worker is noise
+        init_db(app)
+    return app
+
+
+def seed(database_url, tuned):
+    """Create the schema and the users and conversations the workers read."""
+    app = _app(database_url, tuned)
+    from models import db, User, Conversation
+    with app.app_context():
+        now = datetime.utcnow()
+        db.session.execute(db.insert(User), [
+            {'email': f'student{i}@uvu.edu', 'password_hash': '-', 'first_name': 'Student', 'last_name': str(i),
+             'student_id': str(10000000 + i)}
+            for i in range(USERS)
+        ])
+        user_ids = [user_id for user_id, in db.session.execute(db.select(User.id))]
+        db.session.add_all([
+            Conversation(user_id=user_id, session_id=f's{user_id}', question='question', answer='answer',
+                         timestamp=now - timedelta(minutes=j))
+            for user_id in user_ids for j in range(CONVERSATIONS_PER_USER)
+        ])
+        db.session.commit()
+    return user_ids
+
+
+def worker(database_url, tuned, user_ids, seconds, write_ratio, results):
+    """Mix of conversation saves and history page reads for `seconds`; reports counts and lock errors."""
+    app = _app(database_url, tuned)
+    from sqlalchemy.exc import OperationalError
+    from models import db, Conversation
+    from pagination import keyset_paginate
+
+    counts = {'writes': 0, 'reads': 0, 'locked': 0, 'write_seconds': 0.0, 'read_seconds': 0.0}
+    deadline = time.monotonic() + seconds
+    with app.app_context():
+        while time.monotonic() < deadline:
+            user_id = random.choice(user_ids)
+            write = random.random() < write_ratio
+            start = time.monotonic()
+            try:
+                if write:
+                    db.session.add(Conversation(user_id=user_id, session_id=f's{user_id}',
+                                                question='benchmark question', answer='benchmark answer'))
+                    db.session.commit()
+                else:
+                    keyset_paginate(Conversation.query.filter_by(user_id=user_id),
+                                    Conversation.timestamp, Conversation.id, per_page=20)
+                    db.session.commit()
+            except OperationalError as e:
+                db.session.rollback()
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                counts['locked'] += 1
+                continue
+            kind = 'write' if write else 'read'
+            counts[kind + 's'] += 1
+            counts[kind + '_seconds'] += time.monotonic() - start
+    results.put(counts)
+
+
+def run(label, tuned, args):
+    directory = tempfile.mkdtemp(prefix='bench_sqlite_')
+    try:
+        database_url = 'sqlite:///' + os.path.join(directory, 'bench.db')
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1) as pool:
+            user_ids = pool.apply(seed, (database_url, tuned))
+
+        results = context.Queue()
+        processes = [context.Process(target=worker,
+                                     args=(database_url, tuned, user_ids, args.seconds, args.write_ratio, results))
+                     for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        totals = {'writes': 0, 'reads': 0, 'locked': 0, 'write_seconds': 0.0, 'read_seconds': 0.0}
+        for _ in processes:
+            for key, value in results.get().items():
+                totals[key] += value
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{label:10} {totals['writes'] / args.seconds:10,.0f} {totals['reads'] / args.seconds:10,.0f} "
+          f"{1000 * totals['write_seconds'] / max(totals['writes'], 1):12.1f} "
+          f"{1000 * totals['read_seconds'] / max(totals['reads'], 1):11.1f} {totals['locked']:8,}")
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark SQLite with default and tuned settings")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent worker processes (default 4)")
+    parser.add_argument('--seconds', type=float, default=10, help="Duration of each run (default 10)")
+    parser.add_argument('--write-ratio', type=float, default=0.2,
+                        help="Share of operations that save a conversation (default 0.2)")
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers, {args.seconds:g}s per run, {args.write_ratio:.0%} writes")
+    print(f"{'Profile':10} {'writes/s':>10} {'reads/s':>10} {'write ms':>12} {'read ms':>11} {'locked':>8}")
+    run('default', False, args)
+    run('tuned', True, args)
+
+
+if __name__ == '__main__':
+    main()
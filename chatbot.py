@@ -7,11 +7,12 @@ import os
 import sys
 from pathlib import Path
 from dotenv import load_dotenv
-from mistralai import Mistral
+from llm import get_provider
+from file_store import ConversationLog
 import PyPDF2
 import docx
-import json
 from datetime import datetime
+from itertools import islice
 
 # Load environment variables
 load_dotenv()
@@ -110,41 +111,34 @@ class StudentChatbot:
     """Main chatbot application."""
     
     def __init__(self):
-        self.api_key = os.getenv("MISTRAL_API_KEY")
-        if not self.api_key or self.api_key == "your_mistral_api_key_here":
-            print("ERROR: MISTRAL_API_KEY not found in .env file")
+        # Backend is chosen by LLM_PROVIDER (mistral, local, or module:Class)
+        try:
+            self.provider = get_provider()
+        except ValueError as e:
+            print(f"ERROR: {e}")
             print("Please create a .env file with your Mistral API key.")
             print("Example: MISTRAL_API_KEY=your_actual_key_here")
             sys.exit(1)
         
-        self.client = Mistral(api_key=self.api_key)
-        self.model = "mistral-small-latest"
+        self.model = self.provider.default_model
         self.corpus = ChatbotCorpus()
         self.conversation_history = []
-        self.saved_qa_pairs = []
-        self.storage_file = Path("qa_conversations.json")
-        self._load_saved_conversations()
+        # The log the web app writes too, so extract_data.py and the SQL migration see CLI saves
+        self.saved_qa = ConversationLog()
+        self._report_saved_conversations()
         
-    def _load_saved_conversations(self):
-        """Load previously saved Q&A pairs from JSON file."""
-        if self.storage_file.exists():
-            try:
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    self.saved_qa_pairs = json.load(f)
-                print(f"Loaded {len(self.saved_qa_pairs)} saved Q&A pairs from previous sessions.")
-            except Exception as e:
-                print(f"Error loading saved conversations: {e}")
-                self.saved_qa_pairs = []
-        else:
-            print("No previous conversations found. Starting fresh.")
-    
-    def _save_conversations_to_file(self):
-        """Save all Q&A pairs to JSON file."""
+    def _report_saved_conversations(self):
+        """Report how many Q&A pairs were saved in previous sessions."""
         try:
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(self.saved_qa_pairs, f, indent=2, ensure_ascii=False)
+            saved_count = self.saved_qa.count()
         except Exception as e:
-            print(f"Error saving conversations: {e}")
+            print(f"Error reading saved conversations: {e}")
+            return
+        
+        if saved_count:
+            print(f"Found {saved_count} saved Q&A pairs from previous sessions.")
+        else:
+            print("No previous conversations found. Starting fresh.")
         
     def initialize(self):
         """Initialize the chatbot and load corpus."""
@@ -172,7 +166,6 @@ class StudentChatbot:
                 continue
             
             if user_input.lower() == 'exit':
-                self._save_conversations_to_file()
                 print("\nConversations saved! Thank you for using the chatbot. Good luck with your studies!")
                 break
             
@@ -196,7 +189,7 @@ class StudentChatbot:
             })
     
     def _get_ai_response(self, question):
-        """Get response from Mistral AI."""
+        """Get response from the configured LLM provider."""
         try:
             # Build context with corpus
             system_message = (
@@ -214,12 +207,7 @@ class StudentChatbot:
                 {"role": "user", "content": question}
             ]
             
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=messages
-            )
-            
-            return response.choices[0].message.content
+            return self.provider.complete(messages, model=self.model)
             
         except Exception as e:
             return f"I apologize, but I encountered an error: {str(e)}\nPlease try again."
@@ -232,26 +220,35 @@ class StudentChatbot:
         
         last_qa = self.conversation_history[-1].copy()
         last_qa["saved_at"] = datetime.now().isoformat()
-        last_qa["id"] = len(self.saved_qa_pairs) + 1
         
-        self.saved_qa_pairs.append(last_qa)
-        self._save_conversations_to_file()
+        try:
+            last_qa = self.saved_qa.append(last_qa)
+        except Exception as e:
+            print(f"Error saving conversation: {e}")
+            return
         print(f"✓ Saved as Q&A #{last_qa['id']}")
     
-    def _list_saved_qa(self):
-        """List all saved Q&A pairs."""
-        if not self.saved_qa_pairs:
+    def _list_saved_qa(self, page_size=10):
+        """List saved Q&A pairs a page at a time."""
+        records = self.saved_qa.iter_all()
+        page = list(islice(records, page_size))
+        if not page:
             print("No saved Q&A pairs yet!")
             return
         
         print("\n" + "=" * 60)
         print("SAVED Q&A PAIRS")
         print("=" * 60)
-        for qa in self.saved_qa_pairs:
-            print(f"\n[Q&A #{qa['id']}] - {qa.get('saved_at', 'N/A')}")
-            print(f"Q: {qa['question']}")
-            print(f"A: {qa['answer']}")
-            print("-" * 60)
+        while page:
+            for qa in page:
+                print(f"\n[Q&A #{qa['id']}] - {qa.get('saved_at', 'N/A')}")
+                print(f"Q: {qa['question']}")
+                print(f"A: {qa['answer']}")
+                print("-" * 60)
+            
+            page = list(islice(records, page_size))
+            if page and input("Press Enter for more, or 'q' to stop: ").strip().lower() == 'q':
+                break
 
 
 def main():
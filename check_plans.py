@@ -0,0 +1,222 @@
+"""
+Query Plan Checks for Student Q&A Chatbot
+Verifies that the hot queries are answered from indexes, not by scanning or sorting whole tables
+
+Usage:
+    python check_plans.py [--verbose]
+    python check_plans.py --database-url postgresql://localhost/chatbot_plans [--verbose]
+
+Runs EXPLAIN on each query against a throwaway SQLite database, or against
+the given PostgreSQL database, which must be an empty scratch database: it
+is seeded with fixture rows. A query fails when its plan reads a checked
+table sequentially, or sorts rows an index should have returned in order.
+Run it before deploying schema or query changes.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser(description="Check hot queries for sequential scans and sorts")
+parser.add_argument('--database-url', help="Empty PostgreSQL scratch database (default: a temporary SQLite file)")
+parser.add_argument('--verbose', action='store_true', help="Print the plan of every query")
+args = parser.parse_args()
+
+if args.database_url:
+    os.environ['DATABASE_URL'] = args.database_url
+else:
+    _db_dir = tempfile.mkdtemp(prefix='check_plans_')
+    atexit.register(shutil.rmtree, _db_dir, ignore_errors=True)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'plans.db')
+
+from flask import Flask  # noqa: E402
+
+from database import init_db  # noqa: E402
+from models import db, User, Conversation, DailyConversationStat, DailyUserStat, conversation_history  # noqa: E402
+from pagination import encode_cursor, keyset_query  # noqa: E402
+
+PER_PAGE = 20
+
+
+def _page(query, sort_column, id_column, cursor=None):
+    return keyset_query(query, sort_column, id_column, cursor)[0].limit(PER_PAGE + 1)
+
+
+def hot_queries(user_id, cursor_at):
+    """
+    (label, tables that must not be scanned, must be index-ordered, query) for the queries
+    behind the student history, the API and the admin listings, built the way the routes build them.
+    """
+    now = datetime.utcnow()
+    conversation_cursor = encode_cursor(cursor_at.isoformat(), 10 ** 6)
+    user_cursor = encode_cursor(cursor_at.isoformat(), 10 ** 6)
+    previous_cursor = encode_cursor(cursor_at.isoformat(), 10 ** 6, 'prev')
+    own = Conversation.query.filter_by(user_id=user_id)
+    history = conversation_history('user_id', 'timestamp')
+
+    return [
+        ('user conversations, first page', ['conversations'], True,
+         _page(own, Conversation.timestamp, Conversation.id)),
+        ('user conversations, next page', ['conversations'], True,
+         _page(own, Conversation.timestamp, Conversation.id, conversation_cursor)),
+        ('user conversations, previous page', ['conversations'], True,
+         _page(own, Conversation.timestamp, Conversation.id, previous_cursor)),
+        ('student history', ['conversations'], True,
+         own.order_by(Conversation.timestamp.desc())),
+        ('user conversation count', ['conversations'], False,
+         db.session.query(db.func.count(Conversation.id)).filter(Conversation.user_id == user_id)),
+        ('registered conversations, next page', ['conversations'], True,
+         _page(Conversation.query.filter_by(is_guest=False), Conversation.timestamp, Conversation.id,
+               conversation_cursor)),
+        ('guest conversations, next page', ['conversations'], True,
+         _page(Conversation.query.filter_by(is_guest=True), Conversation.timestamp, Conversation.id,
+               conversation_cursor)),
+        ('all conversations, next page', ['conversations'], True,
+         _page(Conversation.query, Conversation.timestamp, Conversation.id, conversation_cursor)),
+        ('recent conversations', ['conversations'], True,
+         Conversation.query.order_by(Conversation.timestamp.desc()).limit(10)),
+        ('conversations in a date range', ['conversations'], False,
+         db.session.query(Conversation.user_id, db.func.count())
+         .filter(Conversation.timestamp >= now - timedelta(days=1), Conversation.timestamp < now)
+         .group_by(Conversation.user_id)),
+        ('users, next page', ['users'], True,
+         _page(User.query, User.created_at, User.id, user_cursor)),
+        ('recent users', ['users'], True,
+         User.query.order_by(User.created_at.desc()).limit(10)),
+        ('user counter recount', ['conversations', 'conversations_archive'], False,
+         db.select(history.c.user_id, db.func.count(), db.func.max(history.c.timestamp))
+         .where(history.c.user_id.in_([user_id, user_id + 1]))
+         .group_by(history.c.user_id)),
+        ('rollup day recount', ['conversations', 'conversations_archive'], False,
+         db.select(db.func.count()).select_from(history)
+         .where(history.c.timestamp >= now - timedelta(days=1), history.c.timestamp < now)),
+        ('archive batch', ['conversations'], True,
+         db.select(Conversation.id).where(Conversation.timestamp < now - timedelta(days=120))
+         .order_by(Conversation.timestamp).limit(5000)),
+        ('analytics by day', ['daily_conversation_stats'], False,
+         db.session.query(DailyConversationStat.day, db.func.sum(DailyConversationStat.count))
+         .filter(DailyConversationStat.day >= now.date() - timedelta(days=29))
+         .group_by(DailyConversationStat.day)),
+        ('analytics top users', ['daily_user_stats'], False,
+         db.session.query(DailyUserStat.user_id, db.func.sum(DailyUserStat.count))
+         .filter(DailyUserStat.day >= now.date() - timedelta(days=29))
+         .group_by(DailyUserStat.user_id)),
+    ]
+
+
+def seed(users=200, conversations_per_user=25):
+    """Fixture rows: users spread over a year, each with conversations spread over a semester."""
+    now = datetime.utcnow()
+    db.session.execute(db.insert(User), [
+        {'email': f'student{i}@uvu.edu', 'password_hash': '-', 'first_name': 'Student', 'last_name': str(i),
+         'student_id': str(10000000 + i), 'course_section': f'00{i % 3 + 1}',
+         'created_at': now - timedelta(days=i % 365, minutes=i)}
+        for i in range(users)
+    ])
+    user_ids = [user_id for user_id, in db.session.execute(db.select(User.id))]
+    rows = []
+    for n, user_id in enumerate(user_ids):
+        for j in range(conversations_per_user):
+            rows.append({'user_id': user_id, 'session_id': f's{user_id}', 'question': 'question', 'answer': 'answer',
+                         'is_guest': False, 'timestamp': now - timedelta(hours=(n * 7 + j * 13) % 2400)})
+        rows.append({'session_id': f'g{user_id}', 'question': 'guest question', 'answer': 'answer',
+                     'is_guest': True, 'guest_course_section': '001', 'timestamp': now - timedelta(hours=n)})
+    db.session.execute(db.insert(Conversation), rows)
+
+    from rollups import backfill_rollups
+    backfill_rollups()
+    db.session.commit()
+    # Give the planner statistics, as a live database would have
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+    return user_ids[len(user_ids) // 2]
+
+
+def _sql(query):
+    statement = query.statement if hasattr(query, 'statement') else query
+    return str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+
+
+def sqlite_plan(query, tables, ordered):
+    """Plan lines from EXPLAIN QUERY PLAN, and the problems found in them."""
+    with db.engine.connect() as conn:
+        lines = [row[3] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + _sql(query))]
+    problems = []
+    for line in lines:
+        scan = re.match(r'SCAN (\w+)( AS \w+)?$', line)
+        if scan and scan.group(1) in tables:
+            problems.append(f'sequential scan of {scan.group(1)}')
+        if ordered and 'TEMP B-TREE FOR ORDER BY' in line:
+            problems.append('sorts rows an index should return in order')
+    return lines, problems
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def postgres_plan(query, tables, ordered):
+    """Plan lines from EXPLAIN (FORMAT JSON) with sequential scans disfavoured, and the problems found."""
+    with db.engine.begin() as conn:
+        # Small fixture tables are cheaper to scan; make the planner show whether an index could be used
+        conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + _sql(query)).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    lines = []
+    problems = []
+    for node in _plan_nodes(plan[0]['Plan']):
+        relation = node.get('Relation Name')
+        lines.append(node['Node Type'] + (f' on {relation}' if relation else '') +
+                     (f" using {node['Index Name']}" if node.get('Index Name') else ''))
+        if node['Node Type'] == 'Seq Scan' and relation in tables:
+            problems.append(f'sequential scan of {relation}')
+        if ordered and node['Node Type'] == 'Sort':
+            problems.append('sorts rows an index should return in order')
+    return lines, problems
+
+
+def main():
+    """Command-line entry point."""
+    app = Flask(__name__)
+    init_db(app)
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect not in ('sqlite', 'postgresql'):
+            print(f"✗ Unsupported database: {dialect}")
+            sys.exit(2)
+        if db.session.query(User.id).first() is not None:
+            print("✗ The database already has users; point --database-url at an empty scratch database")
+            sys.exit(2)
+
+        user_id = seed()
+        cursor_at = db.session.query(Conversation.timestamp).filter_by(user_id=user_id) \
+            .order_by(Conversation.timestamp.desc()).offset(PER_PAGE).limit(1).scalar()
+        explain = postgres_plan if dialect == 'postgresql' else sqlite_plan
+
+        failed = False
+        print(f"Query plans on {dialect}")
+        for label, tables, ordered, query in hot_queries(user_id, cursor_at):
+            lines, problems = explain(query, tables, ordered)
+            failed |= bool(problems)
+            print(f"  {label:40} {'✗ ' + '; '.join(problems) if problems else '✓'}")
+            if problems or args.verbose:
+                for line in lines:
+                    print(f"      {line}")
+
+    if failed:
+        print("\n✗ Some hot queries are not served by an index")
+        sys.exit(1)
+    print("\n✓ Every hot query is served by an index")
+
+
+if __name__ == '__main__':
+    main()
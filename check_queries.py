@@ -0,0 +1,152 @@
+"""
+Query Count Checks for Student Q&A Chatbot
+Verifies that list endpoints run the same number of SQL queries however many rows they return
+
+Usage:
+    python check_queries.py [--verbose]
+
+Runs against a throwaway SQLite database: every endpoint is requested once
+with a few rows and once with many, and the query counts must match. A
+count that grows with the data is an N+1 (one query per row).
+"""
+
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+_db_dir = tempfile.mkdtemp(prefix='check_queries_')
+atexit.register(shutil.rmtree, _db_dir, ignore_errors=True)
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'check.db')
+os.environ['WRITE_BEHIND_ENABLED'] = 'false'
+os.environ.setdefault('MISTRAL_API_KEY', 'check-queries')
+
+import database  # noqa: E402
+import pagination  # noqa: E402
+from models import db, User, Conversation  # noqa: E402
+from web_app_sql import app  # noqa: E402
+
+
+class QueryCounter:
+    """Context manager counting the SQL statements sent to the database, on every engine."""
+
+    def __init__(self, engines):
+        self.engines = list(engines)
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+# (label, path, session) -- session 'user' is a registered student, 'admin' an administrator
+ENDPOINTS = [
+    ('student history', '/history', 'user'),
+    ('API conversations', '/api/v1/conversations?per_page=100', 'user'),
+    ('API users', '/api/v1/users?per_page=100', 'admin'),
+    ('export data', '/export_data', 'admin'),
+    ('admin dashboard', '/admin/dashboard', 'admin'),
+    ('admin users', '/admin/users', 'admin'),
+    ('admin conversations', '/admin/conversations', 'admin'),
+    ('admin conversation search', '/admin/conversations?search=question', 'admin'),
+    ('admin user detail', '/admin/users/{user_id}', 'admin'),
+]
+
+
+def seed(users, conversations_per_user, start_index=0):
+    """Add users, each with conversations, plus one guest conversation per user."""
+    now = datetime.utcnow()
+    for i in range(start_index, start_index + users):
+        user = User(email=f'student{i}@uvu.edu', first_name='Student', last_name=str(i),
+                    student_id=str(10000000 + i), course_section=f'00{i % 3 + 1}')
+        user.set_password('check')
+        db.session.add(user)
+        db.session.flush()
+        for j in range(conversations_per_user):
+            db.session.add(Conversation(user_id=user.id, session_id=f's{i}', question=f'question {j}',
+                                        answer='answer', timestamp=now - timedelta(minutes=i * 100 + j)))
+        db.session.add(Conversation(session_id=f'g{i}', question='guest question', answer='answer',
+                                    is_guest=True, guest_first_name='Guest', guest_course_section='001'))
+    db.session.commit()
+
+
+def measure(client, user):
+    """Query count per endpoint for the current data."""
+    counts = {}
+    for label, path, role in ENDPOINTS:
+        with client.session_transaction() as sess:
+            sess.clear()
+            if role == 'admin':
+                sess['admin_id'] = 1
+            else:
+                sess['user_id'] = user.id
+                sess['user_info'] = {'email': user.email, 'is_registered': True}
+
+        # Start every measurement cold so caches do not hide queries
+        pagination._count_cache.clear()
+        database._stats_cache.clear()
+        db.session.remove()
+
+        with QueryCounter(db.engines.values()) as counter:
+            response = client.get(path.format(user_id=user.id))
+            response.get_data()  # drain streamed responses
+        if response.status_code != 200:
+            raise RuntimeError(f"{label}: {path} returned {response.status_code}")
+        counts[label] = counter
+    return counts
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Check list endpoints for N+1 queries")
+    parser.add_argument('--verbose', action='store_true', help="Print the SQL of endpoints that fail")
+    args = parser.parse_args()
+
+    client = app.test_client()
+    with app.app_context():
+        seed(users=2, conversations_per_user=2)
+        user_id = User.query.order_by(User.id).first().id
+        small = measure(client, db.session.get(User, user_id))
+
+        seed(users=40, conversations_per_user=30, start_index=2)
+        # Give the measured student many more conversations too
+        db.session.add_all([Conversation(user_id=user_id, session_id='s0', question=f'question x{j}', answer='answer')
+                            for j in range(60)])
+        db.session.commit()
+        large = measure(client, db.session.get(User, user_id))
+
+    failed = False
+    print(f"{'Endpoint':30} {'few rows':>9} {'many rows':>10}")
+    for label, _, _ in ENDPOINTS:
+        ok = small[label].count == large[label].count
+        failed |= not ok
+        print(f"{label:30} {small[label].count:9} {large[label].count:10}  {'✓' if ok else '✗ grows with rows'}")
+        if not ok and args.verbose:
+            for statement in large[label].statements:
+                print('    ' + ' '.join(statement.split())[:160])
+
+    if failed:
+        print("\n✗ Some endpoints issue a query per row")
+        sys.exit(1)
+    print("\n✓ Query counts are constant for every endpoint")
+
+
+if __name__ == '__main__':
+    main()
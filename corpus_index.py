@@ -0,0 +1,164 @@
+"""
+Corpus Index for Student Q&A Chatbot
+Lightweight in-memory ranking of course material passages (no network, no extra dependencies)
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+BULLET_PATTERN = re.compile(r"^(?:[•o*-]\s+)+")
+
+STOPWORDS = frozenset("""
+a about all also am an and any are as at be been but by can could did do does doing
+for from get got had has have how i if in into is it its just like me my no not of
+okay on or our so some that the their them then there these they this those to um uh
+up us was we were what when where which who why will with would you your yeah really
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+class Bm25Ranker:
+    """BM25 scoring over a fixed list of texts using an inverted index."""
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, texts):
+        self._term_freqs = []
+        self._lengths = []
+        self._postings = defaultdict(list)
+
+        for index, text in enumerate(texts):
+            freqs = Counter(tokenize(text))
+            self._term_freqs.append(freqs)
+            self._lengths.append(sum(freqs.values()))
+            for term in freqs:
+                self._postings[term].append(index)
+
+        count = len(texts)
+        self._avg_length = (sum(self._lengths) / count) if count else 0.0
+        self._idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def rank(self, question):
+        """Return (index, score) pairs for texts sharing terms with the question, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(question)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for index in self._postings[term]:
+                tf = self._term_freqs[index][term]
+                norm = self.K1 * (1 - self.B + self.B * self._lengths[index] / self._avg_length)
+                scores[index] += idf * tf * (self.K1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class CorpusIndex:
+    """
+    BM25 indexes over sentences and paragraph chunks of the loaded course materials.
+
+    Built once when the corpus loads; queries only touch the postings for the
+    question's terms, so ranking stays well under a millisecond per query.
+    """
+
+    def __init__(self, documents, min_sentence_chars=40, max_sentence_chars=400, chunk_chars=1200):
+        # documents: list of (source_name, text)
+        self.sentences = []  # (source, sentence)
+        self.chunks = []  # (source, chunk)
+
+        for source, text in documents:
+            for sentence in SENTENCE_PATTERN.split(text):
+                sentence = BULLET_PATTERN.sub('', sentence.strip())
+                if len(sentence) < min_sentence_chars or not tokenize(sentence):
+                    continue
+                if len(sentence) > max_sentence_chars:
+                    sentence = sentence[:max_sentence_chars].rsplit(' ', 1)[0] + '...'
+                self.sentences.append((source, sentence))
+
+            for chunk in self._split_chunks(text, chunk_chars):
+                self.chunks.append((source, chunk))
+
+        self._sentence_ranker = Bm25Ranker([sentence for _, sentence in self.sentences])
+        self._chunk_ranker = Bm25Ranker([chunk for _, chunk in self.chunks])
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def rank_sentences(self, question, limit=5):
+        """Return up to `limit` (score, source, sentence) tuples, best first."""
+        results = []
+        seen = set()
+        for index, score in self._sentence_ranker.rank(question):
+            source, sentence = self.sentences[index]
+            if sentence in seen:
+                continue
+            seen.add(sentence)
+            results.append((score, source, sentence))
+            if len(results) >= limit:
+                break
+        return results
+
+    def rank_chunks(self, question, limit=5):
+        """Return up to `limit` (score, source, chunk) tuples, best first."""
+        return [
+            (score, self.chunks[index][0], self.chunks[index][1])
+            for index, score in self._chunk_ranker.rank(question)[:limit]
+        ]
+
+    @staticmethod
+    def _split_chunks(text, chunk_chars):
+        """Group paragraphs into chunks of roughly `chunk_chars` characters."""
+        pieces = []
+        for paragraph in re.split(r"\n\s*\n", text):
+            paragraph = paragraph.strip()
+            if len(paragraph) > chunk_chars:
+                # Long transcripts have no paragraph breaks; fall back to sentences
+                pieces.extend(p for p in SENTENCE_PATTERN.split(paragraph) if p.strip())
+            elif paragraph:
+                pieces.append(paragraph)
+
+        chunk = []
+        size = 0
+        for piece in pieces:
+            if chunk and size + len(piece) > chunk_chars:
+                yield "\n".join(chunk)
+                chunk, size = [], 0
+            chunk.append(piece)
+            size += len(piece)
+        if chunk:
+            yield "\n".join(chunk)
+
+
+def build_fallback_answer(index, question, limit=4):
+    """Compose a clearly labelled extractive answer from the top-ranked passages."""
+    passages = index.rank_sentences(question, limit=limit) if index else []
+
+    if not passages:
+        return (
+            "⚠️ The AI assistant is temporarily unavailable and I couldn't find course material "
+            "matching your question. Please try again in a few minutes."
+        ), []
+
+    lines = [
+        "⚠️ The AI assistant is temporarily unavailable, so here are the most relevant "
+        "passages from the course materials:",
+        ""
+    ]
+    for _, source, sentence in passages:
+        lines.append(f"- {sentence} (source: {source})")
+    lines.append("")
+    lines.append("Please try again shortly for a full answer.")
+
+    sources = sorted({source for _, source, _ in passages})
+    return "\n".join(lines), sources
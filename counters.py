@@ -0,0 +1,249 @@
+"""
+User Activity Counters for Student Q&A Chatbot
+Keeps users.conversation_count, last_activity_at and the recent-activity window current
+
+Usage:
+    python counters.py --reconcile [--dry-run]
+"""
+
+import argparse
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import Flask
+from dotenv import load_dotenv
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db, User, Conversation, RECENT_ACTIVITY_DAYS, conversation_history
+from rollups import _to_day
+
+
+def _encode_activity(counts):
+    return ','.join(str(n) for n in counts)
+
+
+def record_user_activity(rows, connection=None):
+    """
+    Count newly inserted conversations (column dicts) into their users' counters.
+    Runs on the caller's connection so the counters commit or roll back with the rows.
+    """
+    connection = connection or db.session.connection()
+    today = datetime.utcnow().date()
+    window_start = today - timedelta(days=RECENT_ACTIVITY_DAYS - 1)
+
+    added = defaultdict(lambda: {'count': 0, 'last': None, 'days': defaultdict(int)})
+    for row in rows:
+        user_id = row.get('user_id')
+        if not user_id:
+            continue
+        entry = added[user_id]
+        entry['count'] += 1
+        timestamp = row.get('timestamp')
+        if timestamp is not None:
+            if entry['last'] is None or timestamp > entry['last']:
+                entry['last'] = timestamp
+            if window_start <= _to_day(timestamp) <= today:
+                entry['days'][_to_day(timestamp)] += 1
+    if not added:
+        return
+
+    users = User.__table__
+    # Lock the rows (PostgreSQL) so concurrent writers cannot lose each other's window updates
+    current = connection.execute(
+        db.select(users.c.id, users.c.recent_activity, users.c.recent_activity_day)
+        .where(users.c.id.in_(list(added)))
+        .with_for_update()
+    ).all()
+
+    updates = []
+    for user_id, recent_activity, recent_activity_day in current:
+        entry = added[user_id]
+        counts = User.align_activity(recent_activity, recent_activity_day, today)
+        for day, count in entry['days'].items():
+            counts[(today - day).days] += count
+        updates.append({'user_id': user_id, 'added': entry['count'], 'last': entry['last'],
+                        'recent': _encode_activity(counts), 'recent_day': today})
+
+    last = db.bindparam('last', type_=db.DateTime)
+    connection.execute(
+        users.update()
+        .where(users.c.id == db.bindparam('user_id'))
+        .values(
+            # Increment in SQL so the total never depends on a value read earlier
+            conversation_count=db.func.coalesce(users.c.conversation_count, 0) + db.bindparam('added'),
+            last_activity_at=db.case(
+                (db.or_(users.c.last_activity_at.is_(None), users.c.last_activity_at < last), last),
+                else_=users.c.last_activity_at
+            ),
+            recent_activity=db.bindparam('recent'),
+            recent_activity_day=db.bindparam('recent_day'),
+            # Counter upkeep is not a profile edit; keep onupdate from touching updated_at
+            updated_at=users.c.updated_at,
+        ),
+        updates
+    )
+
+
+def _true_counters(connection, user_ids=None):
+    """Counters recomputed from the conversations tables (archived ones still count), keyed by user id."""
+    today = datetime.utcnow().date()
+    window_start = datetime.combine(today - timedelta(days=RECENT_ACTIVITY_DAYS - 1), datetime.min.time())
+    conversations = conversation_history('user_id', 'timestamp')
+    scope = ([conversations.c.user_id.in_(user_ids)] if user_ids is not None
+             else [conversations.c.user_id.isnot(None)])
+
+    totals = {
+        user_id: (count, last)
+        for user_id, count, last in connection.execute(
+            db.select(conversations.c.user_id, db.func.count(), db.func.max(conversations.c.timestamp))
+            .where(*scope)
+            .group_by(conversations.c.user_id)
+        )
+    }
+
+    day = db.func.date(conversations.c.timestamp)
+    recent = defaultdict(lambda: [0] * RECENT_ACTIVITY_DAYS)
+    for user_id, day_value, count in connection.execute(
+        db.select(conversations.c.user_id, day, db.func.count())
+        .where(*scope, conversations.c.timestamp >= window_start)
+        .group_by(conversations.c.user_id, day)
+    ):
+        offset = (today - _to_day(day_value)).days
+        if 0 <= offset < RECENT_ACTIVITY_DAYS:
+            recent[user_id][offset] += count
+
+    return {
+        user_id: {
+            'conversation_count': totals.get(user_id, (0, None))[0],
+            'last_activity_at': totals.get(user_id, (0, None))[1],
+            'recent_activity': _encode_activity(recent[user_id]) if user_id in recent else None,
+        }
+        for user_id in (user_ids if user_ids is not None else set(totals) | set(recent))
+    }, today
+
+
+def recount_users(user_ids, connection=None):
+    """Recompute the counters of the given users from their conversations (after deletes and merges)."""
+    user_ids = [user_id for user_id in set(user_ids) if user_id]
+    if not user_ids:
+        return
+    connection = connection or db.session.connection()
+    truth, today = _true_counters(connection, user_ids)
+    _write_counters(connection, truth, today)
+
+
+def _write_counters(connection, values, today):
+    if not values:
+        return
+    users = User.__table__
+    connection.execute(
+        users.update().where(users.c.id == db.bindparam('user_id')).values(
+            conversation_count=db.bindparam('count'),
+            last_activity_at=db.bindparam('last', type_=db.DateTime),
+            recent_activity=db.bindparam('recent'),
+            recent_activity_day=db.bindparam('recent_day', type_=db.Date),
+            updated_at=users.c.updated_at,
+        ),
+        [{'user_id': user_id, 'count': v['conversation_count'], 'last': v['last_activity_at'],
+          'recent': v['recent_activity'], 'recent_day': today if v['recent_activity'] else None}
+         for user_id, v in values.items()]
+    )
+
+
+def reconcile_counters(batch_size=1000, dry_run=False, connection=None):
+    """
+    Compare every user's counters with their conversations and repair any drift.
+    Works through users in id order, `batch_size` at a time. Returns how many users drifted.
+    """
+    connection = connection or db.session.connection()
+    users = User.__table__
+    drifted = 0
+    last_id = 0
+    while True:
+        stored = connection.execute(
+            db.select(users.c.id, users.c.conversation_count, users.c.last_activity_at,
+                      users.c.recent_activity, users.c.recent_activity_day)
+            .where(users.c.id > last_id)
+            .order_by(users.c.id)
+            .limit(batch_size)
+        ).all()
+        if not stored:
+            return drifted
+        last_id = stored[-1][0]
+
+        truth, today = _true_counters(connection, [row[0] for row in stored])
+        repairs = {}
+        for user_id, count, last, recent_activity, recent_day in stored:
+            expected = truth[user_id]
+            stored_recent = User.align_activity(recent_activity, recent_day, today)
+            expected_recent = User.align_activity(expected['recent_activity'], today, today)
+            if (count, last, stored_recent) != (expected['conversation_count'], expected['last_activity_at'],
+                                                expected_recent):
+                repairs[user_id] = expected
+        drifted += len(repairs)
+        if repairs and not dry_run:
+            _write_counters(connection, repairs, today)
+
+
+_COUNTER_FIELDS = ('user_id', 'timestamp')
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_counters_after_flush(session, flush_context):
+    """
+    Keep user counters in step with ORM changes, in the same transaction.
+
+    New conversations are added onto the counters; users who lost or gained
+    conversations any other way (deletes, re-assignment) are recounted.
+    """
+    new = [obj for obj in session.new if isinstance(obj, Conversation)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Conversation)]
+    changed = [obj for obj in session.dirty if isinstance(obj, Conversation)
+               and any(inspect(obj).attrs[name].history.has_changes() for name in _COUNTER_FIELDS)]
+    if not (new or deleted or changed):
+        return
+
+    deleted_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    recount = set()
+    for obj in deleted:
+        recount.add(inspect(obj).dict.get('user_id'))
+    for obj in changed:
+        history = inspect(obj).attrs.user_id.history
+        recount.update(history.deleted or ())
+        recount.update(history.added or history.unchanged or ())
+
+    connection = session.connection()
+    recount_users(recount - deleted_users, connection)
+    rows = [{'user_id': obj.user_id, 'timestamp': obj.timestamp} for obj in new if obj.user_id not in recount]
+    record_user_activity(rows, connection)
+
+
+def main():
+    """Command-line entry point."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Check and repair per-user activity counters")
+    parser.add_argument('--reconcile', action='store_true', help="Recount every user's counters")
+    parser.add_argument('--dry-run', action='store_true', help="Only report how many users have drifted")
+    args = parser.parse_args()
+
+    if not args.reconcile:
+        parser.print_help()
+        sys.exit(1)
+
+    from database import init_db
+    app = Flask(__name__)
+    init_db(app)
+
+    with app.app_context():
+        start = time.monotonic()
+        drifted = reconcile_counters(dry_run=args.dry_run)
+        db.session.commit()
+        action = "need repair" if args.dry_run else "repaired"
+        print(f"✓ {drifted:,} users {action} ({time.monotonic() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
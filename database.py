@@ -4,8 +4,21 @@ Handles database initialization, migration, and helper functions
 """
 
 import os
-from models import db, User, Conversation, AdminUser
-from datetime import datetime
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from flask_migrate import Migrate
+from models import db, User, Conversation, ArchivedConversation, AdminUser
+from db_routing import READ_BIND, REPLICA_BIND
+from search import ensure_search_index, ensure_user_search_index
+from rollups import ensure_rollups  # also registers the ORM listener that keeps analytics rollups current
+import counters  # noqa: F401  registers the ORM listener that keeps user counters current
+import backup  # noqa: F401  registers the ORM listener that records deletes for incremental backups
+
+# Schema changes to existing databases: flask --app web_app_sql db upgrade (see migrations/)
+migrate = Migrate(render_as_batch=True)
 
 
 def get_database_url():
@@ -17,29 +30,124 @@ def get_database_url():
     database_url = os.getenv('DATABASE_URL')
     
     if database_url:
-        # Heroku uses postgres:// but SQLAlchemy needs postgresql://
-        if database_url.startswith('postgres://'):
-            database_url = database_url.replace('postgres://', 'postgresql://', 1)
-        return database_url
+        return _normalize_url(database_url)
     
     # Local development - use SQLite
     return 'sqlite:///chatbot.db'
 
 
+def get_replica_url():
+    """URL of an optional read replica (DATABASE_REPLICA_URL) for admin reporting, or None."""
+    replica_url = os.getenv('DATABASE_REPLICA_URL')
+    return _normalize_url(replica_url) if replica_url else None
+
+
+def _normalize_url(database_url):
+    # Heroku uses postgres:// but SQLAlchemy needs postgresql://
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+    return database_url
+
+
+def sqlite_tuning_enabled(database_url):
+    """Whether the SQLite profile applies: a SQLite database file, with SQLITE_TUNING left on."""
+    url = make_url(database_url)
+    return (url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+            and os.getenv('SQLITE_TUNING', 'true').lower() == 'true')
+
+
+def sqlite_pragmas():
+    """Connection settings for SQLite in production (each is per connection except journal_mode)."""
+    return [
+        # Readers no longer block the writer, nor the writer readers
+        'journal_mode = WAL',
+        # Durable at checkpoints; safe against corruption in WAL mode, and far fewer fsyncs
+        f"synchronous = {os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        # Wait for a busy lock instead of failing with "database is locked"
+        f"busy_timeout = {int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))}",
+        f"cache_size = {int(os.getenv('SQLITE_CACHE_SIZE', -64000))}",
+        f"mmap_size = {int(os.getenv('SQLITE_MMAP_SIZE', 268435456))}",
+        'temp_store = MEMORY',
+    ]
+
+
+def _configure_sqlite(app, url):
+    """
+    Engine options for a SQLite file: one writer connection per process,
+    plus a pool of read-only connections the session routes SELECTs to.
+    """
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        # Writes queue for the single connection instead of contending for the file lock
+        'pool_size': 1,
+        'max_overflow': 0,
+        'pool_timeout': int(os.getenv('SQLITE_WRITER_TIMEOUT', 30)),
+    }
+    app.config['SQLALCHEMY_BINDS'][READ_BIND] = {
+        'url': url,
+        'pool_size': int(os.getenv('SQLITE_READ_POOL_SIZE', 5)),
+        'pool_pre_ping': True,
+    }
+
+
+def _apply_sqlite_profile(writer, reader):
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(writer, 'connect')
+    def _writer_connect(dbapi_connection, connection_record):
+        for pragma in pragmas:
+            dbapi_connection.execute(f'PRAGMA {pragma}')
+        # Let SQLAlchemy issue BEGIN itself (below) instead of the driver deferring it
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(writer, 'begin')
+    def _writer_begin(conn):
+        # Take the write lock up front. A deferred transaction that reads and then writes
+        # fails outright in WAL mode if another process committed in between; this one waits.
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+    @event.listens_for(reader, 'connect')
+    def _reader_connect(dbapi_connection, connection_record):
+        for pragma in pragmas:
+            dbapi_connection.execute(f'PRAGMA {pragma}')
+        # A write routed here by mistake fails loudly rather than bypassing the writer
+        dbapi_connection.execute('PRAGMA query_only = ON')
+
+
 def init_db(app):
     """Initialize database with Flask app."""
-    app.config['SQLALCHEMY_DATABASE_URI'] = get_database_url()
+    database_url = get_database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
         'pool_pre_ping': True,
         'pool_recycle': 300,
     }
+    app.config['SQLALCHEMY_BINDS'] = {}
+    tuned_sqlite = sqlite_tuning_enabled(database_url)
+    if tuned_sqlite:
+        _configure_sqlite(app, database_url)
+    replica_url = get_replica_url()
+    if replica_url:
+        # Reads of use_replica views (admin reporting, exports, backups); see db_routing.py
+        app.config['SQLALCHEMY_BINDS'][REPLICA_BIND] = {
+            'url': replica_url,
+            'pool_pre_ping': True,
+            'pool_recycle': 300,
+        }
     
     db.init_app(app)
+    migrate.init_app(app, db)
     
     with app.app_context():
+        if tuned_sqlite:
+            _apply_sqlite_profile(db.engine, db.engines[READ_BIND])
         db.create_all()
+        ensure_search_index()
+        ensure_user_search_index()
+        ensure_rollups()
         print(f"Database initialized: {app.config['SQLALCHEMY_DATABASE_URI']}")
+        if replica_url:
+            print(f"Read replica: {make_url(replica_url).render_as_string(hide_password=True)}")
 
 
 def create_admin_user(email, password, first_name, last_name, is_super_admin=False):
@@ -58,143 +166,121 @@ def create_admin_user(email, password, first_name, last_name, is_super_admin=Fal
     return admin
 
 
-def migrate_json_to_db():
+def migrate_json_to_db(batch_size=None, reset=False):
     """
     Migrate existing JSON data to SQL database.
-    This is a one-time migration function.
+    Streams the files in batches and resumes from the last committed batch if interrupted;
+    pass reset=True to forget checkpoints and start over.
     """
-    import json
-    from pathlib import Path
+    from json_migration import JsonMigration
     
     print("Starting data migration from JSON to SQL...")
-    
-    # Migrate users from users_db.json
-    users_file = Path('users_db.json')
-    user_map = {}  # Map email to User object
-    
-    if users_file.exists():
-        print("Migrating users...")
-        with open(users_file, 'r', encoding='utf-8') as f:
-            users_data = json.load(f)
-        
-        for email, user_data in users_data.items():
-            # Check if user already exists
-            existing_user = User.query.filter_by(email=email.lower()).first()
-            if existing_user:
-                user_map[email.lower()] = existing_user
-                continue
-            
-            user = User(
-                email=email.lower(),
-                password_hash=user_data.get('password_hash'),
-                first_name=user_data.get('firstName', ''),
-                last_name=user_data.get('lastName', ''),
-                student_id=user_data.get('studentId', ''),
-                course_section=user_data.get('courseSection', ''),
-                semester=user_data.get('semester', '')
-            )
-            
-            # Parse created_at if exists
-            if 'created_at' in user_data:
-                try:
-                    user.created_at = datetime.fromisoformat(user_data['created_at'])
-                except:
-                    pass
-            
-            db.session.add(user)
-            user_map[email.lower()] = user
-        
-        db.session.commit()
-        print(f"Migrated {len(user_map)} users")
-    
-    # Migrate conversations from qa_conversations.json
-    conversations_file = Path('qa_conversations.json')
-    
-    if conversations_file.exists():
-        print("Migrating conversations...")
-        with open(conversations_file, 'r', encoding='utf-8') as f:
-            conversations_data = json.load(f)
-        
-        migrated_count = 0
-        for conv_data in conversations_data:
-            user_info = conv_data.get('user_info', {})
-            is_registered = user_info.get('is_registered', False)
-            
-            conversation = Conversation(
-                question=conv_data.get('question', ''),
-                answer=conv_data.get('answer', ''),
-                session_id=conv_data.get('session_id', ''),
-                is_guest=not is_registered
-            )
-            
-            # Parse timestamp
-            if 'timestamp' in conv_data:
-                try:
-                    conversation.timestamp = datetime.fromisoformat(conv_data['timestamp'])
-                except:
-                    pass
-            
-            if is_registered:
-                # Link to registered user
-                email = user_info.get('email', '').lower()
-                if email in user_map:
-                    conversation.user_id = user_map[email].id
-            else:
-                # Store guest user info
-                conversation.guest_first_name = user_info.get('firstName', '')
-                conversation.guest_last_name = user_info.get('lastName', '')
-                conversation.guest_student_id = user_info.get('studentId', '')
-                conversation.guest_email = user_info.get('email', '')
-                conversation.guest_course_section = user_info.get('courseSection', '')
-                conversation.guest_semester = user_info.get('semester', '')
-            
-            db.session.add(conversation)
-            migrated_count += 1
-        
-        db.session.commit()
-        print(f"Migrated {migrated_count} conversations")
-    
-    print("Migration complete!")
+    results = JsonMigration(batch_size=batch_size).run(reset=reset)
+    invalidate_database_stats()
+    print(f"Migration complete! {results['users']} users, {results['conversations']} conversations")
+    return results
 
 
-def get_database_stats():
-    """Get statistics about the database."""
-    total_users = User.query.count()
-    active_users = User.query.filter_by(is_active=True).count()
-    total_conversations = Conversation.query.count()
-    registered_conversations = Conversation.query.filter_by(is_guest=False).count()
-    guest_conversations = Conversation.query.filter_by(is_guest=True).count()
-    total_admins = AdminUser.query.count()
-    
-    return {
-        'total_users': total_users,
-        'active_users': active_users,
-        'total_conversations': total_conversations,
-        'registered_conversations': registered_conversations,
-        'guest_conversations': guest_conversations,
-        'total_admins': total_admins
-    }
+STATS_TTL = float(os.getenv('DASHBOARD_STATS_TTL', 60))
+STATS_MIN_AGE = float(os.getenv('DASHBOARD_STATS_MIN_AGE', 5))
 
 
-def backup_database_to_json():
-    """Backup database to JSON files (for safety)."""
-    import json
-    from datetime import datetime
-    
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    
-    # Backup users
-    users = User.query.all()
-    users_data = {user.email: user.to_dict() for user in users}
-    
-    with open(f'backup_users_{timestamp}.json', 'w', encoding='utf-8') as f:
-        json.dump(users_data, f, indent=2, ensure_ascii=False)
-    
-    # Backup conversations
-    conversations = Conversation.query.all()
-    conversations_data = [conv.to_dict() for conv in conversations]
+class _StatsCache:
+    """
+    Process-local cache for get_database_stats.
+
+    Values live for `ttl` seconds. A write calls invalidate(), which brings
+    expiry forward to `min_age` seconds after the value was read, so a busy
+    site refreshes at most that often instead of on every poll. Only one
+    thread recomputes at a time; the others wait for its result.
+    """
+
+    def __init__(self, ttl=STATS_TTL, min_age=STATS_MIN_AGE):
+        self.ttl = ttl
+        self.min_age = min_age
+        self._value = None
+        self._fetched_at = 0.0
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, loader):
+        if self._value is not None and time.monotonic() < self._expires_at:
+            return self._value
+        with self._lock:
+            if self._value is not None and time.monotonic() < self._expires_at:
+                return self._value
+            value = loader()
+            self._fetched_at = time.monotonic()
+            self._expires_at = self._fetched_at + self.ttl
+            self._value = value
+            return value
+
+    def invalidate(self):
+        self._expires_at = min(self._expires_at, self._fetched_at + self.min_age)
+
+    def clear(self):
+        self._expires_at = 0.0
+
+
+_stats_cache = _StatsCache()
+
+
+def _query_database_stats():
+    """All dashboard counts in one round trip: one aggregate per table, conditional counts within it."""
+    users = db.select(
+        db.func.count(User.id).label('total_users'),
+        db.func.count(db.case((User.is_active == True, 1))).label('active_users')
+    ).subquery()
+    conversations = db.select(
+        db.func.count(Conversation.id).label('total_conversations'),
+        db.func.count(db.case((Conversation.is_guest == False, 1))).label('registered_conversations'),
+        db.func.count(db.case((Conversation.is_guest == True, 1))).label('guest_conversations')
+    ).subquery()
+    archived = db.select(db.func.count(ArchivedConversation.id).label('archived_conversations')).subquery()
+    admins = db.select(db.func.count(AdminUser.id).label('total_admins')).subquery()
     
-    with open(f'backup_conversations_{timestamp}.json', 'w', encoding='utf-8') as f:
-        json.dump(conversations_data, f, indent=2, ensure_ascii=False)
+    # Each side is a single row, so joining them on TRUE just places the counts side by side
+    row = db.session.execute(
+        db.select(users, conversations, archived, admins)
+        .select_from(users.join(conversations, db.true()).join(archived, db.true()).join(admins, db.true()))
+    ).one()
+    return dict(row._mapping)
+
+
+def get_database_stats(fresh=False):
+    """Get statistics about the database (cached for up to DASHBOARD_STATS_TTL seconds)."""
+    if fresh:
+        _stats_cache.clear()
+    return dict(_stats_cache.get(_query_database_stats))
+
+
+def invalidate_database_stats():
+    """Mark cached stats stale after users, conversations or admins were written."""
+    _stats_cache.invalidate()
+
+
+_STATS_MODELS = (User, Conversation, AdminUser)
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_stats_change(session, flush_context):
+    if any(isinstance(obj, _STATS_MODELS) for obj in (*session.new, *session.deleted, *session.dirty)):
+        session.info['stats_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_stats_on_commit(session):
+    if session.info.pop('stats_changed', False):
+        invalidate_database_stats()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_stats_change(session, previous_transaction):
+    session.info.pop('stats_changed', None)
+
+
+def backup_database_to_json(incremental=False):
+    """Back up the database to gzip NDJSON files with a manifest (runs synchronously)."""
+    from backup import BackupManager
     
-    print(f"Backup created: backup_users_{timestamp}.json, backup_conversations_{timestamp}.json")
+    return BackupManager().run(incremental=incremental)
@@ -0,0 +1,137 @@
+"""
+Read/Write Session Routing for Student Q&A Chatbot
+Sends plain reads to a separate read engine or a read replica and everything else to the writer
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select, CompoundSelect, TextClause
+
+# Bind keys in SQLALCHEMY_BINDS (set up by database.init_db)
+READ_BIND = 'reads'
+REPLICA_BIND = 'replica'
+
+# After a request writes, that browser session reads from the primary for this long
+REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', 10))
+_PRIMARY_UNTIL = '_read_primary_until'
+
+
+def is_read(clause):
+    """Whether a statement only reads: a SELECT construct, or text SQL that starts with SELECT."""
+    if isinstance(clause, (Select, CompoundSelect)):
+        return True
+    return isinstance(clause, TextClause) and clause.text.lstrip()[:6].upper() == 'SELECT'
+
+
+def _pinned_to_primary():
+    """Whether this browser session wrote recently enough that a replica may not have caught up."""
+    return has_request_context() and flask_session.get(_PRIMARY_UNTIL, 0) > time.time()
+
+
+class RoutingSession(Session):
+    """
+    Session that runs SELECTs on a read engine when one is configured.
+
+    Reads go to the replica inside use_replica views and replica_reads()
+    blocks, otherwise to the local read pool (SQLite) or the primary.
+    Anything else (flushes, bulk DML, other text statements, bare
+    connection() calls that may write) goes to the default engine, the
+    writer. Once a transaction has used the writer, its remaining reads use
+    it too, so the transaction sees its own uncommitted writes.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._writing = False
+        self._wrote = False
+
+    def _read_engine(self):
+        engines = self._db.engines
+        if (self.info.get('replica') and not self.info.get('primary') and REPLICA_BIND in engines
+                and not _pinned_to_primary()):
+            return engines[REPLICA_BIND]
+        return engines.get(READ_BIND)
+
+    def read_bind(self):
+        """The engine plain reads would use right now, for work that holds its own connection."""
+        return self._read_engine() or self._db.engine
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._writing and not self._flushing and is_read(clause):
+            engine = self._read_engine()
+            if engine is not None:
+                return engine
+
+        if bind is None:
+            # Usually called just before the transaction begins on it; the flag lasts until it ends
+            self._writing = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_flush(session, flush_context):
+    session._wrote = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _note_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session._wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_after_write(session):
+    if session._wrote and has_request_context() and REPLICA_BIND in session._db.engines:
+        flask_session[_PRIMARY_UNTIL] = time.time() + REPLICA_STICKY_SECONDS
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_writing(session, transaction):
+    if transaction.parent is None:
+        session._writing = False
+        session._wrote = False
+
+
+def _current_session():
+    return current_app.extensions['sqlalchemy'].session
+
+
+def use_replica(view):
+    """
+    Serve a view's reads from the read replica, when one is configured.
+    Applies for the rest of the request, so streamed responses read from it too.
+    """
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        _current_session().info['replica'] = True
+        return view(*args, **kwargs)
+    return decorated
+
+
+@contextmanager
+def replica_reads():
+    """Read from the replica inside the block (background jobs such as backups)."""
+    info = _current_session().info
+    previous = info.get('replica')
+    info['replica'] = True
+    try:
+        yield
+    finally:
+        info['replica'] = previous
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, even in a use_replica view (read-after-write pages)."""
+    info = _current_session().info
+    info['primary'] = info.get('primary', 0) + 1
+    try:
+        yield
+    finally:
+        info['primary'] -= 1
@@ -0,0 +1,203 @@
+"""
+Streaming Exports for Student Q&A Chatbot
+CSV, NDJSON and JSON downloads that stream rows from server-side cursors, optionally gzipped
+"""
+
+import csv
+import json
+import os
+import zlib
+from datetime import datetime
+
+from flask import Response, stream_with_context
+from sqlalchemy.orm import joinedload
+
+from models import db, User, Conversation, ArchivedConversation
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+USER_HEADER = ['ID', 'Email', 'First Name', 'Last Name', 'Student ID',
+               'Course Section', 'Semester', 'Created At', 'Conversation Count']
+CONVERSATION_HEADER = ['ID', 'User Email', 'Student ID', 'Question', 'Answer',
+                       'Timestamp', 'Is Guest', 'Session ID']
+
+
+def _format_time(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def iter_rows(statement, batch_size=EXPORT_BATCH_SIZE):
+    """Execute on a server-side cursor and yield result rows `batch_size` at a time from the driver."""
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield from partition
+
+
+def user_export_rows():
+    """Users with their stored conversation counts, as export rows."""
+    statement = (db.select(User.id, User.email, User.first_name, User.last_name, User.student_id,
+                           User.course_section, User.semester, User.created_at, User.conversation_count)
+                 .order_by(User.id))
+
+    for row in iter_rows(statement):
+        yield {
+            'ID': row[0],
+            'Email': row[1],
+            'First Name': row[2],
+            'Last Name': row[3],
+            'Student ID': row[4],
+            'Course Section': row[5] or '',
+            'Semester': row[6] or '',
+            'Created At': _format_time(row[7]),
+            'Conversation Count': row[8],
+        }
+
+
+def conversation_export_rows(include_archive=False):
+    """
+    Conversations joined to their user in the same query, as export rows.
+    With include_archive, archived conversations follow the live ones.
+    """
+    models = (Conversation, ArchivedConversation) if include_archive else (Conversation,)
+    for model in models:
+        yield from _conversation_rows(model)
+
+
+def _conversation_rows(model):
+    statement = (db.select(model.id, model.is_guest, model.guest_email, model.guest_student_id,
+                           User.email, User.student_id, model.question, model.answer, model.timestamp,
+                           model.session_id)
+                 .outerjoin(User, User.id == model.user_id)
+                 .order_by(model.id))
+
+    for (conv_id, is_guest, guest_email, guest_student_id, user_email, user_student_id,
+         question, answer, timestamp, session_id) in iter_rows(statement):
+        if is_guest:
+            email = guest_email or 'Guest'
+            student_id = guest_student_id or 'N/A'
+        else:
+            email = user_email or 'N/A'
+            student_id = user_student_id or 'N/A'
+
+        yield {
+            'ID': conv_id,
+            'User Email': email,
+            'Student ID': student_id,
+            'Question': question,
+            'Answer': answer,
+            'Timestamp': _format_time(timestamp),
+            'Is Guest': 'Yes' if is_guest else 'No',
+            'Session ID': session_id,
+        }
+
+
+def iter_conversation_dicts(include_archive=False):
+    """
+    Conversation.to_dict() for every row, loading each row's user in the same query.
+    With include_archive, archived conversations follow the live ones.
+    """
+    models = (Conversation, ArchivedConversation) if include_archive else (Conversation,)
+    for model in models:
+        statement = (db.select(model)
+                     .options(joinedload(model.user))
+                     .order_by(model.id))
+        for conversation in db.session.scalars(statement.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+            yield conversation.to_dict()
+
+
+class _LineBuffer:
+    """File-like sink for csv.writer that hands back what was written."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def take(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
+
+
+def csv_chunks(header, rows, rows_per_chunk=500):
+    """Render dict rows as CSV text, yielding every `rows_per_chunk` rows."""
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([row[column] for column in header])
+        if count % rows_per_chunk == 0:
+            yield buffer.take()
+    yield buffer.take()
+
+
+def ndjson_chunks(rows, rows_per_chunk=500):
+    """Render rows as newline-delimited JSON."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False, default=str))
+        if len(lines) >= rows_per_chunk:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def json_document_chunks(list_key, rows, rows_per_chunk=500, **fields):
+    """Render {**fields, list_key: [rows...]} as one JSON document, streamed."""
+    head = json.dumps(fields, default=str)[:-1]
+    yield head + (', ' if fields else '') + json.dumps(list_key) + ': ['
+
+    first = True
+    parts = []
+    for row in rows:
+        parts.append(('' if first else ', ') + json.dumps(row, ensure_ascii=False, default=str))
+        first = False
+        if len(parts) >= rows_per_chunk:
+            yield ''.join(parts)
+            parts = []
+    yield ''.join(parts) + ']}'
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def export_response(chunks, fmt, filename, compress=False):
+    """
+    Stream text chunks as a download, gzipped when `compress` is set.
+
+    The generator runs inside the request context, so database cursors stay
+    open until the last row is sent and the download starts immediately.
+    """
+    body = stream_with_context(_gzip(chunks) if compress else (chunk.encode('utf-8') for chunk in chunks))
+    headers = {}
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename={filename}.{fmt}' + ('.gz' if compress else '')
+    return Response(body, mimetype='application/gzip' if compress else CONTENT_TYPES[fmt], headers=headers)
+
+
+def export_options(request, default='csv', allowed=('csv', 'ndjson')):
+    """Read ?format= (one of `allowed`) and ?gzip=1 from a request."""
+    fmt = request.args.get('format', default).lower()
+    if fmt not in allowed:
+        fmt = default
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    return fmt, compress
+
+
+def dated_filename(prefix):
+    return f'{prefix}_{datetime.now().strftime("%Y%m%d")}'
@@ -7,17 +7,17 @@ import json
 from pathlib import Path
 from datetime import datetime
 import csv
+from file_store import ConversationLog
 
 
-def load_conversations(filepath="qa_conversations.json"):
-    """Load conversations from JSON file."""
-    file_path = Path(filepath)
-    if not file_path.exists():
+def load_conversations(filepath="qa_conversations.jsonl"):
+    """Load conversations from the JSONL conversation log (or the legacy JSON file)."""
+    log = ConversationLog(filepath)
+    if not log.path.exists() and not log.legacy_path.exists():
         print(f"Error: {filepath} not found!")
         return []
     
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return list(log.iter_all())
 
 
 def display_summary(conversations):
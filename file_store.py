@@ -0,0 +1,352 @@
+"""
+File-Based Storage for Student Q&A Chatbot
+Append-only JSONL logs and a cached user store, all safe across processes
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(lock_path, shared=False):
+    """Hold an advisory lock on `lock_path` (shared for readers, exclusive for writers)."""
+    with open(lock_path, 'a+b') as handle:
+        if fcntl:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            # msvcrt has no shared locks; LK_LOCK retries for ~10s before raising
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ConversationLog:
+    """
+    Append-only conversation log, one JSON record per line.
+
+    Appends take an exclusive lock on a sidecar `.lock` file, so several
+    processes can write at once without clobbering each other, and each
+    write costs O(1) regardless of history size. Every process keeps a
+    small index of byte offsets by id, session and email; it is built by one
+    streaming scan and then caught up incrementally from the last indexed
+    byte. Torn lines left by a crashed writer are skipped, and the log is
+    compacted (rewritten without them) once enough have accumulated.
+
+    If only the legacy `qa_conversations.json` array exists it is converted
+    to the log on first use.
+    """
+
+    def __init__(self, path=None, legacy_path=None, compact_threshold=None):
+        self.path = Path(path or os.getenv('CONVERSATION_LOG', 'qa_conversations.jsonl'))
+        self.legacy_path = Path(legacy_path or 'qa_conversations.json')
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self.compact_threshold = compact_threshold or int(os.getenv('CONVERSATION_LOG_COMPACT_THRESHOLD', 50))
+
+        self._lock = threading.RLock()
+        self._converted = False
+        self._reset_index()
+
+    def append(self, record):
+        """Assign the next id, append the record and return it."""
+        with self._lock, file_lock(self.lock_path):
+            self._convert_legacy()
+            self._refresh()
+
+            record = dict(record, id=self._last_id + 1)
+            line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+
+            with open(self.path, 'a+b') as f:
+                offset = f.seek(0, os.SEEK_END)
+                if offset:
+                    # Never glue a record onto a torn line from a crashed writer
+                    f.seek(offset - 1)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+                        offset += 1
+                        self._garbage += 1
+                f.write(line)
+                f.flush()
+                stat = os.fstat(f.fileno())
+
+            self._file_id = (stat.st_dev, stat.st_ino)
+            self._index(record, offset)
+            self._indexed_size = offset + len(line)
+
+            if self._garbage >= self.compact_threshold:
+                self._compact()
+            return record
+
+    def get(self, conversation_id):
+        """Return one record by id, or None."""
+        return next(self._read_offsets(
+            lambda: [self._by_id[conversation_id]] if conversation_id in self._by_id else []), None)
+
+    def iter_session(self, session_id):
+        """Stream the records of one session in write order."""
+        return self._read_offsets(lambda: list(self._by_session.get(session_id, ())))
+
+    def iter_email(self, email):
+        """Stream the records whose user_info email matches (case-insensitive)."""
+        return self._read_offsets(lambda: list(self._by_email.get((email or '').lower(), ())))
+
+    def count(self, email=None):
+        """Number of records, optionally for one email."""
+        if email is not None:
+            return self._snapshot(lambda: len(self._by_email.get(email.lower(), ())))
+        return self._snapshot(lambda: self._count)
+
+    def iter_all(self):
+        """Stream every record in write order without loading the log into memory."""
+        end, handle = self._snapshot(lambda: self._indexed_size, open_log=True)
+        if handle is None:
+            return
+
+        with handle as f:
+            while f.tell() < end:
+                line = f.readline()
+                record = _parse(line)
+                if record is not None:
+                    yield record
+
+    def compact(self):
+        """Rewrite the log without torn lines."""
+        with self._lock, file_lock(self.lock_path):
+            self._refresh()
+            self._compact()
+
+    def _snapshot(self, read, open_log=False):
+        """
+        Catch the index up with other writers and read from it under a shared lock.
+
+        With open_log, also open the log under that lock and return (value, handle).
+        The handle stays on the file the offsets belong to even if a compaction
+        replaces it once the lock is released; handle is None if there is no log.
+        """
+        with self._lock:
+            if not self._converted:
+                with file_lock(self.lock_path):
+                    self._convert_legacy()
+            with file_lock(self.lock_path, shared=True):
+                self._refresh()
+                if not open_log:
+                    return read()
+                try:
+                    handle = open(self.path, 'rb')
+                except FileNotFoundError:
+                    handle = None
+                return read(), handle
+
+    def _read_offsets(self, read):
+        """Records at the offsets `read` takes from the index, read from the file they were indexed in."""
+        offsets, handle = self._snapshot(read, open_log=True)
+        if handle is None:
+            return iter(())
+        if not offsets:
+            handle.close()
+            return iter(())
+        return self._read_lines(handle, offsets)
+
+    @staticmethod
+    def _read_lines(handle, offsets):
+        with handle as f:
+            for offset in offsets:
+                f.seek(offset)
+                record = _parse(f.readline())
+                if record is not None:
+                    yield record
+
+    def _reset_index(self):
+        self._by_id = {}
+        self._by_session = defaultdict(list)
+        self._by_email = defaultdict(list)
+        self._indexed_size = 0
+        self._file_id = None
+        self._last_id = 0
+        self._count = 0
+        self._garbage = 0
+
+    def _index(self, record, offset):
+        conversation_id = record.get('id')
+        if isinstance(conversation_id, int):
+            self._by_id[conversation_id] = offset
+            self._last_id = max(self._last_id, conversation_id)
+        self._count += 1
+        if record.get('session_id'):
+            self._by_session[record['session_id']].append(offset)
+        email = (record.get('user_info') or {}).get('email')
+        if email:
+            self._by_email[email.lower()].append(offset)
+
+    def _refresh(self):
+        """Index lines appended since the last refresh; rebuild if the file was replaced."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset_index()
+            return
+
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id != self._file_id or stat.st_size < self._indexed_size:
+            self._reset_index()
+            self._file_id = file_id
+
+        if stat.st_size == self._indexed_size:
+            return
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._indexed_size)
+            offset = self._indexed_size
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Partial trailing line; a later append will terminate it
+                    break
+                record = _parse(line)
+                if record is None:
+                    self._garbage += 1
+                else:
+                    self._index(record, offset)
+                offset += len(line)
+        self._indexed_size = offset
+
+    def _compact(self):
+        """Rewrite the log keeping only well-formed records. Caller holds the locks."""
+        if not self.path.exists():
+            return
+
+        temp_path = self.path.with_name(self.path.name + '.compact')
+        kept = 0
+        with open(self.path, 'rb') as src, open(temp_path, 'wb') as dst:
+            for line in src:
+                if line.endswith(b'\n') and _parse(line) is not None:
+                    dst.write(line)
+                    kept += 1
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        dropped = self._garbage
+        os.replace(temp_path, self.path)
+        self._reset_index()
+        self._refresh()
+        print(f"Compacted {self.path.name}: kept {kept} records, dropped {dropped} stale lines")
+
+    def _convert_legacy(self):
+        """Convert the legacy JSON array file into the log once. Caller holds the file lock."""
+        if self._converted:
+            return
+        self._converted = True
+
+        if self.path.exists() or not self.legacy_path.exists():
+            return
+
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            conversations = json.load(f)
+
+        temp_path = self.path.with_name(self.path.name + '.import')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for conversation in conversations:
+                f.write(json.dumps(conversation, ensure_ascii=False) + '\n')
+        os.replace(temp_path, self.path)
+        print(f"Converted {len(conversations)} conversations from {self.legacy_path} to {self.path}")
+
+
+def _parse(line):
+    """Decode one log line, or None if it is blank or torn."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+
+class UserStore:
+    """
+    Registered users from users_db.json, keyed by lowercase email.
+
+    The file is parsed once per process and kept as a dict, so logins are a
+    dictionary lookup plus one stat() call. If another process rewrites the
+    file (detected by mtime, size and inode) it is reloaded before the next
+    lookup. Registrations are written through under an exclusive lock to a
+    temp file that is fsynced and renamed over the original, so readers
+    never see a half-written file.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or os.getenv('USERS_DB_FILE', 'users_db.json'))
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self._lock = threading.RLock()
+        self._users = {}
+        self._stamp = None
+
+    def get(self, email):
+        """Return the user dict for an email, or None."""
+        with self._lock:
+            self._reload_if_changed()
+            return self._users.get((email or '').lower())
+
+    def __contains__(self, email):
+        return self.get(email) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._reload_if_changed()
+            return len(self._users)
+
+    def add(self, email, user):
+        """Persist a new user. Returns False if the email is already registered."""
+        email = email.lower()
+        with self._lock, file_lock(self.lock_path):
+            # Pick up registrations other processes made since our last read
+            self._reload_if_changed()
+            if email in self._users:
+                return False
+
+            users = dict(self._users)
+            users[email] = user
+            self._write(users)
+            self._users = users
+            return True
+
+    def _reload_if_changed(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._users, self._stamp = {}, None
+            return
+
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._stamp:
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            users = json.load(f)
+        self._users = {email.lower(): user for email, user in users.items()}
+        self._stamp = stamp
+
+    def _write(self, users):
+        """Atomically replace the file: write a temp copy, fsync, rename."""
+        temp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(users, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+        stat = os.stat(self.path)
+        self._stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
@@ -0,0 +1,325 @@
+"""
+JSON to SQL Migration Engine for Student Q&A Chatbot
+Streams users_db.json and the conversation log into the database in resumable batches
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from models import db, User, Conversation, MigrationCheckpoint
+from rollups import record_conversation_rows
+from counters import record_user_activity
+
+
+class JsonStreamReader:
+    """Incrementally decodes the items of a top-level JSON array or object."""
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+
+    def iter_array(self):
+        """Yield each element of a top-level array."""
+        self._expect('[')
+        if self._peek() == ']':
+            return
+        while True:
+            yield self._value()
+            if not self._next_item(']'):
+                return
+
+    def iter_object(self):
+        """Yield (key, value) for each member of a top-level object."""
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            yield key, self._value()
+            if not self._next_item('}'):
+                return
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.pos += 1
+
+    def _next_item(self, closer):
+        """Consume ',' (more items follow) or the closing bracket."""
+        char = self._peek()
+        if char == ',':
+            self.pos += 1
+            return True
+        self._expect(closer)
+        return False
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number or literal touching the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp from the JSON files, falling back to now."""
+    if value:
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            pass
+    return datetime.utcnow()
+
+
+class JsonMigration:
+    """
+    Copies users_db.json and the conversation log into SQL.
+
+    Sources are parsed incrementally and inserted with one executemany per
+    `batch_size` rows, so memory stays bounded regardless of history size.
+    Existing user emails are prefetched once instead of queried per user.
+    Each batch commits together with a MigrationCheckpoint row recording
+    how far into its source it got, so an interrupted run resumes from the
+    last committed batch without duplicating rows, and re-running later
+    only copies what was appended since.
+    """
+
+    def __init__(self, users_path='users_db.json', log_path=None, legacy_path='qa_conversations.json',
+                 batch_size=None, progress_every=None):
+        self.users_path = Path(users_path)
+        self.log_path = Path(log_path or os.getenv('CONVERSATION_LOG', 'qa_conversations.jsonl'))
+        self.legacy_path = Path(legacy_path)
+        self.batch_size = batch_size or int(os.getenv('MIGRATION_BATCH_SIZE', 1000))
+        self.progress_every = progress_every or int(os.getenv('MIGRATION_PROGRESS_EVERY', 10000))
+        self.user_ids = {}
+
+    def run(self, reset=False):
+        """Migrate users then conversations; returns rows inserted per source."""
+        if reset:
+            MigrationCheckpoint.query.delete()
+            db.session.commit()
+
+        # One query for every existing account instead of one per migrated user
+        self.user_ids = dict(db.session.execute(db.select(User.email, User.id)).all())
+
+        results = {'users': 0, 'conversations': 0}
+        if self.users_path.exists():
+            results['users'] = self._migrate_users()
+
+        if self.log_path.exists():
+            results['conversations'] = self._migrate_conversation_log()
+        elif self.legacy_path.exists():
+            results['conversations'] = self._migrate_legacy_conversations()
+        return results
+
+    def _migrate_users(self):
+        source = f"users:{self.users_path.name}"
+        checkpoint = self._checkpoint(source)
+        progress = _Progress('users', checkpoint.rows)
+        batch, position = [], 0
+
+        with open(self.users_path, 'r', encoding='utf-8') as f:
+            for email, user_data in JsonStreamReader(f).iter_object():
+                position += 1
+                if position <= checkpoint.position:
+                    continue
+
+                email = email.lower()
+                if email in self.user_ids:
+                    continue
+
+                self.user_ids[email] = None  # id filled in once the batch is inserted
+                batch.append({
+                    'email': email,
+                    'password_hash': user_data.get('password_hash') or '',
+                    'first_name': user_data.get('firstName', ''),
+                    'last_name': user_data.get('lastName', ''),
+                    'student_id': user_data.get('studentId', ''),
+                    'course_section': user_data.get('courseSection', ''),
+                    'semester': user_data.get('semester', ''),
+                    'is_active': True,
+                    'created_at': parse_timestamp(user_data.get('created_at')),
+                })
+                if len(batch) >= self.batch_size:
+                    self._insert_users(batch, checkpoint, position, progress)
+                    batch = []
+
+        self._insert_users(batch, checkpoint, position, progress)
+        return progress.done()
+
+    def _insert_users(self, batch, checkpoint, position, progress):
+        if batch:
+            db.session.execute(db.insert(User), batch)
+            emails = [row['email'] for row in batch]
+            # Conversations link to the new ids
+            self.user_ids.update(db.session.execute(
+                db.select(User.email, User.id).where(User.email.in_(emails))
+            ).all())
+        self._commit(checkpoint, position, len(batch), progress)
+
+    def _migrate_conversation_log(self):
+        """Stream the JSONL log; the checkpoint is a byte offset."""
+        source = f"conversations:{self.log_path.name}"
+        checkpoint = self._checkpoint(source)
+        progress = _Progress('conversations', checkpoint.rows)
+        batch, position = [], checkpoint.position
+
+        # The log starts with the converted legacy array, element for element;
+        # skip whatever an earlier run already copied from that array
+        legacy = db.session.get(MigrationCheckpoint, f"conversations:{self.legacy_path.name}")
+        skip = legacy.position if legacy and not position else 0
+
+        with open(self.log_path, 'rb') as f:
+            if position:
+                f.seek(position - 1)
+                if f.read(1) != b'\n':
+                    # The log was compacted or replaced since the checkpoint was written
+                    raise ValueError(f"{self.log_path} no longer matches its migration checkpoint; "
+                                     f"run again with reset=True")
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Still being written; picked up by the next run
+                    break
+                position += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+
+                batch.append(self._conversation_row(record))
+                if len(batch) >= self.batch_size:
+                    self._insert_conversations(batch, checkpoint, position, progress)
+                    batch = []
+
+        self._insert_conversations(batch, checkpoint, position, progress)
+        return progress.done()
+
+    def _migrate_legacy_conversations(self):
+        """Stream the legacy JSON array; the checkpoint is an element count."""
+        source = f"conversations:{self.legacy_path.name}"
+        checkpoint = self._checkpoint(source)
+        progress = _Progress('conversations', checkpoint.rows)
+        batch, position = [], 0
+
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            for record in JsonStreamReader(f).iter_array():
+                position += 1
+                if position <= checkpoint.position:
+                    continue
+
+                batch.append(self._conversation_row(record))
+                if len(batch) >= self.batch_size:
+                    self._insert_conversations(batch, checkpoint, position, progress)
+                    batch = []
+
+        self._insert_conversations(batch, checkpoint, position, progress)
+        return progress.done()
+
+    def _insert_conversations(self, batch, checkpoint, position, progress):
+        if batch:
+            db.session.execute(db.insert(Conversation), batch)
+            record_conversation_rows(batch)
+            record_user_activity(batch)
+        self._commit(checkpoint, position, len(batch), progress)
+
+    def _conversation_row(self, record):
+        user_info = record.get('user_info') or {}
+        is_registered = bool(user_info.get('is_registered'))
+        # Registered users are linked; guests keep their details on the row
+        guest = {} if is_registered else user_info
+
+        return {
+            'question': record.get('question', ''),
+            'answer': record.get('answer', ''),
+            'session_id': record.get('session_id', ''),
+            'user_id': self.user_ids.get((user_info.get('email') or '').lower()) if is_registered else None,
+            'is_guest': not is_registered,
+            'guest_first_name': guest.get('firstName', '') if guest else None,
+            'guest_last_name': guest.get('lastName', '') if guest else None,
+            'guest_student_id': guest.get('studentId', '') if guest else None,
+            'guest_email': guest.get('email', '') if guest else None,
+            'guest_course_section': guest.get('courseSection', '') if guest else None,
+            'guest_semester': guest.get('semester', '') if guest else None,
+            'timestamp': parse_timestamp(record.get('timestamp')),
+        }
+
+    def _checkpoint(self, source):
+        checkpoint = db.session.get(MigrationCheckpoint, source)
+        if checkpoint is None:
+            checkpoint = MigrationCheckpoint(source=source, position=0, rows=0)
+            db.session.add(checkpoint)
+        elif checkpoint.position:
+            print(f"Resuming {source} from position {checkpoint.position} ({checkpoint.rows} rows already migrated)")
+        return checkpoint
+
+    def _commit(self, checkpoint, position, count, progress):
+        """Commit the batch and its checkpoint in the same transaction."""
+        if position == checkpoint.position and not count:
+            return
+        checkpoint.position = position
+        checkpoint.rows += count
+        db.session.commit()
+        progress.add(count, self.progress_every)
+
+
+class _Progress:
+    """Prints rows/sec progress for one source."""
+
+    def __init__(self, label, previous_rows):
+        self.label = label
+        self.previous_rows = previous_rows
+        self.rows = 0
+        self.last_report = 0
+        self.start = time.monotonic()
+
+    def add(self, count, every):
+        self.rows += count
+        if self.rows - self.last_report >= every:
+            self.last_report = self.rows
+            self._print()
+
+    def done(self):
+        self._print(final=True)
+        return self.rows
+
+    def _print(self, final=False):
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        status = "Migrated" if final else "  ..."
+        print(f"{status} {self.rows:,} {self.label} in {elapsed:.1f}s "
+              f"({self.rows / elapsed:,.0f} rows/sec, {self.previous_rows + self.rows:,} total)")
@@ -0,0 +1,341 @@
+"""
+LLM Call Utilities
+Pluggable chat completion providers, pooled HTTP transport, latency tracking and hedged requests
+"""
+
+import hashlib
+import importlib
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_MODEL = "mistral-small-latest"
+
+
+def _env_bool(name, default=False):
+    """Read a true/false flag from the environment."""
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+class LatencyTracker:
+    """Rolling window of recently observed upstream latencies (in seconds)."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """Record one observed latency."""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        """Return the pct-th percentile of the window, or None if it is empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class HedgedCompleter:
+    """
+    Wraps a chat completion call with optional request hedging.
+
+    When hedging is enabled and the primary call has not returned within the
+    configured percentile of recent latency, one backup call is fired and the
+    first successful response wins. The loser's result is discarded, but a
+    call already running cannot be stopped: it keeps its upstream request
+    and worker thread until it returns or hits LLM_READ_TIMEOUT. So hedges
+    are capped as a fraction of recent requests, as an absolute number per
+    minute, and by how many hedged pairs may be unfinished at once
+    (LLM_HEDGE_MAX_IN_FLIGHT); that last cap keeps abandoned calls from
+    filling the worker pool. An optional deadline bounds the whole call; calls
+    still running when it passes are abandoned the same way.
+    """
+
+    def __init__(self, complete_fn, enabled=None, percentile=None, max_hedge_rate=None,
+                 max_hedges_per_minute=None, min_samples=None, max_workers=None, max_in_flight=None):
+        self.complete_fn = complete_fn
+        self.enabled = _env_bool('LLM_HEDGING_ENABLED') if enabled is None else enabled
+        self.percentile = percentile if percentile is not None else float(os.getenv('LLM_HEDGE_PERCENTILE', 95))
+        self.max_hedge_rate = max_hedge_rate if max_hedge_rate is not None else float(os.getenv('LLM_HEDGE_MAX_RATE', 0.1))
+        self.max_hedges_per_minute = (max_hedges_per_minute if max_hedges_per_minute is not None
+                                      else int(os.getenv('LLM_HEDGE_MAX_PER_MINUTE', 30)))
+        self.min_samples = min_samples if min_samples is not None else int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20))
+        self.max_in_flight = (max_in_flight if max_in_flight is not None
+                              else int(os.getenv('LLM_HEDGE_MAX_IN_FLIGHT', 4)))
+
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('LLM_HEDGE_WORKERS', 32)),
+            thread_name_prefix='llm-hedge'
+        )
+        self._lock = threading.Lock()
+        self._recent_requests = deque(maxlen=500)  # True if that request was hedged
+        self._recent_hedge_times = deque()
+        self._hedges_in_flight = 0  # hedged pairs with a call still running
+        self._counters = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_denied': 0}
+
+    def complete(self, deadline=None, **kwargs):
+        """
+        Run a chat completion, hedging it if the primary call is slow.
+
+        If `deadline` (seconds) passes before any call succeeds, raises TimeoutError.
+        """
+        if not self.enabled and deadline is None:
+            return self._timed_call(kwargs)
+
+        start = time.monotonic()
+        primary = self._executor.submit(self._timed_call, kwargs)
+        futures = [primary]
+        backup = None
+
+        if self.enabled:
+            delay = self.hedge_delay()
+            if delay is not None and (deadline is None or delay < deadline):
+                done, _ = wait([primary], timeout=delay)
+                if not done and self._acquire_hedge():
+                    backup = self._executor.submit(self._timed_call, kwargs)
+                    futures.append(backup)
+                    self._release_hedge_when_done(futures)
+            self._record_request(hedged=backup is not None)
+
+        pending = set(futures)
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - (time.monotonic() - start))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                for future in pending:
+                    future.cancel()
+                raise TimeoutError(f"LLM call exceeded {deadline:.1f}s deadline")
+
+            for future in sorted(done, key=lambda f: f.exception() is not None):
+                if future.exception() is None or not pending:
+                    for loser in pending:
+                        loser.cancel()
+                    if future is backup and future.exception() is None:
+                        with self._lock:
+                            self._counters['hedge_wins'] += 1
+                    return future.result()
+
+    def hedge_delay(self):
+        """Seconds to wait on the primary before hedging, or None if not enough data yet."""
+        if len(self.latency) < self.min_samples:
+            return None
+        return self.latency.percentile(self.percentile)
+
+    def stats(self):
+        """Return hedging counters for monitoring."""
+        with self._lock:
+            counters = dict(self._counters)
+            recent = list(self._recent_requests)
+
+        hedged = counters['hedged']
+        return {
+            'enabled': self.enabled,
+            'requests': counters['requests'],
+            'hedged': hedged,
+            'hedge_wins': counters['hedge_wins'],
+            'budget_denied': counters['budget_denied'],
+            'hedge_rate': hedged / counters['requests'] if counters['requests'] else 0.0,
+            'recent_hedge_rate': sum(recent) / len(recent) if recent else 0.0,
+            'win_rate': counters['hedge_wins'] / hedged if hedged else 0.0,
+            'hedge_delay_seconds': self.hedge_delay(),
+            'latency_p50_seconds': self.latency.percentile(50),
+            'latency_p99_seconds': self.latency.percentile(99),
+            'max_hedge_rate': self.max_hedge_rate,
+            'max_hedges_per_minute': self.max_hedges_per_minute,
+            'hedges_in_flight': self._hedges_in_flight,
+            'max_hedges_in_flight': self.max_in_flight
+        }
+
+    def _timed_call(self, kwargs):
+        """Call the upstream and record its latency on success."""
+        start = time.monotonic()
+        result = self.complete_fn(**kwargs)
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def _record_request(self, hedged):
+        with self._lock:
+            self._counters['requests'] += 1
+            if hedged:
+                self._counters['hedged'] += 1
+            self._recent_requests.append(hedged)
+
+    def _acquire_hedge(self):
+        """Check the hedge rate and per-minute caps; reserve a hedge if allowed."""
+        now = time.monotonic()
+        with self._lock:
+            while self._recent_hedge_times and now - self._recent_hedge_times[0] > 60:
+                self._recent_hedge_times.popleft()
+
+            recent = list(self._recent_requests)
+            rate = (sum(recent) + 1) / (len(recent) + 1)
+
+            if (rate > self.max_hedge_rate or len(self._recent_hedge_times) >= self.max_hedges_per_minute
+                    or self._hedges_in_flight >= self.max_in_flight):
+                self._counters['budget_denied'] += 1
+                return False
+
+            self._recent_hedge_times.append(now)
+            self._hedges_in_flight += 1
+            return True
+
+    def _release_hedge_when_done(self, futures):
+        """Give the in-flight slot back once both calls of a hedged pair have finished, winner or not."""
+        remaining = [len(futures)]
+
+        def finished(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    self._hedges_in_flight -= 1
+
+        for future in futures:
+            future.add_done_callback(finished)
+
+
+# ============================================================================
+# PROVIDERS
+# ============================================================================
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """
+    Return the worker-wide pooled, keep-alive HTTP client.
+
+    Created lazily so each gunicorn worker builds its own pool after forking;
+    all threads in the worker then share its connections.
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                import httpx
+
+                pool_size = int(os.getenv('LLM_POOL_SIZE', 20))
+                _http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=pool_size,
+                        max_keepalive_connections=pool_size,
+                        keepalive_expiry=float(os.getenv('LLM_KEEPALIVE_SECONDS', 60))
+                    ),
+                    timeout=httpx.Timeout(
+                        float(os.getenv('LLM_READ_TIMEOUT', 60)),
+                        connect=float(os.getenv('LLM_CONNECT_TIMEOUT', 5))
+                    )
+                )
+    return _http_client
+
+
+class LLMProvider:
+    """Base class for chat completion backends."""
+    
+    name = 'base'
+
+    def __init__(self, default_model=None):
+        self.default_model = default_model or os.getenv('LLM_MODEL', DEFAULT_MODEL)
+
+    def complete(self, messages, model=None, max_tokens=None):
+        """Return the assistant's reply text for a list of chat messages."""
+        raise NotImplementedError
+
+    def info(self):
+        """Describe the provider for monitoring."""
+        return {'name': self.name, 'default_model': self.default_model}
+
+
+class MistralProvider(LLMProvider):
+    """Mistral AI chat completions over the shared pooled HTTP client."""
+    
+    name = 'mistral'
+
+    def __init__(self, default_model=None, api_key=None):
+        super().__init__(default_model)
+        api_key = api_key or os.getenv("MISTRAL_API_KEY")
+        if not api_key or api_key == "your_mistral_api_key_here":
+            raise ValueError("MISTRAL_API_KEY not found in .env file")
+
+        from mistralai import Mistral
+        self.client = Mistral(api_key=api_key, client=get_http_client())
+
+    def complete(self, messages, model=None, max_tokens=None):
+        options = {}
+        if max_tokens:
+            options['max_tokens'] = max_tokens
+
+        response = self.client.chat.complete(
+            model=model or self.default_model,
+            messages=messages,
+            **options
+        )
+        return response.choices[0].message.content
+
+    def info(self):
+        info = super().info()
+        info['pool_size'] = int(os.getenv('LLM_POOL_SIZE', 20))
+        return info
+
+
+class LocalProvider(LLMProvider):
+    """
+    Deterministic offline provider for tests and benchmarks.
+
+    Replies are derived from the request only, so the same question always
+    gets the same answer. LLM_LOCAL_LATENCY_MS adds simulated latency.
+    """
+    
+    name = 'local'
+
+    def __init__(self, default_model=None, latency_ms=None):
+        super().__init__(default_model or os.getenv('LLM_MODEL', 'local-echo'))
+        self.latency_ms = latency_ms if latency_ms is not None else float(os.getenv('LLM_LOCAL_LATENCY_MS', 0))
+
+    def complete(self, messages, model=None, max_tokens=None):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+        question = messages[-1]['content'] if messages else ''
+        digest = hashlib.sha256(
+            "".join(m['content'] for m in messages).encode('utf-8')
+        ).hexdigest()[:12]
+        answer = f"[{model or self.default_model}] Local answer {digest} for: {question}"
+        return answer[:max_tokens * 4] if max_tokens else answer
+
+
+PROVIDERS = {
+    'mistral': MistralProvider,
+    'local': LocalProvider,
+}
+
+
+def get_provider(name=None, **kwargs):
+    """
+    Create the configured provider.
+
+    `name` (or LLM_PROVIDER) is a key of PROVIDERS or a dotted 'module:Class'
+    path, so new backends can be plugged in through configuration alone.
+    """
+    name = name or os.getenv('LLM_PROVIDER', 'mistral')
+
+    if ':' in name:
+        module_name, class_name = name.split(':', 1)
+        provider_class = getattr(importlib.import_module(module_name), class_name)
+    elif name in PROVIDERS:
+        provider_class = PROVIDERS[name]
+    else:
+        raise ValueError(f"Unknown LLM provider: {name}")
+
+    return provider_class(**kwargs)
@@ -44,12 +44,14 @@ def main():
         choice = input("\nEnter your choice (1-4): ").strip()
         
         if choice == '1':
+            print("\nAn interrupted migration resumes from its last committed batch;")
+            print("re-running later only copies conversations added since.")
             confirm = input("\nThis will migrate all JSON data to SQL. Continue? (yes/no): ")
             if confirm.lower() == 'yes':
                 migrate_json_to_db()
                 print("\n✓ Migration complete!")
                 print("\nDatabase statistics:")
-                stats = get_database_stats()
+                stats = get_database_stats(fresh=True)
                 for key, value in stats.items():
                     print(f"  {key.replace('_', ' ').title()}: {value}")
             else:
@@ -73,7 +75,7 @@ def main():
         elif choice == '3':
             print("\nDatabase Statistics:")
             print("-" * 40)
-            stats = get_database_stats()
+            stats = get_database_stats(fresh=True)
             for key, value in stats.items():
                 print(f"  {key.replace('_', ' ').title()}: {value}")
         
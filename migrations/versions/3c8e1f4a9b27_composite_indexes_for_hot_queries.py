@@ -0,0 +1,70 @@
+"""Composite indexes for hot conversation and user queries
+
+Revision ID: 3c8e1f4a9b27
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+Baseline for databases created by db.create_all(). Adds the indexes the
+paginated listings need and drops the single-column user_id index the
+(user_id, timestamp) one makes redundant. Indexes that already exist are
+left alone, so this is safe on databases create_all() has just built.
+
+On PostgreSQL the indexes are built CONCURRENTLY so the tables stay
+writable while they build.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e1f4a9b27'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+NEW_INDEXES = [
+    ('ix_conversations_user_id_timestamp', 'conversations', ['user_id', 'timestamp']),
+    ('ix_conversations_is_guest_timestamp', 'conversations', ['is_guest', 'timestamp']),
+    ('ix_users_created_at', 'users', ['created_at']),
+]
+REDUNDANT_INDEXES = [
+    ('ix_conversations_user_id', 'conversations', ['user_id']),
+]
+
+
+def _existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def _create(indexes):
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    for name, table, columns in indexes:
+        if name in _existing_indexes(table):
+            continue
+        if concurrently:
+            with op.get_context().autocommit_block():
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+        else:
+            op.create_index(name, table, columns)
+
+
+def _drop(indexes):
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    for name, table, _ in indexes:
+        if name not in _existing_indexes(table):
+            continue
+        if concurrently:
+            with op.get_context().autocommit_block():
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+        else:
+            op.drop_index(name, table_name=table)
+
+
+def upgrade():
+    _create(NEW_INDEXES)
+    _drop(REDUNDANT_INDEXES)
+
+
+def downgrade():
+    _create(REDUNDANT_INDEXES)
+    _drop(NEW_INDEXES)
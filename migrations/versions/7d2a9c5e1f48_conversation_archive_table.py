@@ -0,0 +1,48 @@
+"""Conversation archive table
+
+Revision ID: 7d2a9c5e1f48
+Revises: 3c8e1f4a9b27
+Create Date: 2026-10-19 12:00:00.000000
+
+Adds conversations_archive, where archive.py moves conversations from
+closed semesters. Skipped when db.create_all() has already built it.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2a9c5e1f48'
+down_revision = '3c8e1f4a9b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('conversations_archive'):
+        return
+    op.create_table(
+        'conversations_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('session_id', sa.String(length=100), nullable=False),
+        sa.Column('question', sa.Text(), nullable=False),
+        sa.Column('answer', sa.Text(), nullable=False),
+        sa.Column('guest_first_name', sa.String(length=100), nullable=True),
+        sa.Column('guest_last_name', sa.String(length=100), nullable=True),
+        sa.Column('guest_student_id', sa.String(length=50), nullable=True),
+        sa.Column('guest_email', sa.String(length=120), nullable=True),
+        sa.Column('guest_course_section', sa.String(length=50), nullable=True),
+        sa.Column('guest_semester', sa.String(length=50), nullable=True),
+        sa.Column('is_guest', sa.Boolean(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_conversations_archive_user_id_timestamp', 'conversations_archive', ['user_id', 'timestamp'])
+    op.create_index('ix_conversations_archive_timestamp', 'conversations_archive', ['timestamp'])
+    op.create_index('ix_conversations_archive_archived_at', 'conversations_archive', ['archived_at'])
+
+
+def downgrade():
+    op.drop_table('conversations_archive')
@@ -0,0 +1,64 @@
+"""Backup watermarks and deleted_rows
+
+Revision ID: b41e6d7c2a90
+Revises: 7d2a9c5e1f48
+Create Date: 2026-10-19 15:00:00.000000
+
+Adds updated_at to conversations and conversations_archive, the column
+incremental backups follow so they also pick up edits and re-assignments,
+and deleted_rows, where deletes are recorded for incrementals to replay.
+Existing rows keep a NULL updated_at and only go into full backups.
+Anything db.create_all() has already added is left alone.
+
+On PostgreSQL the indexes are built CONCURRENTLY so the tables stay
+writable while they build.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41e6d7c2a90'
+down_revision = '7d2a9c5e1f48'
+branch_labels = None
+depends_on = None
+
+WATERMARKED_TABLES = ['conversations', 'conversations_archive']
+
+
+def _create_index(name, table, columns):
+    if name in {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}:
+        return
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+    else:
+        op.create_index(name, table, columns)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table in WATERMARKED_TABLES:
+        if 'updated_at' not in {column['name'] for column in inspector.get_columns(table)}:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        _create_index(f'ix_{table}_updated_at', table, ['updated_at'])
+
+    if not inspector.has_table('deleted_rows'):
+        op.create_table(
+            'deleted_rows',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('table_name', sa.String(length=50), nullable=False),
+            sa.Column('row_id', sa.Integer(), nullable=False),
+            sa.Column('deleted_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_deleted_rows_deleted_at', 'deleted_rows', ['deleted_at'])
+
+
+def downgrade():
+    op.drop_table('deleted_rows')
+    for table in WATERMARKED_TABLES:
+        op.drop_index(f'ix_{table}_updated_at', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,49 @@
+"""User activity counters
+
+Revision ID: c5f83a1d6e02
+Revises: b41e6d7c2a90
+Create Date: 2026-10-20 09:00:00.000000
+
+Adds the per-user counters (conversation_count, last_activity_at and the
+recent-activity window) to users and fills them in from the conversations
+already stored, archived ones included. Columns db.create_all() has already
+added are left alone; the backfill only runs when a column was added.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f83a1d6e02'
+down_revision = 'b41e6d7c2a90'
+branch_labels = None
+depends_on = None
+
+COUNTER_COLUMNS = [
+    sa.Column('conversation_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=True),
+    sa.Column('recent_activity', sa.String(length=100), nullable=True),
+    sa.Column('recent_activity_day', sa.Date(), nullable=True),
+]
+
+
+def upgrade():
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('users')}
+    missing = [column for column in COUNTER_COLUMNS if column.name not in existing]
+    if not missing:
+        return
+
+    with op.batch_alter_table('users') as batch_op:
+        for column in missing:
+            batch_op.add_column(column)
+
+    # The same recount `python counters.py --reconcile` runs, in this transaction
+    from counters import reconcile_counters
+    drifted = reconcile_counters(connection=op.get_bind())
+    print(f"User counters filled in for {drifted} users")
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        for column in reversed(COUNTER_COLUMNS):
+            batch_op.drop_column(column.name)
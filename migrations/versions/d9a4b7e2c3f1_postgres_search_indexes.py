@@ -0,0 +1,118 @@
+"""PostgreSQL search column and indexes
+
+Revision ID: d9a4b7e2c3f1
+Revises: c5f83a1d6e02
+Create Date: 2026-10-20 12:00:00.000000
+
+Adds conversations.search_vector with the GIN index ranked search uses, and
+the pg_trgm indexes behind substring user search. These used to be created
+at app startup; here they are built without blocking writes:
+
+* search_vector is a plain column kept current by a trigger, not a
+  GENERATED ... STORED one, whose ADD COLUMN rewrites the whole table under
+  an ACCESS EXCLUSIVE lock. Existing rows are filled in BACKFILL_BATCH_SIZE
+  at a time, each batch committed on its own.
+* Indexes are built CONCURRENTLY. An invalid index left by an interrupted
+  build is dropped and built again.
+
+Databases where startup already added the generated column keep it. On
+SQLite the FTS5 tables are still created at startup by search.py; nothing
+here applies.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a4b7e2c3f1'
+down_revision = 'c5f83a1d6e02'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+USER_SEARCH_COLUMNS = ['email', 'first_name', 'last_name', 'student_id']
+
+# Question weighted above answer; kept in step with the ranking in search.py
+SEARCH_VECTOR = ("setweight(to_tsvector('english', coalesce({row}question, '')), 'A') || "
+                 "setweight(to_tsvector('english', coalesce({row}answer, '')), 'B')")
+
+SEARCH_FUNCTION = f"""CREATE OR REPLACE FUNCTION conversations_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql"""
+
+SEARCH_TRIGGER = """CREATE TRIGGER conversations_search_vector
+    BEFORE INSERT OR UPDATE OF question, answer ON conversations
+    FOR EACH ROW EXECUTE FUNCTION conversations_search_vector_update()"""
+
+
+def _index_state(name):
+    """True if the index is valid, False if a failed build left it invalid, None if it does not exist."""
+    return op.get_bind().execute(
+        sa.text("SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = :name"),
+        {'name': name}
+    ).scalar()
+
+
+def _create_index(name, table, definition):
+    state = _index_state(name)
+    if state:
+        return
+    with op.get_context().autocommit_block():
+        if state is False:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        op.execute(f"CREATE INDEX CONCURRENTLY {name} ON {table} USING {definition}")
+
+
+def _drop_index(name):
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def _backfill():
+    """Fill search_vector for existing rows in short, separately committed batches."""
+    bind = op.get_bind()
+    last_id = 0
+    with op.get_context().autocommit_block():
+        while True:
+            ids = bind.execute(sa.text(
+                f"WITH batch AS (SELECT id FROM conversations WHERE id > :last_id ORDER BY id LIMIT :limit) "
+                f"UPDATE conversations SET search_vector = {SEARCH_VECTOR.format(row='conversations.')} "
+                f"FROM batch WHERE conversations.id = batch.id RETURNING conversations.id"
+            ), {'last_id': last_id, 'limit': BACKFILL_BATCH_SIZE}).scalars().all()
+            if not ids:
+                return
+            last_id = max(ids)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('conversations')}
+    if 'search_vector' not in columns:
+        # Adding a nullable column without a default only touches the catalog
+        op.execute("ALTER TABLE conversations ADD COLUMN search_vector tsvector")
+        op.execute(SEARCH_FUNCTION)
+        op.execute(SEARCH_TRIGGER)
+        # New and edited rows are covered by the trigger from here on
+        _backfill()
+    _create_index('ix_conversations_search_vector', 'conversations', 'GIN (search_vector)')
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in USER_SEARCH_COLUMNS:
+        _create_index(f'ix_users_{column}_trgm', 'users', f'GIN ({column} gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for column in USER_SEARCH_COLUMNS:
+        _drop_index(f'ix_users_{column}_trgm')
+    _drop_index('ix_conversations_search_vector')
+    op.execute("DROP TRIGGER IF EXISTS conversations_search_vector ON conversations")
+    op.execute("DROP FUNCTION IF EXISTS conversations_search_vector_update()")
+    op.execute("ALTER TABLE conversations DROP COLUMN IF EXISTS search_vector")
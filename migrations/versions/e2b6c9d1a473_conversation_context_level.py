@@ -0,0 +1,37 @@
+"""Conversation context level
+
+Revision ID: e2b6c9d1a473
+Revises: d9a4b7e2c3f1
+Create Date: 2026-10-20 15:00:00.000000
+
+Adds context_level to conversations and conversations_archive: the level
+of the context adjustment an answer was built with, so adjustments can be
+tied to the answers they affected. Existing rows keep NULL. Columns
+db.create_all() has already added are left alone.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b6c9d1a473'
+down_revision = 'd9a4b7e2c3f1'
+branch_labels = None
+depends_on = None
+
+TABLES = ['conversations', 'conversations_archive']
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table in TABLES:
+        if 'context_level' in {column['name'] for column in inspector.get_columns(table)}:
+            continue
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('context_level', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('context_level')
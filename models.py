@@ -6,13 +6,21 @@ SQLAlchemy models for PostgreSQL (Heroku-ready, AWS-compatible)
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Days covered by User.recent_activity
+RECENT_ACTIVITY_DAYS = 7
 
 
 class User(db.Model):
     """User model for registered students."""
     __tablename__ = 'users'
+    __table_args__ = (
+        # Newest-first user listings page on (created_at, id)
+        db.Index('ix_users_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
@@ -26,6 +34,13 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Activity counters, maintained by counters.py as conversations are written
+    conversation_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_activity_at = db.Column(db.DateTime)
+    # Comma-separated conversations per day, newest first, for the days up to recent_activity_day
+    recent_activity = db.Column(db.String(100))
+    recent_activity_day = db.Column(db.Date)
+    
     # Relationships
     conversations = db.relationship('Conversation', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     
@@ -37,6 +52,23 @@ class User(db.Model):
         """Verify password against hash."""
         return check_password_hash(self.password_hash, password)
     
+    @staticmethod
+    def align_activity(recent_activity, recent_activity_day, today):
+        """Daily counts from a stored recent_activity value, shifted so index 0 is `today`."""
+        counts = [int(n) for n in recent_activity.split(',')] if recent_activity else []
+        counts = (counts + [0] * RECENT_ACTIVITY_DAYS)[:RECENT_ACTIVITY_DAYS]
+        if recent_activity_day is None:
+            return [0] * RECENT_ACTIVITY_DAYS
+        shift = (today - recent_activity_day).days
+        if shift <= 0:
+            return counts
+        return ([0] * shift + counts)[:RECENT_ACTIVITY_DAYS]
+    
+    def recent_conversation_count(self, days=RECENT_ACTIVITY_DAYS):
+        """Conversations in the last `days` UTC days (today included), from the stored counters."""
+        counts = self.align_activity(self.recent_activity, self.recent_activity_day, datetime.utcnow().date())
+        return sum(counts[:days])
+    
     def to_dict(self):
         """Convert user to dictionary."""
         return {
@@ -49,7 +81,8 @@ class User(db.Model):
             'semester': self.semester,
             'isActive': self.is_active,
             'createdAt': self.created_at.isoformat() if self.created_at else None,
-            'conversationCount': self.conversations.count()
+            'conversationCount': self.conversation_count or 0,
+            'lastActivityAt': self.last_activity_at.isoformat() if self.last_activity_at else None
         }
     
     def __repr__(self):
@@ -59,9 +92,15 @@ class User(db.Model):
 class Conversation(db.Model):
     """Conversation model for Q&A pairs."""
     __tablename__ = 'conversations'
+    __table_args__ = (
+        # A user's conversations newest first (history, API, user detail); also serves user_id lookups
+        db.Index('ix_conversations_user_id_timestamp', 'user_id', 'timestamp'),
+        # Registered-only / guest-only listings and date ranges
+        db.Index('ix_conversations_is_guest_timestamp', 'is_guest', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     session_id = db.Column(db.String(100), nullable=False, index=True)
     question = db.Column(db.Text, nullable=False)
     answer = db.Column(db.Text, nullable=False)
@@ -76,6 +115,12 @@ class Conversation(db.Model):
     
     is_guest = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # ContextAdjustment level the answer was built with; NULL when it had the full context
+    context_level = db.Column(db.Integer)
+    # Last write (insert, edit or re-assignment); the incremental backup watermark
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    archived = False
     
     def to_dict(self):
         """Convert conversation to dictionary."""
@@ -117,6 +162,164 @@ class Conversation(db.Model):
         return f'<Conversation {self.id}>'
 
 
+class ArchivedConversation(db.Model):
+    """A conversation moved out of the conversations table by archive.py; keeps its original id."""
+    __tablename__ = 'conversations_archive'
+    __table_args__ = (
+        db.Index('ix_conversations_archive_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_conversations_archive_timestamp', 'timestamp'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # No foreign key: a deleted user's archived conversations are removed with them by admin.py
+    user_id = db.Column(db.Integer)
+    session_id = db.Column(db.String(100), nullable=False)
+    question = db.Column(db.Text, nullable=False)
+    answer = db.Column(db.Text, nullable=False)
+    
+    guest_first_name = db.Column(db.String(100))
+    guest_last_name = db.Column(db.String(100))
+    guest_student_id = db.Column(db.String(50))
+    guest_email = db.Column(db.String(120))
+    guest_course_section = db.Column(db.String(50))
+    guest_semester = db.Column(db.String(50))
+    
+    is_guest = db.Column(db.Boolean, default=False)
+    timestamp = db.Column(db.DateTime)
+    context_level = db.Column(db.Integer)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # Last write (archival or re-assignment); the incremental backup watermark
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    user = db.relationship('User', primaryjoin='foreign(ArchivedConversation.user_id) == User.id', viewonly=True)
+    
+    archived = True
+    to_dict = Conversation.to_dict
+    
+    def __repr__(self):
+        return f'<ArchivedConversation {self.id}>'
+
+
+# Columns a conversation keeps when it moves to the archive
+CONVERSATION_COLUMNS = ('id', 'user_id', 'session_id', 'question', 'answer', 'guest_first_name', 'guest_last_name',
+                        'guest_student_id', 'guest_email', 'guest_course_section', 'guest_semester', 'is_guest',
+                        'timestamp', 'context_level')
+
+
+def conversation_history(*columns):
+    """
+    Subquery over live and archived conversations together, with the given column names.
+    For counts that must not change when conversations are archived (rollups, user counters).
+    """
+    return db.union_all(
+        db.select(*[Conversation.__table__.c[name] for name in columns]),
+        db.select(*[ArchivedConversation.__table__.c[name] for name in columns]),
+    ).subquery('conversation_history')
+
+
+class ContextAdjustment(db.Model):
+    """
+    Reduced prompt context applied to an answer while latency SLOs were at risk.
+    The answer it affected carries the level in Conversation.context_level.
+    """
+    __tablename__ = 'context_adjustments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), nullable=False, index=True)
+    level = db.Column(db.Integer, nullable=False)
+    max_chunks = db.Column(db.Integer)
+    max_tokens = db.Column(db.Integer)
+    p95_latency = db.Column(db.Float)
+    queue_depth = db.Column(db.Integer)
+    reason = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    @classmethod
+    def from_profile(cls, session_id, profile):
+        """Build a record from a prompt builder profile, or None if nothing was adjusted."""
+        if not profile or (profile['level'] == 0 and profile['reason'] == 'steady'):
+            return None
+        
+        return cls(
+            session_id=session_id,
+            level=profile['level'],
+            max_chunks=profile['max_chunks'],
+            max_tokens=profile['max_tokens'],
+            p95_latency=profile['p95_latency'],
+            queue_depth=profile['queue_depth'],
+            reason=profile['reason']
+        )
+    
+    def to_dict(self):
+        """Convert adjustment to dictionary."""
+        return {
+            'id': self.id,
+            'session_id': self.session_id,
+            'level': self.level,
+            'max_chunks': self.max_chunks,
+            'max_tokens': self.max_tokens,
+            'p95_latency': self.p95_latency,
+            'queue_depth': self.queue_depth,
+            'reason': self.reason,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ContextAdjustment {self.session_id} level={self.level}>'
+
+
+class DailyConversationStat(db.Model):
+    """Conversations per UTC day, course section and guest/registered; maintained by rollups.py."""
+    __tablename__ = 'daily_conversation_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    course_section = db.Column(db.String(50), primary_key=True, default='')  # '' when unknown
+    is_guest = db.Column(db.Boolean, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyConversationStat {self.day} {self.course_section!r} guest={self.is_guest}: {self.count}>'
+
+
+class DailyUserStat(db.Model):
+    """Conversations per registered user per UTC day; maintained by rollups.py."""
+    __tablename__ = 'daily_user_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    # No foreign key: rows for a deleted user are cleared when their conversations go
+    user_id = db.Column(db.Integer, primary_key=True, index=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyUserStat {self.day} user={self.user_id}: {self.count}>'
+
+
+class DeletedRow(db.Model):
+    """A row deleted from a backed-up table, so incremental backups can replay the delete."""
+    __tablename__ = 'deleted_rows'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<DeletedRow {self.table_name} {self.row_id}>'
+
+
+class MigrationCheckpoint(db.Model):
+    """How far a JSON-to-SQL migration source has been copied; committed with each batch."""
+    __tablename__ = 'migration_checkpoints'
+    
+    source = db.Column(db.String(255), primary_key=True)
+    position = db.Column(db.BigInteger, nullable=False, default=0)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MigrationCheckpoint {self.source} at {self.position}>'
+
+
 class AdminUser(db.Model):
     """Admin user model for instructor access."""
     __tablename__ = 'admin_users'
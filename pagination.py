@@ -0,0 +1,171 @@
+"""
+Keyset Pagination for Student Q&A Chatbot
+Cursor-based paging on (sort column, id) so every page costs the same as the first
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from models import db
+
+COUNT_CACHE_TTL = int(os.getenv('PAGINATION_COUNT_TTL', 60))
+# Keys include free-text search terms, so the cache is bounded
+COUNT_CACHE_SIZE = int(os.getenv('PAGINATION_COUNT_CACHE_SIZE', 256))
+
+
+def encode_cursor(sort_value, row_id, direction='next'):
+    """Opaque, URL-safe token for the position just past (sort_value, row_id)."""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, row_id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (sort_value, row_id, direction) from a cursor token. Raises ValueError if it is malformed."""
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, row_id, direction = json.loads(payload)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {token!r}") from e
+    if not isinstance(row_id, int) or direction not in ('next', 'prev'):
+        raise ValueError(f"Invalid cursor: {token!r}")
+    return sort_value, row_id, direction
+
+
+_count_cache = OrderedDict()  # key -> (total, expires), least recently used first
+_count_lock = threading.Lock()
+
+
+def approximate_count(key, query, ttl=COUNT_CACHE_TTL):
+    """
+    COUNT(*) of `query`, cached per `key` for `ttl` seconds.
+
+    Totals are only for display ("about 1,234 conversations"), so a value a
+    minute old is fine and saves a full count on every page view. Expired
+    entries are dropped on insert, and the least recently used ones once
+    COUNT_CACHE_SIZE keys are cached.
+    """
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached and cached[1] > now:
+            _count_cache.move_to_end(key)
+            return cached[0]
+
+    total = query.order_by(None).count()
+    with _count_lock:
+        _count_cache[key] = (total, now + ttl)
+        _count_cache.move_to_end(key)
+        for stale in [k for k, (_, expires) in _count_cache.items() if expires <= now]:
+            del _count_cache[stale]
+        while len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return total
+
+
+class KeysetPage:
+    """One page of keyset-paginated results plus the cursors to move from it."""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def pages(self):
+        """Approximate page count, or None when no total was requested."""
+        if self.total is None:
+            return None
+        return max(1, -(-self.total // self.per_page))
+
+    def to_dict(self):
+        """The `pagination` envelope returned by the API."""
+        return {
+            'per_page': self.per_page,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'has_next': self.has_next,
+            'has_prev': self.has_prev,
+            'total_items': self.total,
+            'total_pages': self.pages,
+        }
+
+
+def keyset_query(query, sort_column, id_column, cursor=None):
+    """
+    `query` filtered to the rows past `cursor` and ordered for reading them.
+    Returns (query, direction); 'prev' pages come back oldest first.
+    Raises ValueError for a malformed cursor.
+    """
+    direction = 'next'
+    if cursor:
+        sort_value, row_id, direction = decode_cursor(cursor)
+        if isinstance(sort_column.type, db.DateTime) and sort_value is not None:
+            sort_value = datetime.fromisoformat(sort_value)
+        if direction == 'next':
+            query = query.filter(db.or_(sort_column < sort_value,
+                                        db.and_(sort_column == sort_value, id_column < row_id)))
+        else:
+            query = query.filter(db.or_(sort_column > sort_value,
+                                        db.and_(sort_column == sort_value, id_column > row_id)))
+
+    if direction == 'next':
+        return query.order_by(sort_column.desc(), id_column.desc()), direction
+    # Walk backwards from the cursor; the caller flips the rows back into display order
+    return query.order_by(sort_column.asc(), id_column.asc()), direction
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=20, page=None, count_key=None):
+    """
+    Page through `query` newest first on (sort_column, id_column).
+
+    Instead of OFFSET, each page seeks past the last row of the previous one
+    with `(sort, id) < (cursor sort, cursor id)`, which an index on the sort
+    column answers directly however deep the page is. The id breaks ties
+    between rows with the same sort value. `page` is honoured for old
+    clients that have no cursor yet; it uses OFFSET once and the returned
+    cursors take over from there. When `count_key` is given the page also
+    carries a cached approximate total.
+
+    Raises ValueError for a malformed cursor.
+    """
+    base_query = query
+    query, direction = keyset_query(query, sort_column, id_column, cursor)
+
+    offset = (page - 1) * per_page if not cursor and page and page > 1 else 0
+    rows = query.offset(offset).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    if direction == 'prev':
+        items.reverse()
+
+    def cursor_for(item, towards):
+        return encode_cursor(getattr(item, sort_column.key), getattr(item, id_column.key), towards)
+
+    # Going forwards there is always something behind a cursor; going back, always something ahead
+    if direction == 'next':
+        more_after, more_before = has_more, bool(cursor or offset)
+    else:
+        more_after, more_before = True, has_more
+
+    next_cursor = cursor_for(items[-1], 'next') if items and more_after else None
+    prev_cursor = cursor_for(items[0], 'prev') if items and more_before else None
+
+    total = approximate_count(count_key, base_query) if count_key else None
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total)
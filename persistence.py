@@ -0,0 +1,362 @@
+"""
+Write-Behind Persistence for Student Q&A Chatbot
+Buffers conversation inserts in memory and flushes them to the database in batches
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from flask import current_app
+from sqlalchemy.exc import OperationalError, InterfaceError
+
+from models import db, Conversation, ContextAdjustment
+from file_store import file_lock
+from rollups import record_conversation_rows
+from counters import record_user_activity
+from database import invalidate_database_stats
+
+# Models the writer may insert, keyed by table name (used in the spool file)
+WRITABLE_MODELS = {
+    Conversation.__tablename__: Conversation,
+    ContextAdjustment.__tablename__: ContextAdjustment,
+}
+
+DATETIME_FIELDS = ('timestamp', 'created_at')
+
+
+def conversation_row(question, answer, session_id, user_id=None, user_info=None, adjustment=None):
+    """Build the column values for a Conversation insert, with the level of any context adjustment row."""
+    # Every row carries the same keys so batches can use a single executemany
+    guest_info = user_info if (not user_id and user_info) else {}
+    return {
+        'question': question,
+        'answer': answer,
+        'session_id': session_id,
+        'user_id': user_id,
+        'is_guest': not user_id,
+        'guest_first_name': guest_info.get('firstName', '') if guest_info else None,
+        'guest_last_name': guest_info.get('lastName', '') if guest_info else None,
+        'guest_student_id': guest_info.get('studentId', '') if guest_info else None,
+        'guest_email': guest_info.get('email', '') if guest_info else None,
+        'guest_course_section': guest_info.get('courseSection', '') if guest_info else None,
+        'guest_semester': guest_info.get('semester', '') if guest_info else None,
+        'timestamp': datetime.utcnow(),
+        'context_level': adjustment['level'] if adjustment else None
+    }
+
+
+def adjustment_row(session_id, profile):
+    """Build the column values for a ContextAdjustment insert, or None if nothing was adjusted."""
+    adjustment = ContextAdjustment.from_profile(session_id, profile)
+    if adjustment is None:
+        return None
+
+    return {
+        'session_id': adjustment.session_id,
+        'level': adjustment.level,
+        'max_chunks': adjustment.max_chunks,
+        'max_tokens': adjustment.max_tokens,
+        'p95_latency': adjustment.p95_latency,
+        'queue_depth': adjustment.queue_depth,
+        'reason': adjustment.reason,
+        'created_at': datetime.utcnow()
+    }
+
+
+class ConversationWriter:
+    """
+    Write-behind queue for conversation inserts.
+
+    Requests enqueue rows and return immediately; a background thread
+    bulk-inserts them once `batch_size` rows are waiting or `flush_interval`
+    seconds have passed since the oldest one arrived. If the database is
+    unavailable the batch is appended to a local JSONL spool file, which is
+    replayed once writes succeed again. A batch the database rejects is
+    retried row by row, and rows it still rejects (say, for a user deleted
+    while they waited) go to a dead-letter file instead of holding up the
+    rest. Pending rows are flushed at shutdown.
+    """
+
+    def __init__(self, app, batch_size=None, flush_interval=None, spool_path=None, max_queue=None):
+        self.app = app
+        self.batch_size = batch_size or int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 100))
+        self.flush_interval = flush_interval or float(os.getenv('WRITE_BEHIND_FLUSH_SECONDS', 1.0))
+        self.spool_path = Path(spool_path or os.getenv('WRITE_BEHIND_SPOOL', 'conversation_spool.jsonl'))
+        # Shared by every process using the spool: appends and the replay claim must not interleave
+        self.spool_lock_path = self.spool_path.with_name(self.spool_path.name + '.lock')
+        self.dead_letter_path = Path(os.getenv('WRITE_BEHIND_DEAD_LETTER',
+                                               self.spool_path.with_name('conversation_dead_letter.jsonl')))
+        self.replay_interval = float(os.getenv('WRITE_BEHIND_REPLAY_SECONDS', 30))
+
+        self._queue = queue.Queue(maxsize=max_queue or int(os.getenv('WRITE_BEHIND_MAX_QUEUE', 10000)))
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._last_replay = 0.0
+        self.stats = {'enqueued': 0, 'flushed': 0, 'batches': 0, 'spooled': 0, 'replayed': 0, 'dead_lettered': 0}
+
+        atexit.register(self.stop)
+
+    def enqueue(self, table, row):
+        """Queue one row for `table` (a key of WRITABLE_MODELS)."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((table, row))
+            self.stats['enqueued'] += 1
+        except queue.Full:
+            # Never block a request on persistence; keep the row on disk instead
+            self._spool([(table, row)])
+
+    def flush(self, timeout=None):
+        """
+        Synchronously write everything currently queued, then wait (up to `timeout`
+        seconds) for the batch the background thread is writing, if any.
+        Returns False if that batch was still being written when the wait ran out.
+        """
+        while True:
+            batch = self._drain(timeout=0)
+            if not batch:
+                break
+            try:
+                self._write(batch)
+            finally:
+                self._done(batch)
+
+        if not (self._thread and self._thread.is_alive() and self._pid == os.getpid()):
+            return True
+        # Every queued row counts as unfinished until task_done, including the ones the thread holds
+        if timeout is None:
+            timeout = self.flush_interval + 30
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self):
+        """Stop the background thread and flush what is left."""
+        self._stopping.set()
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def pending(self):
+        """Approximate number of rows waiting to be written."""
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        """Start the flush thread (again after a fork, e.g. gunicorn --preload)."""
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='conversation-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._drain(timeout=self.flush_interval)
+            if batch:
+                try:
+                    self._write(batch)
+                finally:
+                    self._done(batch)
+            elif time.monotonic() - self._last_replay >= self.replay_interval:
+                self._last_replay = time.monotonic()
+                self.replay_spool()
+
+    def _drain(self, timeout):
+        """Collect up to batch_size rows, waiting at most flush_interval after the first."""
+        try:
+            batch = [self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic() if timeout else 0
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _done(self, batch):
+        for _ in batch:
+            self._queue.task_done()
+
+    def _write(self, batch):
+        """
+        Bulk insert a batch in one transaction. Returns False if the database was
+        unavailable and rows were spooled; rows it rejected are dead-lettered.
+        """
+        with self.app.app_context():
+            try:
+                self._insert(batch)
+            except Exception as e:
+                db.session.rollback()
+                if _unavailable(e):
+                    print(f"Error writing conversation batch, spooling {len(batch)} rows: {e}")
+                    self._spool(batch)
+                    return False
+                print(f"Conversation batch rejected ({e}); retrying {len(batch)} rows one by one")
+                return self._write_each(batch)
+        self.stats['flushed'] += len(batch)
+        self.stats['batches'] += 1
+        return True
+
+    def _write_each(self, batch):
+        """Insert rows one at a time, dead-lettering the ones the database rejects."""
+        for position, item in enumerate(batch):
+            try:
+                self._insert([item])
+            except Exception as e:
+                db.session.rollback()
+                if _unavailable(e):
+                    self._spool(batch[position:])
+                    return False
+                self._dead_letter(item, e)
+                continue
+            self.stats['flushed'] += 1
+        self.stats['batches'] += 1
+        return True
+
+    def _insert(self, batch):
+        grouped = {}
+        for table, row in batch:
+            grouped.setdefault(table, []).append(row)
+
+        for table, rows in grouped.items():
+            # Rows spooled by an older release can lack newer columns, and executemany needs one set of keys
+            keys = set().union(*rows)
+            if any(len(row) != len(keys) for row in rows):
+                grouped[table] = [{**dict.fromkeys(keys), **row} for row in rows]
+
+        for table in WRITABLE_MODELS:
+            if table in grouped:
+                db.session.execute(db.insert(WRITABLE_MODELS[table]), grouped[table])
+        if Conversation.__tablename__ in grouped:
+            # Core inserts skip the ORM listeners, so count them into the rollups and user counters here
+            record_conversation_rows(grouped[Conversation.__tablename__])
+            record_user_activity(grouped[Conversation.__tablename__])
+        db.session.commit()
+        if Conversation.__tablename__ in grouped:
+            invalidate_database_stats()
+
+    def _spool(self, batch):
+        """Append rows to the local spool file."""
+        if not batch:
+            return
+        with self._spool_lock, file_lock(self.spool_lock_path):
+            with open(self.spool_path, 'a', encoding='utf-8') as f:
+                for table, row in batch:
+                    f.write(json.dumps({'table': table, 'row': row}, default=_json_default, ensure_ascii=False) + '\n')
+        self.stats['spooled'] += len(batch)
+
+    def _dead_letter(self, item, error):
+        """Set aside a row the database will not accept, with the reason, for someone to look at."""
+        table, row = item
+        self._write_dead_letter({'table': table, 'row': row}, error)
+        print(f"Conversation row rejected, moved to {self.dead_letter_path}: {error}")
+
+    def _write_dead_letter(self, entry, error):
+        entry = dict(entry, error=str(error).splitlines()[0], failed_at=datetime.utcnow())
+        with self._spool_lock, file_lock(self.spool_lock_path):
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, default=_json_default, ensure_ascii=False) + '\n')
+        self.stats['dead_lettered'] += 1
+
+    def replay_spool(self):
+        """Re-insert spooled rows. Safe to call from several processes at once."""
+        if not self.spool_path.exists():
+            return 0
+
+        # Claim the spool atomically so only one process replays it. Under the lock, so no
+        # other process is part way through appending to the file being claimed.
+        claimed = self.spool_path.with_name(f"{self.spool_path.name}.{os.getpid()}.replay")
+        with self._spool_lock, file_lock(self.spool_lock_path):
+            try:
+                os.replace(self.spool_path, claimed)
+            except FileNotFoundError:
+                return 0
+
+        batch = []
+        with open(claimed, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    row = record['row']
+                    for field in DATETIME_FIELDS:
+                        if row.get(field):
+                            row[field] = datetime.fromisoformat(row[field])
+                    item = (record['table'], row)
+                except (ValueError, KeyError, TypeError) as e:
+                    # e.g. a line torn by a crash mid-append; keep it for inspection, replay the rest
+                    self._write_dead_letter({'line': line}, e)
+                    print(f"Unreadable spool line moved to {self.dead_letter_path}: {e}")
+                    continue
+                batch.append(item)
+
+        replayed = 0
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            if self._write(chunk):
+                replayed += len(chunk)
+            else:
+                # The database is unavailable and _write spooled what it could not write;
+                # put the rest back too and retry later
+                self._spool(batch[start + self.batch_size:])
+                break
+
+        claimed.unlink()
+        self.stats['replayed'] += replayed
+        if replayed:
+            print(f"Replayed {replayed} spooled conversation rows")
+        return replayed
+
+
+def _unavailable(error):
+    """Whether a write failed because the database could not be reached (worth retrying later)."""
+    return isinstance(error, (OperationalError, InterfaceError))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def init_write_behind(app):
+    """
+    Attach a write-behind writer to the app if WRITE_BEHIND_ENABLED (default false).
+    With it, new conversations have no id when the request returns and reach
+    history reads only once their batch is flushed.
+    """
+    if os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() not in ('1', 'true', 'yes', 'on'):
+        return None
+
+    writer = ConversationWriter(app)
+    app.extensions['conversation_writer'] = writer
+    return writer
+
+
+def get_conversation_writer():
+    """Return the current app's writer, or None if write-behind is disabled."""
+    return current_app.extensions.get('conversation_writer')
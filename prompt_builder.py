@@ -0,0 +1,123 @@
+"""
+Prompt Builder for Student Q&A Chatbot
+Builds LLM prompts and shrinks the course context automatically when latency SLOs are at risk
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from llm import LatencyTracker
+
+SYSTEM_PROMPT = (
+    "You are a helpful teaching assistant for INFO 6200, a Python coding course. "
+    "Answer student questions clearly and concisely based on the course materials provided. "
+    "If the answer isn't in the course materials, provide general Python guidance but mention "
+    "that students should verify with their professor."
+)
+
+# Context profiles from richest to leanest. max_chunks=None sends the whole corpus.
+CONTEXT_LEVELS = [
+    {'level': 0, 'max_chunks': None, 'max_tokens': None},
+    {'level': 1, 'max_chunks': 12, 'max_tokens': 1024},
+    {'level': 2, 'max_chunks': 6, 'max_tokens': 768},
+    {'level': 3, 'max_chunks': 3, 'max_tokens': 512},
+]
+
+
+class PromptBuilder:
+    """
+    Builds chat messages for a question and adapts how much context they carry.
+
+    Tracks recent upstream latency and the number of in-flight LLM calls. When
+    the p95 latency exceeds the SLO or the queue is deeper than allowed, it
+    steps down to a leaner context level (fewer retrieved corpus chunks and a
+    lower output token limit); when load drops well below the SLO it steps
+    back up. Level changes are rate limited by a cooldown to avoid flapping.
+    """
+
+    def __init__(self, corpus, slo_seconds=None, max_queue_depth=None, cooldown_seconds=None, min_samples=10):
+        self.corpus = corpus
+        self.slo_seconds = slo_seconds or float(os.getenv('LLM_LATENCY_SLO', 8))
+        self.max_queue_depth = max_queue_depth or int(os.getenv('LLM_MAX_QUEUE_DEPTH', 8))
+        self.cooldown_seconds = (cooldown_seconds if cooldown_seconds is not None
+                                 else float(os.getenv('LLM_CONTEXT_COOLDOWN', 15)))
+        self.min_samples = min_samples
+
+        self.latency = LatencyTracker(window=100)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._level = 0
+        self._last_change = 0.0
+
+    @contextmanager
+    def track(self):
+        """Wrap an upstream call to record its latency and the queue depth."""
+        with self._lock:
+            self._in_flight += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            # Timeouts and errors too: they are the slow calls the p95 has to see
+            self.latency.record(time.monotonic() - start)
+            with self._lock:
+                self._in_flight -= 1
+
+    def build(self, question):
+        """
+        Return (messages, profile) for a question.
+
+        `profile` describes the context level used, with the p95 latency and
+        queue depth that drove it, so callers can record the adjustment.
+        """
+        profile = self._current_profile()
+
+        system_message = SYSTEM_PROMPT
+        if profile['max_chunks'] is None:
+            if self.corpus.corpus_text:
+                system_message += f"\n\nCourse Materials:\n{self.corpus.corpus_text}"
+        elif self.corpus.index:
+            chunks = self.corpus.index.rank_chunks(question, limit=profile['max_chunks'])
+            if chunks:
+                system_message += "\n\nCourse Materials (most relevant excerpts):\n" + "\n\n".join(
+                    f"[{source}]\n{chunk}" for _, source, chunk in chunks
+                )
+
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": question}
+        ]
+        return messages, profile
+
+    def _current_profile(self):
+        """Re-evaluate load, move at most one level, and return the active profile."""
+        p95 = self.latency.percentile(95) if len(self.latency) >= self.min_samples else None
+        now = time.monotonic()
+
+        with self._lock:
+            depth = self._in_flight
+            reason = 'steady'
+
+            if now - self._last_change >= self.cooldown_seconds:
+                overloaded = depth > self.max_queue_depth or (p95 is not None and p95 > self.slo_seconds)
+                relaxed = depth <= self.max_queue_depth // 2 and (p95 is None or p95 < 0.6 * self.slo_seconds)
+
+                if overloaded and self._level < len(CONTEXT_LEVELS) - 1:
+                    self._level += 1
+                    self._last_change = now
+                    reason = 'queue depth over limit' if depth > self.max_queue_depth else 'p95 latency over SLO'
+                elif relaxed and self._level > 0:
+                    self._level -= 1
+                    self._last_change = now
+                    reason = 'load recovered'
+
+            profile = dict(CONTEXT_LEVELS[self._level])
+
+        profile.update({
+            'reason': reason,
+            'p95_latency': p95,
+            'queue_depth': depth
+        })
+        return profile
@@ -0,0 +1,307 @@
+"""
+Database Restore for Student Q&A Chatbot
+Bulk-loads backups written by backup.py, optionally to a point in time
+
+Usage:
+    python restore.py --list
+    python restore.py [--until 2025-11-18T21:00:00] [--backup-dir backups] [--yes]
+
+Incremental backups carry rows inserted or edited since the backup before
+them and the deletes recorded since (deleted_rows), so a point-in-time
+restore replays edits, deletes and merges as well as new rows.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+from flask import Flask
+from dotenv import load_dotenv
+
+from models import db, Conversation, ArchivedConversation, DeletedRow
+from backup import BACKUP_TABLES, TOMBSTONE_TABLE, list_backups, verify_backup
+from rollups import backfill_rollups
+from counters import reconcile_counters
+
+def restore_chain(backup_dir=None, until=None):
+    """
+    Pick the backups to replay: the newest full backup taken at or before
+    `until` (default: now) and the unbroken run of incrementals after it.
+    """
+    manifests = list_backups(backup_dir)
+    if until is not None:
+        manifests = [m for m in manifests if datetime.fromisoformat(m['created_at']) <= until]
+
+    fulls = [i for i, m in enumerate(manifests) if m['type'] == 'full']
+    if not fulls:
+        raise ValueError("No full backup found" + (f" before {until.isoformat()}" if until else ""))
+
+    chain = [manifests[fulls[-1]]]
+    for manifest in manifests[fulls[-1] + 1:]:
+        if manifest['type'] != 'incremental' or manifest.get('base') != chain[-1]['name']:
+            break
+        chain.append(manifest)
+    return chain
+
+
+def iter_backup_rows(path, columns, batch_size):
+    """Yield lists of row dicts from a gzip NDJSON table file."""
+    datetime_columns = [c.name for c in columns if isinstance(c.type, db.DateTime)]
+    date_columns = [c.name for c in columns if isinstance(c.type, db.Date)]
+    batch = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            for name in datetime_columns:
+                if row.get(name):
+                    row[name] = datetime.fromisoformat(row[name])
+            for name in date_columns:
+                if row.get(name):
+                    row[name] = date.fromisoformat(row[name])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _copy_value(value):
+    """Render one value for COPY ... (FORMAT csv): unquoted empty is NULL, everything else quoted."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class BulkLoader:
+    """
+    Loads rows into one table as fast as the database allows.
+
+    PostgreSQL gets COPY FROM STDIN; other databases get one executemany
+    INSERT per batch. Explicit ids are kept, so foreign keys line up, and
+    rows being re-applied from an incremental backup replace the old copy.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.dialect = db.session.get_bind().dialect.name
+        self.columns = [c.name for c in table.columns]
+
+    def load(self, rows, replace=False):
+        # Backups taken before a column existed leave it to its default
+        columns = [name for name in self.columns if name in rows[0]]
+        if replace:
+            ids = [row['id'] for row in rows]
+            db.session.execute(self.table.delete().where(self.table.c.id.in_(ids)))
+
+        if self.dialect == 'postgresql':
+            self._copy(rows, columns)
+        else:
+            # One prepared INSERT run over the whole batch inside the open transaction
+            db.session.execute(self.table.insert(), [{name: row.get(name) for name in columns} for row in rows])
+
+    def _copy(self, rows, columns):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(_copy_value(row.get(name)) for name in columns) + '\n')
+        buffer.seek(0)
+
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {self.table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        finally:
+            cursor.close()
+
+
+def apply_deletes(path, batch_size):
+    """Delete the rows listed in an incremental backup's deleted_rows file. Returns how many were listed."""
+    tables = {table: model.__table__ for table, model, _ in BACKUP_TABLES}
+    count = 0
+    for rows in iter_backup_rows(path, DeletedRow.__table__.columns, batch_size):
+        by_table = {}
+        for row in rows:
+            by_table.setdefault(row['table_name'], []).append(row['row_id'])
+        for table, ids in by_table.items():
+            if table in tables:
+                db.session.execute(tables[table].delete().where(tables[table].c.id.in_(ids)))
+        count += len(rows)
+    return count
+
+
+def _prepare_connection(dialect):
+    """Relax durability settings for the load; returns statements that undo them."""
+    if dialect == 'sqlite':
+        if db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal':
+            # The tuned profile's writer is already inside BEGIN IMMEDIATE, where synchronous
+            # cannot change; WAL with synchronous=NORMAL only syncs at checkpoints anyway
+            previous = db.session.execute(db.text('PRAGMA cache_size')).scalar()
+            db.session.execute(db.text('PRAGMA cache_size = -200000'))
+            return [f'PRAGMA cache_size = {previous}']
+        previous = db.session.execute(db.text('PRAGMA synchronous')).scalar()
+        for pragma in ('synchronous = OFF', 'temp_store = MEMORY', 'cache_size = -200000', 'foreign_keys = OFF'):
+            db.session.execute(db.text(f'PRAGMA {pragma}'))
+        return [f'PRAGMA synchronous = {previous}']
+    if dialect == 'postgresql':
+        # Only for this transaction; the data is committed once at the end anyway
+        db.session.execute(db.text('SET LOCAL synchronous_commit = off'))
+    return []
+
+
+def _reset_sequences(dialect):
+    if dialect != 'postgresql':
+        return
+    for table, model, _ in BACKUP_TABLES:
+        if model is ArchivedConversation:
+            continue  # ids come from conversations; no sequence of its own
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 1), "
+            f"(SELECT MAX(id) FROM {table}) IS NOT NULL)"
+        ))
+
+
+def restore_backups(chain, batch_size=None):
+    """
+    Replace the database contents with the state captured by `chain`.
+
+    Runs as one transaction: either the whole chain is restored or nothing
+    changes. Returns rows loaded per table.
+    """
+    batch_size = batch_size or int(os.getenv('RESTORE_BATCH_SIZE', 5000))
+
+    for manifest in chain:
+        problems = verify_backup(manifest['path'])
+        if problems:
+            raise ValueError(f"Backup {manifest['name']} failed verification: {'; '.join(problems)}")
+
+    dialect = db.session.get_bind().dialect.name
+    restore_statements = _prepare_connection(dialect)
+    loaded = {table: 0 for table, _, _ in BACKUP_TABLES}
+
+    try:
+        if dialect == 'postgresql':
+            db.session.execute(db.text('TRUNCATE ' + ', '.join(table for table, _, _ in BACKUP_TABLES)))
+        else:
+            # Children first so foreign keys never point at missing rows
+            for table, model, _ in reversed(BACKUP_TABLES):
+                db.session.execute(model.__table__.delete())
+
+        for position, manifest in enumerate(chain):
+            print(f"Restoring {manifest['type']} backup {manifest['name']}...")
+            for table, model, column in BACKUP_TABLES:
+                entry = manifest['tables'].get(table)
+                if not entry:
+                    continue
+
+                loader = BulkLoader(model.__table__)
+                # Incrementals re-send changed users and whole small tables; replace those rows
+                replace = position > 0
+                if replace and column is None:
+                    db.session.execute(model.__table__.delete())
+                    replace = False
+
+                start = time.monotonic()
+                count = 0
+                path = Path(manifest['path']) / entry['file']
+                for rows in iter_backup_rows(path, model.__table__.columns, batch_size):
+                    loader.load(rows, replace=replace)
+                    count += len(rows)
+                loaded[table] += count
+
+                if count:
+                    elapsed = max(time.monotonic() - start, 1e-6)
+                    print(f"  {table}: {count:,} rows in {elapsed:.1f}s ({count / elapsed:,.0f} rows/sec)")
+
+            entry = manifest['tables'].get(TOMBSTONE_TABLE)
+            if entry:
+                # After the rows: a row edited and then deleted since the last backup is in both
+                deleted = apply_deletes(Path(manifest['path']) / entry['file'], batch_size)
+                if deleted:
+                    print(f"  {deleted:,} deletes replayed")
+
+        _reset_sequences(dialect)
+        # The restored tables start a new history; earlier deletes no longer describe it
+        db.session.execute(DeletedRow.__table__.delete())
+        # Conversations archived after the full backup come back in both tables; the archive copy wins
+        archive = ArchivedConversation.__table__
+        db.session.execute(Conversation.__table__.delete().where(
+            Conversation.id.in_(db.select(archive.c.id))
+        ))
+        # Rollups are derived data and not part of backups; recount them from what was loaded
+        backfill_rollups()
+        # Counters in an incremental backup can be older than the conversations restored after them
+        reconcile_counters()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        for statement in restore_statements:
+            db.session.execute(db.text(statement))
+        if restore_statements:
+            # Do not leave the connection holding a transaction (and the SQLite write lock)
+            db.session.commit()
+
+    return loaded
+
+
+def main():
+    """Command-line entry point."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Restore the chatbot database from backups")
+    parser.add_argument('--backup-dir', default=os.getenv('BACKUP_DIR', 'backups'))
+    parser.add_argument('--until', help="Restore the latest state backed up at or before this ISO time (UTC)")
+    parser.add_argument('--list', action='store_true', help="List available backups and exit")
+    parser.add_argument('--yes', action='store_true', help="Do not ask for confirmation")
+    args = parser.parse_args()
+
+    if args.list:
+        for manifest in list_backups(args.backup_dir):
+            rows = sum(entry['rows'] for entry in manifest['tables'].values())
+            print(f"{manifest['name']:32} {manifest['type']:12} {manifest['created_at']}  {rows:,} rows")
+        return
+
+    until = datetime.fromisoformat(args.until) if args.until else None
+    try:
+        chain = restore_chain(args.backup_dir, until)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    from database import init_db
+    app = Flask(__name__)
+    init_db(app)
+
+    print("Backups to replay:")
+    for manifest in chain:
+        print(f"  {manifest['name']} ({manifest['type']}, {manifest['created_at']})")
+
+    if not args.yes:
+        confirm = input(f"\nThis REPLACES all data in {app.config['SQLALCHEMY_DATABASE_URI']}. Continue? (yes/no): ")
+        if confirm.lower() != 'yes':
+            print("Restore cancelled.")
+            return
+
+    with app.app_context():
+        start = time.monotonic()
+        loaded = restore_backups(chain)
+        print(f"\n✓ Restore complete in {time.monotonic() - start:.1f}s: "
+              + ", ".join(f"{table} {count:,}" for table, count in loaded.items()))
+
+
+if __name__ == '__main__':
+    main()
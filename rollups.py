@@ -0,0 +1,298 @@
+"""
+Analytics Rollups for Student Q&A Chatbot
+Daily conversation counts by course section, guest/registered and user, kept current as conversations change
+
+Usage:
+    python rollups.py --backfill [--since 2025-09-01] [--until 2025-12-31]
+"""
+
+import argparse
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from dotenv import load_dotenv
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, User, Conversation, DailyConversationStat, DailyUserStat, conversation_history
+
+SECTION_KEY = ('day', 'course_section', 'is_guest')
+USER_KEY = ('day', 'user_id')
+
+# A change to any of these moves a conversation to a different rollup row
+_ROLLUP_FIELDS = ('timestamp', 'user_id', 'is_guest', 'guest_course_section')
+
+
+def _to_day(value):
+    """UTC day of a timestamp, or of the 'YYYY-MM-DD' string SQLite's date() returns."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _user_sections(connection, user_ids):
+    if not user_ids:
+        return {}
+    rows = connection.execute(db.select(User.id, User.course_section).where(User.id.in_(user_ids)))
+    return {user_id: section or '' for user_id, section in rows}
+
+
+def _tally(connection, rows, skip_days=()):
+    """Count conversation rows (dicts) into rollup keys."""
+    sections = _user_sections(connection, {row['user_id'] for row in rows if row.get('user_id')})
+    by_section = Counter()
+    by_user = Counter()
+    for row in rows:
+        if row.get('timestamp') is None:
+            continue
+        day = _to_day(row['timestamp'])
+        if day in skip_days:
+            continue
+        is_guest = bool(row.get('is_guest'))
+        section = (row.get('guest_course_section') or '') if is_guest else sections.get(row.get('user_id'), '')
+        by_section[(day, section, is_guest)] += 1
+        if row.get('user_id'):
+            by_user[(day, row['user_id'])] += 1
+    return by_section, by_user
+
+
+def _increment(connection, model, key_names, counts):
+    """Add `counts` onto the rollup rows, creating the ones that do not exist yet."""
+    if not counts:
+        return
+    rows = [dict(zip(key_names, key), count=count) for key, count in counts.items()]
+    table = model.__table__
+    dialect = connection.dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(key_names), set_={'count': table.c.count + statement.excluded.count}
+        )
+        connection.execute(statement, rows)
+        return
+
+    for row in rows:
+        match = db.and_(*[table.c[name] == row[name] for name in key_names])
+        updated = connection.execute(table.update().where(match).values(count=table.c.count + row['count']))
+        if not updated.rowcount:
+            connection.execute(table.insert(), row)
+
+
+def record_conversation_rows(rows, connection=None):
+    """
+    Add newly inserted conversations (column dicts, as given to a Core insert) to the rollups.
+    Runs on the caller's connection so the counts commit or roll back with the rows.
+    """
+    connection = connection or db.session.connection()
+    by_section, by_user = _tally(connection, rows)
+    _increment(connection, DailyConversationStat, SECTION_KEY, by_section)
+    _increment(connection, DailyUserStat, USER_KEY, by_user)
+
+
+def _aggregate(connection, start, end):
+    """Rollup rows recomputed from conversations (live and archived) with start <= timestamp < end."""
+    conversations = conversation_history(*_ROLLUP_FIELDS)
+    day = db.func.date(conversations.c.timestamp)
+    is_guest = db.func.coalesce(conversations.c.is_guest, False)
+    section = db.func.coalesce(
+        db.case((conversations.c.is_guest == True, conversations.c.guest_course_section),
+                else_=User.course_section), ''
+    )
+    in_range = db.and_(conversations.c.timestamp >= start, conversations.c.timestamp < end)
+
+    section_rows = [
+        {'day': _to_day(d), 'course_section': s, 'is_guest': bool(g), 'count': n}
+        for d, s, g, n in connection.execute(
+            db.select(day, section, is_guest, db.func.count())
+            .select_from(conversations)
+            .outerjoin(User, User.id == conversations.c.user_id)
+            .where(in_range)
+            .group_by(day, section, is_guest)
+        )
+    ]
+    user_rows = [
+        {'day': _to_day(d), 'user_id': u, 'count': n}
+        for d, u, n in connection.execute(
+            db.select(day, conversations.c.user_id, db.func.count())
+            .where(in_range, conversations.c.user_id.isnot(None))
+            .group_by(day, conversations.c.user_id)
+        )
+    ]
+    return section_rows, user_rows
+
+
+def _rebuild_range(connection, start_day, end_day):
+    """Replace the rollups for days in [start_day, end_day) with freshly counted ones."""
+    for model in (DailyConversationStat, DailyUserStat):
+        table = model.__table__
+        connection.execute(table.delete().where(table.c.day >= start_day, table.c.day < end_day))
+
+    section_rows, user_rows = _aggregate(
+        connection, datetime.combine(start_day, datetime.min.time()), datetime.combine(end_day, datetime.min.time())
+    )
+    if section_rows:
+        connection.execute(DailyConversationStat.__table__.insert(), section_rows)
+    if user_rows:
+        connection.execute(DailyUserStat.__table__.insert(), user_rows)
+    return len(section_rows) + len(user_rows)
+
+
+def refresh_days(days, connection=None):
+    """Recount the given days from the conversations tables (after deletes, edits or merges)."""
+    connection = connection or db.session.connection()
+    for day in sorted(set(days)):
+        _rebuild_range(connection, day, day + timedelta(days=1))
+
+
+def user_days(user_id, connection=None):
+    """Days on which a user has conversations (the rollup rows a merge or re-assignment touches)."""
+    connection = connection or db.session.connection()
+    conversations = conversation_history('user_id', 'timestamp')
+    day = db.func.date(conversations.c.timestamp)
+    rows = connection.execute(db.select(day).where(conversations.c.user_id == user_id).distinct())
+    return {_to_day(value) for value, in rows if value is not None}
+
+
+def backfill_rollups(since=None, until=None, chunk_days=31, connection=None):
+    """
+    Rebuild the rollups for [since, until] (default: all conversations, archived ones included),
+    a month at a time.
+    Returns the number of rollup rows written.
+    """
+    connection = connection or db.session.connection()
+    if since is None and until is None:
+        # Full rebuild: also drop rollups for days that no longer have any conversations
+        for model in (DailyConversationStat, DailyUserStat):
+            connection.execute(model.__table__.delete())
+    if since is None or until is None:
+        conversations = conversation_history('timestamp')
+        first, last = connection.execute(
+            db.select(db.func.min(conversations.c.timestamp), db.func.max(conversations.c.timestamp))
+        ).one()
+        if first is None:
+            return 0
+        since = since or _to_day(first)
+        until = until or _to_day(last)
+
+    written = 0
+    start = since
+    while start <= until:
+        end = min(start + timedelta(days=chunk_days), until + timedelta(days=1))
+        written += _rebuild_range(connection, start, end)
+        start = end
+    return written
+
+
+def ensure_rollups():
+    """
+    Fill in the rollups of a database that had conversations before the rollup tables existed.
+    Returns the number of rollup rows written (0 when there was nothing to do).
+    """
+    with db.engine.connect() as conn:
+        if conn.execute(db.select(DailyConversationStat.day).limit(1)).first() is not None:
+            return 0
+        if conn.execute(db.select(conversation_history('timestamp')).limit(1)).first() is None:
+            return 0
+
+    print("Backfilling analytics rollups from existing conversations...")
+    try:
+        with db.engine.begin() as conn:
+            written = backfill_rollups(connection=conn)
+    except IntegrityError:
+        # Another worker starting at the same time got there first
+        return 0
+    print(f"Analytics rollups backfilled: {written:,} rows")
+    return written
+
+
+def _history_values(obj, name):
+    """(old, new) value of an attribute during a flush."""
+    history = inspect(obj).attrs[name].history
+    new = history.added[0] if history.added else (history.unchanged[0] if history.unchanged else None)
+    old = history.deleted[0] if history.deleted else new
+    return old, new
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_rollups_after_flush(session, flush_context):
+    """
+    Keep the rollups in step with ORM changes, in the same transaction.
+
+    New conversations are counted in; for deleted or re-assigned ones (admin
+    deletes and edits, user deletes and merges) the affected days are
+    recounted, which costs one day's rows rather than the whole table. A
+    user moving course section has every day they were active recounted,
+    since registered conversations are counted under their user's section.
+    """
+    new = [obj for obj in session.new if isinstance(obj, Conversation)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Conversation)]
+    changed = [obj for obj in session.dirty if isinstance(obj, Conversation)
+               and any(inspect(obj).attrs[name].history.has_changes() for name in _ROLLUP_FIELDS)]
+    moved_users = [obj for obj in session.dirty if isinstance(obj, User)
+                   and inspect(obj).attrs.course_section.history.has_changes()]
+    if not (new or deleted or changed or moved_users):
+        return
+
+    connection = session.connection()
+    dirty_days = set()
+    for user in moved_users:
+        dirty_days |= user_days(user.id, connection)
+    for obj in deleted:
+        # Read the loaded state directly; the row is already gone, so nothing may be lazy-loaded
+        timestamp = inspect(obj).dict.get('timestamp')
+        if timestamp is not None:
+            dirty_days.add(_to_day(timestamp))
+    for obj in changed:
+        for value in _history_values(obj, 'timestamp'):
+            if value is not None:
+                dirty_days.add(_to_day(value))
+
+    if dirty_days:
+        refresh_days(dirty_days, connection)
+    if new:
+        rows = [{name: getattr(obj, name) for name in _ROLLUP_FIELDS} for obj in new]
+        # Days just recounted already include this flush's inserts
+        by_section, by_user = _tally(connection, rows, skip_days=dirty_days)
+        _increment(connection, DailyConversationStat, SECTION_KEY, by_section)
+        _increment(connection, DailyUserStat, USER_KEY, by_user)
+
+
+def main():
+    """Command-line entry point."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Rebuild the daily analytics rollups")
+    parser.add_argument('--backfill', action='store_true', help="Recount rollups from the conversations tables")
+    parser.add_argument('--since', help="First day to recount (YYYY-MM-DD, default: first conversation)")
+    parser.add_argument('--until', help="Last day to recount (YYYY-MM-DD, default: last conversation)")
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.print_help()
+        sys.exit(1)
+
+    from database import init_db
+    app = Flask(__name__)
+    init_db(app)
+
+    with app.app_context():
+        start = time.monotonic()
+        since = date.fromisoformat(args.since) if args.since else None
+        until = date.fromisoformat(args.until) if args.until else None
+        written = backfill_rollups(since, until)
+        db.session.commit()
+        print(f"✓ Rollups rebuilt: {written:,} rows in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
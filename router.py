@@ -0,0 +1,330 @@
+"""
+Message Routing for Student Q&A Chatbot
+Fast local intent routing so small talk never pays for a full LLM call,
+and cost-aware model tier selection for everything else
+"""
+
+import math
+import os
+import random
+import re
+import threading
+from collections import Counter, defaultdict
+
+from llm import LatencyTracker
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Messages matching these rules exactly (after normalization) are small talk
+INTENT_RULES = {
+    'greeting': re.compile(r"^(hi+|hello+|hey+|hiya|howdy|yo|greetings|good (morning|afternoon|evening))( there| again| bot| chatbot)?$"),
+    'thanks': re.compile(r"^((thanks|thank you|thx|ty|tysm|much appreciated|appreciate it)( so much| a lot| again| very much)?)( (that|this) (helps|helped|was helpful))?$"),
+    'acknowledgement': re.compile(r"^(ok+|okay|k|kk|cool|got it|gotcha|sounds good|great|nice|awesome|perfect|sure|alright|makes sense|i see|understood|yes|yep|no|nope|lol|haha)( thanks| thank you)?$"),
+    'farewell': re.compile(r"^(bye|goodbye|bye bye|see you|see ya|later|good night|goodnight|cya)( later| tomorrow)?$"),
+}
+
+# Seed examples for the fallback classifier; 'course' means send to full retrieval
+TRAINING_EXAMPLES = {
+    'greeting': [
+        "hi how are you", "hello how is it going", "hey whats up", "good morning professor bot",
+        "hello are you there", "hi im new here", "hey there how are you doing",
+    ],
+    'thanks': [
+        "thank you that really helped", "thanks for the help", "thanks that makes sense now",
+        "awesome thank you so much", "thanks i will try that", "perfect thanks for explaining",
+    ],
+    'acknowledgement': [
+        "ok i will try that", "okay got it", "cool that works", "alright sounds good",
+        "ok makes sense", "great that worked", "ok cool",
+    ],
+    'farewell': [
+        "bye for now", "ok bye", "see you later", "thats all for today bye", "goodnight thanks",
+    ],
+    'off_topic': [
+        "tell me a joke", "whats the weather today", "who won the game last night",
+        "what is your favorite movie", "are you a robot", "what is the meaning of life",
+        "do you like pizza", "how old are you", "sing me a song", "whats your name",
+    ],
+    'course': [
+        "how do i create a flask route", "what is a python dictionary", "when is the assignment due",
+        "how do i connect to the database", "why does my code throw an error",
+        "how do i use sqlalchemy", "what does the homework require", "how do i read a json file",
+        "explain list comprehension", "how do i deploy to heroku", "what is a function",
+        "how do i fix this traceback", "how do i write a for loop", "what is an api endpoint",
+        "how do i hash a password", "what should the cli prototype do",
+    ],
+}
+
+# Words that always mean the message is about the course
+COURSE_TERMS = frozenset("""
+python flask code error exception traceback function class method variable loop list dict
+dictionary tuple string int json csv file database sql sqlite postgres sqlalchemy api route
+html template form assignment homework deadline due grade project module import install pip
+heroku deploy git github debug bug syntax crud migration cli corpus chatbot session login
+""".split())
+
+TEMPLATES = {
+    'greeting': [
+        "Hi there! 👋 What can I help you with in INFO 6200 today?",
+        "Hello! Ask me anything about the course materials or your Python code.",
+    ],
+    'thanks': [
+        "You're welcome! Let me know if you have any other questions.",
+        "Happy to help! Good luck with your work.",
+    ],
+    'acknowledgement': [
+        "Sounds good! Let me know if anything else comes up.",
+        "Great! I'm here if you have another question.",
+    ],
+    'farewell': [
+        "Goodbye! Good luck with your studies.",
+        "See you later! Come back any time you have a question.",
+    ],
+    'off_topic': [
+        "I'm your INFO 6200 teaching assistant, so I can best help with course content and "
+        "Python coding questions. What are you working on?",
+    ],
+    'empty': [
+        "Could you tell me a bit more about what you'd like to know?",
+    ],
+}
+
+
+def normalize(message):
+    """Lowercase, strip punctuation and collapse whitespace."""
+    return " ".join(WORD_PATTERN.findall((message or "").lower().replace("’", "'"))).replace("'", "")
+
+
+class NaiveBayesClassifier:
+    """Tiny multinomial naive Bayes over word unigrams and bigrams."""
+
+    def __init__(self, examples):
+        self.word_counts = defaultdict(Counter)
+        self.label_counts = Counter()
+        vocabulary = set()
+
+        for label, texts in examples.items():
+            for text in texts:
+                features = self._features(normalize(text))
+                self.word_counts[label].update(features)
+                self.label_counts[label] += 1
+                vocabulary.update(features)
+
+        self.vocabulary_size = len(vocabulary)
+        self.totals = {label: sum(counts.values()) for label, counts in self.word_counts.items()}
+        total_examples = sum(self.label_counts.values())
+        self.priors = {label: math.log(count / total_examples) for label, count in self.label_counts.items()}
+
+    @staticmethod
+    def _features(text):
+        words = text.split()
+        return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+    def predict(self, text):
+        """Return (label, probability) for the most likely label."""
+        features = self._features(text)
+        scores = {}
+        for label in self.label_counts:
+            denominator = self.totals[label] + self.vocabulary_size
+            scores[label] = self.priors[label] + sum(
+                math.log((self.word_counts[label][f] + 1) / denominator) for f in features
+            )
+
+        best = max(scores, key=scores.get)
+        # Softmax over log scores for a calibrated-enough confidence
+        peak = scores[best]
+        total = sum(math.exp(score - peak) for score in scores.values())
+        return best, 1.0 / total
+
+
+class IntentRouter:
+    """
+    Decides whether a message needs the full retrieval + LLM path.
+
+    Rules catch the obvious cases; a small classifier handles short messages
+    the rules miss. Anything long, question-like or mentioning course terms
+    always goes to retrieval.
+    """
+
+    def __init__(self, min_confidence=0.8, max_small_talk_words=8):
+        self.min_confidence = min_confidence
+        self.max_small_talk_words = max_small_talk_words
+        self.classifier = NaiveBayesClassifier(TRAINING_EXAMPLES)
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def route(self, message):
+        """
+        Classify a message.
+
+        Returns a dict with 'intent', 'route' ('template' or 'retrieval'),
+        'confidence' and 'reason'.
+        """
+        text = normalize(message)
+        words = text.split()
+
+        if not words:
+            decision = self._decision('empty', 'template', 1.0, 'empty message')
+        elif any(word in COURSE_TERMS for word in words):
+            decision = self._decision('course', 'retrieval', 1.0, 'course term')
+        else:
+            decision = None
+            for intent, pattern in INTENT_RULES.items():
+                if pattern.match(text):
+                    decision = self._decision(intent, 'template', 1.0, 'rule')
+                    break
+
+            if decision is None and len(words) <= self.max_small_talk_words:
+                intent, confidence = self.classifier.predict(text)
+                if intent != 'course' and confidence >= self.min_confidence:
+                    decision = self._decision(intent, 'template', confidence, 'classifier')
+                else:
+                    decision = self._decision('course', 'retrieval', confidence, 'classifier')
+
+            if decision is None:
+                decision = self._decision('course', 'retrieval', 1.0, 'long message')
+
+        with self._lock:
+            self._counts[decision['route']] += 1
+            self._counts[f"intent:{decision['intent']}"] += 1
+
+        print(f"[router] intent={decision['intent']} route={decision['route']} "
+              f"confidence={decision['confidence']:.2f} reason={decision['reason']}")
+        return decision
+
+    def template_answer(self, intent):
+        """Pick a canned response for a small-talk intent."""
+        return random.choice(TEMPLATES.get(intent, TEMPLATES['empty']))
+
+    def stats(self):
+        """Return routing counters for monitoring."""
+        with self._lock:
+            counts = dict(self._counts)
+
+        total = counts.get('template', 0) + counts.get('retrieval', 0)
+        return {
+            'total': total,
+            'template': counts.get('template', 0),
+            'retrieval': counts.get('retrieval', 0),
+            'template_rate': counts.get('template', 0) / total if total else 0.0,
+            'intents': {key.split(':', 1)[1]: value for key, value in counts.items() if key.startswith('intent:')}
+        }
+
+    @staticmethod
+    def _decision(intent, route, confidence, reason):
+        return {'intent': intent, 'route': route, 'confidence': confidence, 'reason': reason}
+
+
+# Signals that a question needs deeper reasoning. Code needs code-like context (a block
+# header ending in ':', an assignment, a call with no spaces inside the parentheses) so that
+# prose such as "for example (see ch. 3)" does not count.
+CODE_PATTERN = re.compile(
+    r"```"
+    r"|Traceback \(most recent call last\)"
+    r"|^\s*(def|class|for|while|if|elif|else|try|except|with)\b[^\n]*:\s*$"
+    r"|^\s*(import\s+\w+|from\s+[\w.]+\s+import\s+\w+)"
+    r"|^\s*[A-Za-z_][\w.]*(\[[^\]\n]*\])?\s*[-+*/]?=(?!=)"
+    r"|\b\w+\([^()\s]*\)"
+    r"|\b\w+Error\b",
+    re.MULTILINE
+)
+HARD_WORDS = frozenset("""
+debug fix error exception traceback why explain compare difference design optimize refactor
+migrate migration architecture performance security broken crash fails failing wrong
+""".split())
+
+
+class ModelRouter:
+    """
+    Picks a model tier per question from cheap local signals.
+
+    Scores question length, code presence, "hard" wording, retrieval
+    confidence from the corpus index and how deep the session already is.
+    Questions scoring below the threshold go to the small (cheaper, faster)
+    model; the rest go to the large model. Latency is tracked per tier so
+    the threshold can be tuned.
+    """
+
+    def __init__(self, default_model, index=None, enabled=None, threshold=None):
+        self.index = index
+        self.enabled = (os.getenv('LLM_MODEL_ROUTING', 'false').lower() in ('1', 'true', 'yes', 'on')
+                        if enabled is None else enabled)
+        self.threshold = threshold if threshold is not None else float(os.getenv('LLM_COMPLEXITY_THRESHOLD', 3))
+        self.models = {
+            'small': os.getenv('LLM_MODEL_SMALL', 'ministral-8b-latest'),
+            'large': os.getenv('LLM_MODEL_LARGE', default_model),
+        }
+        self.latency = {tier: LatencyTracker() for tier in self.models}
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def score(self, question, history_length=0):
+        """Return (score, features) describing how hard a question looks."""
+        words = question.split()
+        features = {
+            'words': len(words),
+            'code': bool(CODE_PATTERN.search(question)),
+            'hard_words': sum(1 for w in normalize(question).split() if w in HARD_WORDS),
+            'retrieval_score': None,
+            'history': history_length,
+        }
+
+        score = 0.0
+        if len(words) > 40:
+            score += 1
+        if len(words) > 120:
+            score += 1
+        if features['code']:
+            score += 2
+        score += min(features['hard_words'], 2)
+        if history_length >= 3:
+            score += 1
+
+        if self.index:
+            top = self.index.rank_chunks(question, limit=1)
+            features['retrieval_score'] = round(top[0][0], 2) if top else 0.0
+            # Well-covered by the course materials: the small model can answer from context
+            if top and top[0][0] >= 8:
+                score -= 1
+            elif not top or top[0][0] < 2:
+                score += 1
+
+        return score, features
+
+    def choose(self, question, history_length=0):
+        """Return a decision dict with 'tier', 'model', 'score' and 'features'."""
+        if not self.enabled:
+            return {'tier': 'large', 'model': self.models['large'], 'score': None, 'features': {}}
+
+        score, features = self.score(question, history_length)
+        tier = 'large' if score >= self.threshold else 'small'
+
+        with self._lock:
+            self._counts[tier] += 1
+
+        print(f"[model-router] tier={tier} model={self.models[tier]} score={score:.1f} features={features}")
+        return {'tier': tier, 'model': self.models[tier], 'score': score, 'features': features}
+
+    def record_latency(self, tier, seconds):
+        """Record upstream latency for a tier."""
+        if tier in self.latency:
+            self.latency[tier].record(seconds)
+
+    def stats(self):
+        """Return per-tier counts and latency for threshold tuning."""
+        with self._lock:
+            counts = dict(self._counts)
+
+        return {
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'tiers': {
+                tier: {
+                    'model': model,
+                    'requests': counts.get(tier, 0),
+                    'latency_p50_seconds': self.latency[tier].percentile(50),
+                    'latency_p95_seconds': self.latency[tier].percentile(95),
+                }
+                for tier, model in self.models.items()
+            }
+        }
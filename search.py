@@ -0,0 +1,354 @@
+"""
+Full-Text Search for Student Q&A Chatbot
+Ranked conversation search with highlighted snippets (SQLite FTS5 or a PostgreSQL tsvector + GIN index)
+and substring user search on trigram indexes
+"""
+
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy.orm import joinedload
+
+from models import db, User, Conversation, ArchivedConversation
+
+FTS_TABLE = 'conversations_fts'
+USER_FTS_TABLE = 'users_trigram'
+USER_SEARCH_COLUMNS = ('email', 'first_name', 'last_name', 'student_id')
+
+# Highlight markers that cannot occur in typed text; swapped for <mark> after escaping
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        question, answer, content='conversations', content_rowid='id', tokenize='porter unicode61')""",
+    # Triggers rather than ORM events, so Core bulk inserts, restores and raw SQL stay in sync too
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON conversations BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON conversations BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF question, answer ON conversations BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+        INSERT INTO {FTS_TABLE}(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+    END""",
+]
+
+# On PostgreSQL the search column, its trigger and the GIN indexes are built by migration
+# d9a4b7e2c3f1 (flask db upgrade), which can build them without blocking writes; startup only checks for them
+POSTGRES_SEARCH_INDEX = 'ix_conversations_search_vector'
+
+_cols = ', '.join(USER_SEARCH_COLUMNS)
+_new_cols = ', '.join('new.' + column for column in USER_SEARCH_COLUMNS)
+_old_cols = ', '.join('old.' + column for column in USER_SEARCH_COLUMNS)
+
+# Trigram side table for "contains" searches on users; LIKE '%term%' cannot use a btree index
+SQLITE_USER_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {USER_FTS_TABLE} USING fts5(
+        {_cols}, content='users', content_rowid='id', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {USER_FTS_TABLE}_ai AFTER INSERT ON users BEGIN
+        INSERT INTO {USER_FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new_cols});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {USER_FTS_TABLE}_ad AFTER DELETE ON users BEGIN
+        INSERT INTO {USER_FTS_TABLE}({USER_FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old_cols});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {USER_FTS_TABLE}_au AFTER UPDATE OF {_cols} ON users BEGIN
+        INSERT INTO {USER_FTS_TABLE}({USER_FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old_cols});
+        INSERT INTO {USER_FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new_cols});
+    END""",
+]
+
+POSTGRES_USER_INDEXES = [f'ix_users_{column}_trgm' for column in USER_SEARCH_COLUMNS]
+
+_index_ready = {}
+_user_index_ready = {}
+
+
+def _postgres_indexes_valid(names):
+    """Whether every named index exists and finished building (a failed CONCURRENTLY build leaves it invalid)."""
+    with db.engine.connect() as conn:
+        valid = dict(conn.execute(
+            db.text("SELECT c.relname, i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                    "WHERE c.relname IN :names").bindparams(db.bindparam('names', expanding=True)),
+            {'names': list(names)}
+        ).all())
+    return all(valid.get(name) for name in names)
+
+
+def ensure_search_index():
+    """
+    Create the full-text index (SQLite) or check that the migration built it (PostgreSQL).
+    Safe to call on every start. Returns True when ranked search is available on this database.
+    """
+    engine = db.engine
+    dialect = engine.dialect.name
+    try:
+        if dialect == 'sqlite':
+            with engine.begin() as conn:
+                exists = conn.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                      {'name': FTS_TABLE}).first()
+                for statement in SQLITE_DDL:
+                    conn.execute(db.text(statement))
+                if not exists:
+                    # Index the conversations that were there before the search table
+                    conn.execute(db.text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+                    print("Full-text search index built")
+        elif dialect == 'postgresql':
+            if not _postgres_indexes_valid([POSTGRES_SEARCH_INDEX]):
+                print("Full-text search index missing (run flask db upgrade), falling back to LIKE search")
+                _index_ready[engine.url] = False
+                return False
+        else:
+            _index_ready[engine.url] = False
+            return False
+    except Exception as e:
+        # e.g. SQLite built without FTS5, or PostgreSQL older than 12
+        print(f"Full-text search unavailable, falling back to LIKE search: {e}")
+        _index_ready[engine.url] = False
+        return False
+
+    _index_ready[engine.url] = True
+    return True
+
+
+def ensure_user_search_index():
+    """
+    Create the trigram index used by user search (SQLite) or check that the migration built it (PostgreSQL).
+    Returns True when substring searches can use it.
+    """
+    engine = db.engine
+    dialect = engine.dialect.name
+    try:
+        if dialect == 'sqlite':
+            with engine.begin() as conn:
+                exists = conn.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                      {'name': USER_FTS_TABLE}).first()
+                for statement in SQLITE_USER_DDL:
+                    conn.execute(db.text(statement))
+                if not exists:
+                    conn.execute(db.text(f"INSERT INTO {USER_FTS_TABLE}({USER_FTS_TABLE}) VALUES ('rebuild')"))
+        elif dialect == 'postgresql':
+            if not _postgres_indexes_valid(POSTGRES_USER_INDEXES):
+                print("Trigram user search indexes missing (run flask db upgrade), user search will scan")
+                _user_index_ready[engine.url] = False
+                return False
+        else:
+            _user_index_ready[engine.url] = False
+            return False
+    except Exception as e:
+        # The trigram tokenizer needs SQLite 3.34+; pg_trgm may not be installable
+        print(f"Trigram user search unavailable, falling back to LIKE search: {e}")
+        _user_index_ready[engine.url] = False
+        return False
+
+    _user_index_ready[engine.url] = True
+    return True
+
+
+def rebuild_search_index():
+    """Re-index every conversation and user from scratch (SQLite only; PostgreSQL keeps itself current)."""
+    if db.engine.dialect.name == 'sqlite' and ensure_search_index():
+        with db.engine.begin() as conn:
+            conn.execute(db.text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        if ensure_user_search_index():
+            with db.engine.begin() as conn:
+                conn.execute(db.text(f"INSERT INTO {USER_FTS_TABLE}({USER_FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def _search_ready():
+    ready = _index_ready.get(db.engine.url)
+    if ready is None:
+        ready = ensure_search_index()
+    return ready
+
+
+def _fts5_query(term):
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r'\w+', term)
+    if not words:
+        return None
+    quoted = ['"' + word + '"' for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def highlight(snippet):
+    """Escape a snippet and turn its match markers into <mark> tags."""
+    if snippet is None:
+        return None
+    return Markup(str(escape(snippet)).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'))
+
+
+class SearchHit:
+    """One search result: the conversation, its relevance and highlighted snippets."""
+
+    def __init__(self, conversation, rank=None, question_snippet=None, answer_snippet=None):
+        self.conversation = conversation
+        self.rank = rank
+        self.question_snippet = question_snippet
+        self.answer_snippet = answer_snippet
+
+
+class SearchResults:
+    """A page of search hits, best match first."""
+
+    def __init__(self, hits, total, page, per_page, ranked):
+        self.hits = hits
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+        self.ranked = ranked
+
+    @property
+    def conversations(self):
+        return [hit.conversation for hit in self.hits]
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+
+def _guest_filter(filter_type):
+    if filter_type == 'registered':
+        return 'AND c.is_guest = :is_guest', {'is_guest': False}
+    if filter_type == 'guest':
+        return 'AND c.is_guest = :is_guest', {'is_guest': True}
+    return '', {}
+
+
+def search_conversations(term, filter_type='all', page=1, per_page=20):
+    """
+    Search question and answer text, best matches first.
+
+    Ranking (bm25 on SQLite, ts_rank_cd on PostgreSQL) weighs the question
+    above the answer. Matching runs entirely off the full-text index; ids
+    and ranks for the page are fetched first and snippets are only built
+    for those rows. Without a full-text index this falls back to a LIKE
+    scan, newest first, with no snippets.
+    """
+    page = max(page, 1)
+    offset = (page - 1) * per_page
+    dialect = db.engine.dialect.name
+
+    if not term.strip() or not _search_ready():
+        return _like_search(term, filter_type, page, per_page)
+
+    guest_sql, params = _guest_filter(filter_type)
+    params.update(limit=per_page, offset=offset, start=_MARK_START, end=_MARK_END)
+
+    if dialect == 'sqlite':
+        params['query'] = _fts5_query(term)
+        if params['query'] is None:
+            return SearchResults([], 0, page, per_page, ranked=True)
+        source = (f"FROM {FTS_TABLE} f JOIN conversations c ON c.id = f.rowid "
+                  f"WHERE {FTS_TABLE} MATCH :query {guest_sql}")
+        page_sql = (f"SELECT c.id, bm25({FTS_TABLE}, 1.0, 0.5) AS rank {source} "
+                    f"ORDER BY rank LIMIT :limit OFFSET :offset")
+        snippet_sql = (f"SELECT rowid, snippet({FTS_TABLE}, 0, :start, :end, '…', 24), "
+                       f"snippet({FTS_TABLE}, 1, :start, :end, '…', 32) "
+                       f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query AND rowid IN :ids")
+    else:
+        params['query'] = term
+        params['options'] = f'StartSel={_MARK_START}, StopSel={_MARK_END}, MaxFragments=2, MaxWords=30, MinWords=10'
+        source = (f"FROM conversations c, websearch_to_tsquery('english', :query) q "
+                  f"WHERE c.search_vector @@ q {guest_sql}")
+        page_sql = (f"SELECT c.id, ts_rank_cd(c.search_vector, q) AS rank {source} "
+                    f"ORDER BY rank DESC, c.id DESC LIMIT :limit OFFSET :offset")
+        snippet_sql = ("SELECT c.id, ts_headline('english', c.question, q, :options), "
+                       "ts_headline('english', c.answer, q, :options) "
+                       "FROM conversations c, websearch_to_tsquery('english', :query) q WHERE c.id IN :ids")
+
+    total = db.session.execute(db.text(f"SELECT count(*) {source}"), params).scalar()
+    ranks = db.session.execute(db.text(page_sql), params).all()
+    if not ranks:
+        return SearchResults([], total, page, per_page, ranked=True)
+
+    ids = [row[0] for row in ranks]
+    snippet_statement = db.text(snippet_sql).bindparams(db.bindparam('ids', expanding=True))
+    snippets = {row[0]: (row[1], row[2])
+                for row in db.session.execute(snippet_statement, dict(params, ids=ids))}
+    conversations = {conv.id: conv for conv in
+                     Conversation.query.options(joinedload(Conversation.user)).filter(Conversation.id.in_(ids))}
+
+    hits = []
+    for conv_id, rank in ranks:
+        if conv_id not in conversations:
+            continue
+        question, answer = snippets.get(conv_id, (None, None))
+        hits.append(SearchHit(conversations[conv_id], rank, highlight(question), highlight(answer)))
+    return SearchResults(hits, total, page, per_page, ranked=True)
+
+
+def _like_search(term, filter_type, page, per_page, model=Conversation):
+    query = model.query.options(joinedload(model.user))
+    if filter_type == 'registered':
+        query = query.filter_by(is_guest=False)
+    elif filter_type == 'guest':
+        query = query.filter_by(is_guest=True)
+    if term:
+        query = query.filter(db.or_(model.question.ilike(f'%{term}%'),
+                                    model.answer.ilike(f'%{term}%')))
+
+    total = query.count()
+    rows = (query.order_by(model.timestamp.desc(), model.id.desc())
+            .offset((page - 1) * per_page).limit(per_page).all())
+    return SearchResults([SearchHit(conv) for conv in rows], total, page, per_page, ranked=False)
+
+
+def search_archive(term, filter_type='all', page=1, per_page=20):
+    """
+    Search archived conversations, newest first.
+    The archive has no full-text index, so this is a LIKE scan; it only runs when an admin asks for it.
+    """
+    return _like_search(term, filter_type, max(page, 1), per_page, model=ArchivedConversation)
+
+
+def user_search_filter(term):
+    """
+    Filter for User queries matching `term` anywhere in email, name or student ID.
+
+    On SQLite, terms of three or more characters are looked up in the
+    trigram table; on PostgreSQL the same ILIKE conditions are answered by
+    the pg_trgm GIN indexes. Shorter terms, or databases without trigram
+    support, use a plain ILIKE scan.
+    """
+    term = term.strip()
+    if db.engine.dialect.name == 'sqlite' and len(term) >= 3:
+        ready = _user_index_ready.get(db.engine.url)
+        if ready is None:
+            ready = ensure_user_search_index()
+        if ready:
+            # A quoted FTS5 string is matched as a substring by the trigram tokenizer
+            matches = db.text(f"SELECT rowid FROM {USER_FTS_TABLE} WHERE {USER_FTS_TABLE} MATCH :user_term")
+            return User.id.in_(matches.bindparams(user_term='"' + term.replace('"', '""') + '"'))
+
+    return db.or_(*[getattr(User, column).ilike(f'%{term}%') for column in USER_SEARCH_COLUMNS])
+
+
+def search_users(term, limit=10):
+    """
+    Top `limit` users matching `term` for typeahead, as dicts with conversation counts.
+    Email prefix matches come first, then everything else alphabetically.
+    """
+    term = term.strip()
+    if not term:
+        return []
+
+    users = (User.query
+             .filter(user_search_filter(term))
+             .order_by(db.case((User.email.ilike(f'{term}%'), 0), else_=1), User.email)
+             .limit(limit)
+             .all())
+    return [{
+        'id': user.id,
+        'email': user.email,
+        'name': f'{user.first_name} {user.last_name}',
+        'student_id': user.student_id,
+        'course_section': user.course_section,
+        'conversation_count': user.conversation_count or 0,
+    } for user in users]
@@ -0,0 +1,38 @@
+"""
+Shared fixtures: a Flask app on a throwaway SQLite database per test
+"""
+
+import pytest
+from flask import Flask
+
+import database
+import pagination
+from models import db, User
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """App with its context pushed, on a fresh SQLite file."""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('WRITE_BEHIND_ENABLED', 'false')
+    monkeypatch.chdir(tmp_path)
+
+    app = Flask(__name__)
+    database.init_db(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    database._stats_cache.clear()
+    pagination._count_cache.clear()
+
+
+@pytest.fixture
+def user(app):
+    """A registered user."""
+    user = User(email='student@northeastern.edu', first_name='Ada', last_name='Lovelace',
+                student_id='001', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
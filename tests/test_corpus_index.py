@@ -0,0 +1,72 @@
+"""
+BM25 ranking over course material and the extractive fallback answer built from it
+"""
+
+from corpus_index import Bm25Ranker, CorpusIndex, build_fallback_answer, tokenize
+
+DOCUMENTS = [
+    ('loops.txt', "A for loop repeats a block once for every item in a list. "
+                  "Use range() when you need a loop over numbers.\n\n"
+                  "A while loop repeats as long as its condition stays true, so make sure the condition changes."),
+    ('dicts.txt', "A dictionary maps keys to values and looks a key up in constant time. "
+                  "Use the get method when a key might be missing from the dictionary."),
+    ('flask.txt', "Flask routes map a URL to a Python function that returns the response. "
+                  "Register routes with the app.route decorator before running the development server."),
+]
+
+
+def test_tokenize_drops_stopwords_and_single_characters():
+    assert tokenize("What is a for-loop in Python?") == ['loop', 'python']
+
+
+def test_bm25_ranks_the_text_about_the_question_first():
+    ranker = Bm25Ranker(["loops repeat code", "dictionaries map keys", "loops and loops and loops"])
+    ranked = ranker.rank("how do loops work")
+
+    assert [index for index, _ in ranked] == [2, 0]
+    assert ranked[0][1] > ranked[1][1] > 0
+
+
+def test_bm25_ignores_unknown_terms_and_empty_questions():
+    ranker = Bm25Ranker(["loops repeat code"])
+    assert ranker.rank("quaternion") == []
+    assert ranker.rank("") == []
+    assert Bm25Ranker([]).rank("loops") == []
+
+
+def test_rank_sentences_returns_the_best_passages_with_sources():
+    index = CorpusIndex(DOCUMENTS)
+    [(score, source, sentence)] = index.rank_sentences("How do I look up a dictionary key?", limit=1)
+
+    assert source == 'dicts.txt'
+    assert 'dictionary' in sentence
+    assert score > 0
+
+
+def test_rank_sentences_skips_duplicates():
+    index = CorpusIndex(DOCUMENTS + [('copy.txt', DOCUMENTS[1][1])])
+    sentences = [sentence for _, _, sentence in index.rank_sentences("dictionary key", limit=10)]
+    assert len(sentences) == len(set(sentences))
+
+
+def test_rank_chunks_groups_paragraphs():
+    index = CorpusIndex(DOCUMENTS, chunk_chars=200)
+    [(_, source, chunk)] = index.rank_chunks("while loop condition", limit=1)
+
+    assert source == 'loops.txt'
+    assert 'while loop' in chunk
+
+
+def test_fallback_answer_cites_its_sources():
+    answer, sources = build_fallback_answer(CorpusIndex(DOCUMENTS), "How do Flask routes work?")
+
+    assert answer.startswith("⚠️")
+    assert "(source: flask.txt)" in answer
+    assert 'flask.txt' in sources
+
+
+def test_fallback_answer_without_matches():
+    answer, sources = build_fallback_answer(CorpusIndex(DOCUMENTS), "quaternion")
+    assert sources == []
+    assert "couldn't find course material" in answer
+    assert build_fallback_answer(None, "loops")[1] == []
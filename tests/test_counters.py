@@ -0,0 +1,88 @@
+"""
+Per-user activity counters: kept current by the ORM listener and bulk inserts, repaired by reconcile
+"""
+
+from datetime import datetime, timedelta
+
+from archive import archive_conversations
+from counters import reconcile_counters, record_user_activity
+from models import db, User, Conversation
+from persistence import conversation_row
+
+
+def _add(user, days_ago=0, count=1):
+    timestamp = datetime.utcnow() - timedelta(days=days_ago)
+    for _ in range(count):
+        db.session.add(Conversation(user_id=user.id, question='q', answer='a', session_id='s', timestamp=timestamp))
+    db.session.commit()
+
+
+def _counters(user):
+    db.session.expire_all()
+    user = db.session.get(User, user.id)
+    return user.conversation_count, user.recent_conversation_count()
+
+
+def test_orm_inserts_and_deletes_update_the_counters(user):
+    _add(user, count=2)
+    _add(user, days_ago=1)
+    _add(user, days_ago=30)
+    assert _counters(user) == (4, 3)
+
+    db.session.delete(Conversation.query.filter_by(user_id=user.id).order_by(Conversation.id).first())
+    db.session.commit()
+    assert _counters(user) == (3, 2)
+
+
+def test_reassigning_conversations_recounts_both_users(user):
+    other = User(email='grace@northeastern.edu', first_name='Grace', last_name='Hopper',
+                 student_id='002', password_hash='x')
+    db.session.add(other)
+    db.session.commit()
+    _add(user, count=3)
+
+    for conversation in Conversation.query.filter_by(user_id=user.id).limit(2):
+        conversation.user_id = other.id
+    db.session.commit()
+
+    assert _counters(user) == (1, 1)
+    assert _counters(other) == (2, 2)
+
+
+def test_bulk_inserts_are_counted_in_the_same_transaction(user):
+    rows = [conversation_row('q', 'a', 's', user_id=user.id) for _ in range(3)]
+    db.session.execute(db.insert(Conversation), rows)
+    record_user_activity(rows)
+    db.session.commit()
+
+    assert _counters(user) == (3, 3)
+    assert db.session.get(User, user.id).last_activity_at == max(row['timestamp'] for row in rows)
+
+
+def test_counter_upkeep_does_not_touch_updated_at(user):
+    updated_at = user.updated_at
+    _add(user)
+    db.session.expire_all()
+    assert db.session.get(User, user.id).updated_at == updated_at
+
+
+def test_reconcile_repairs_drift(user):
+    _add(user, count=2)
+    db.session.execute(User.__table__.update().values(conversation_count=99, recent_activity=None))
+    db.session.commit()
+
+    assert reconcile_counters(dry_run=True) == 1
+    assert reconcile_counters() == 1
+    db.session.commit()
+    assert _counters(user) == (2, 2)
+    assert reconcile_counters() == 0
+
+
+def test_archived_conversations_still_count(user):
+    _add(user, days_ago=400, count=2)
+    _add(user)
+
+    assert archive_conversations(datetime.utcnow() - timedelta(days=1)) == 2
+    assert Conversation.query.count() == 1
+    assert _counters(user) == (3, 1)
+    assert reconcile_counters() == 0
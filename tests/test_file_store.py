@@ -0,0 +1,141 @@
+"""
+JSONL conversation log (appends, torn lines, compaction, legacy conversion) and the cached user store
+"""
+
+import json
+
+import pytest
+
+from file_store import ConversationLog, UserStore
+
+
+@pytest.fixture
+def log(tmp_path):
+    return ConversationLog(tmp_path / 'log.jsonl', legacy_path=tmp_path / 'legacy.json', compact_threshold=1000)
+
+
+def _record(question, session_id='s1', email=None):
+    record = {'question': question, 'answer': 'a', 'session_id': session_id}
+    if email:
+        record['user_info'] = {'email': email}
+    return record
+
+
+def _tear(log):
+    """Leave a partial line behind, as a writer killed mid-append would."""
+    with open(log.path, 'ab') as f:
+        f.write(b'{"question": "tor')
+
+
+def test_append_assigns_ids_and_indexes_records(log):
+    log.append(_record('q1', email='Ada@Example.edu'))
+    log.append(_record('q2', session_id='s2'))
+    log.append(_record('q3', email='ada@example.edu'))
+
+    assert log.count() == 3
+    assert log.get(2)['question'] == 'q2'
+    assert log.get(99) is None
+    assert [r['id'] for r in log.iter_session('s1')] == [1, 3]
+    assert [r['question'] for r in log.iter_email('ADA@example.edu')] == ['q1', 'q3']
+    assert log.count(email='ada@example.edu') == 2
+    assert [r['id'] for r in log.iter_all()] == [1, 2, 3]
+
+
+def test_other_processes_appends_are_picked_up(log):
+    other = ConversationLog(log.path, legacy_path=log.legacy_path)
+    log.append(_record('mine'))
+    other.append(_record('theirs'))
+
+    assert [r['question'] for r in log.iter_all()] == ['mine', 'theirs']
+    assert log.append(_record('next'))['id'] == 3
+
+
+def test_torn_line_is_skipped_and_not_glued_to_the_next_record(log):
+    log.append(_record('before'))
+    _tear(log)
+    record = log.append(_record('after'))
+
+    assert record['id'] == 2
+    assert [r['question'] for r in log.iter_all()] == ['before', 'after']
+    assert log.get(2)['question'] == 'after'
+
+
+def test_compaction_drops_torn_lines_and_keeps_ids(log):
+    for n in range(3):
+        log.append(_record(f'q{n}'))
+        _tear(log)
+    log.append(_record('last'))
+    size = log.path.stat().st_size
+
+    log.compact()
+
+    assert log.path.stat().st_size < size
+    lines = log.path.read_bytes().splitlines()
+    assert [json.loads(line)['id'] for line in lines] == [1, 2, 3, 4]
+    assert log.get(4)['question'] == 'last'
+    assert log.append(_record('new'))['id'] == 5
+
+
+def test_compaction_runs_once_enough_lines_are_torn(tmp_path):
+    log = ConversationLog(tmp_path / 'log.jsonl', legacy_path=tmp_path / 'legacy.json', compact_threshold=2)
+    for n in range(2):
+        _tear(log)
+        log.append(_record(f'q{n}'))
+
+    # The second append terminated the second torn line, which reached the threshold
+    assert [json.loads(line)['question'] for line in log.path.read_bytes().splitlines()] == ['q0', 'q1']
+
+
+def test_reads_started_before_a_compaction_return_the_right_records(log):
+    for n in range(4):
+        _tear(log)
+        log.append(_record(f'q{n}'))
+
+    everything = log.iter_all()
+    first = next(everything)
+    session = log.iter_session('s1')
+    log.compact()
+
+    assert first['question'] == 'q0'
+    assert [r['question'] for r in everything] == ['q1', 'q2', 'q3']
+    assert [r['question'] for r in session] == ['q0', 'q1', 'q2', 'q3']
+    assert [r['question'] for r in log.iter_session('s1')] == ['q0', 'q1', 'q2', 'q3']
+
+
+def test_legacy_array_is_converted_once(log):
+    log.legacy_path.write_text(json.dumps([dict(_record('old'), id=1), dict(_record('older'), id=2)]))
+
+    assert log.count() == 2
+    assert log.append(_record('new'))['id'] == 3
+
+    log.legacy_path.write_text(json.dumps([dict(_record('changed'), id=1)]))
+    fresh = ConversationLog(log.path, legacy_path=log.legacy_path)
+    assert [r['question'] for r in fresh.iter_all()] == ['old', 'older', 'new']
+
+
+def test_missing_log_reads_as_empty(log):
+    assert log.count() == 0
+    assert list(log.iter_all()) == []
+    assert list(log.iter_session('s1')) == []
+    assert log.get(1) is None
+
+
+def test_user_store_adds_users_once_by_lowercase_email(tmp_path):
+    store = UserStore(tmp_path / 'users.json')
+
+    assert store.add('Ada@Example.edu', {'firstName': 'Ada'})
+    assert not store.add('ada@example.edu', {'firstName': 'Someone else'})
+    assert store.get('ADA@example.edu')['firstName'] == 'Ada'
+    assert 'ada@example.edu' in store
+    assert len(store) == 1
+
+
+def test_user_store_sees_registrations_from_other_processes(tmp_path):
+    store = UserStore(tmp_path / 'users.json')
+    other = UserStore(tmp_path / 'users.json')
+    store.add('ada@example.edu', {'firstName': 'Ada'})
+
+    assert other.add('grace@example.edu', {'firstName': 'Grace'})
+    assert not other.add('ada@example.edu', {'firstName': 'Ada'})
+    assert store.get('grace@example.edu')['firstName'] == 'Grace'
+    assert json.loads((tmp_path / 'users.json').read_text()).keys() == {'ada@example.edu', 'grace@example.edu'}
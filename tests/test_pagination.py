@@ -0,0 +1,117 @@
+"""
+Keyset pagination: cursors, page walks in both directions, and the approximate-count cache
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import pagination
+from models import db, Conversation
+from pagination import approximate_count, decode_cursor, encode_cursor, keyset_paginate
+
+
+class _CountingQuery:
+    """Stands in for a query; counts how often COUNT(*) runs."""
+
+    def __init__(self, total=7):
+        self.total = total
+        self.counted = 0
+
+    def order_by(self, *columns):
+        return self
+
+    def count(self):
+        self.counted += 1
+        return self.total
+
+
+@pytest.fixture(autouse=True)
+def empty_count_cache():
+    pagination._count_cache.clear()
+
+
+@pytest.fixture
+def conversations(app):
+    """25 conversations, several sharing a timestamp so ids have to break ties."""
+    start = datetime(2026, 1, 1)
+    db.session.add_all(Conversation(question=f'q{n}', answer='a', session_id='s',
+                                    timestamp=start + timedelta(minutes=n // 3))
+                       for n in range(25))
+    db.session.commit()
+    return Conversation.query.order_by(Conversation.timestamp.desc(), Conversation.id.desc()).all()
+
+
+def _page(cursor=None, page=None):
+    return keyset_paginate(Conversation.query, Conversation.timestamp, Conversation.id,
+                           cursor=cursor, per_page=10, page=page)
+
+
+def test_cursor_round_trip():
+    token = encode_cursor(datetime(2026, 3, 1, 12, 30), 42, 'prev')
+    assert decode_cursor(token) == ('2026-03-01T12:30:00', 42, 'prev')
+
+
+@pytest.mark.parametrize('token', ['not-base64!', encode_cursor('x', 'id'), 'WzEsMiwic2lkZXdheXMiXQ'])
+def test_malformed_cursor_raises_value_error(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+def test_walking_forward_visits_every_row_once_in_order(conversations):
+    seen, cursor = [], None
+    while True:
+        page = _page(cursor)
+        seen.extend(page.items)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+
+    assert [c.id for c in seen] == [c.id for c in conversations]
+
+
+def test_prev_cursor_returns_the_previous_page(conversations):
+    first = _page()
+    second = _page(first.next_cursor)
+    back = _page(second.prev_cursor)
+
+    assert not first.has_prev
+    assert second.has_prev
+    assert [c.id for c in back.items] == [c.id for c in first.items]
+    assert not back.has_prev
+
+
+def test_page_number_is_honoured_without_a_cursor(conversations):
+    page = _page(page=2)
+    assert [c.id for c in page.items] == [c.id for c in conversations[10:20]]
+    assert page.has_prev and page.has_next
+
+
+def test_approximate_count_is_cached_until_it_expires():
+    query = _CountingQuery()
+    assert approximate_count('k', query) == 7
+    assert approximate_count('k', query) == 7
+    assert query.counted == 1
+
+    approximate_count('expired', query, ttl=-1)
+    approximate_count('expired', query, ttl=-1)
+    assert query.counted == 3
+
+
+def test_count_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(pagination, 'COUNT_CACHE_SIZE', 3)
+    query = _CountingQuery()
+    for n in range(10):
+        approximate_count(('search', n), query)
+    approximate_count(('search', 7), query)  # most recently used survives the next insert
+    approximate_count('new', query)
+
+    assert list(pagination._count_cache) == [('search', 9), ('search', 7), 'new']
+
+
+def test_expired_counts_are_pruned_on_insert():
+    query = _CountingQuery()
+    approximate_count('stale', query, ttl=-1)
+    approximate_count('fresh', query)
+
+    assert list(pagination._count_cache) == ['fresh']
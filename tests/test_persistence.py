@@ -0,0 +1,144 @@
+"""
+Write-behind queue: batching, spooling while the database is down, replay and dead-lettering
+"""
+
+import json
+import threading
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db, Conversation
+from persistence import ConversationWriter, conversation_row, _json_default
+
+
+@pytest.fixture
+def writer(app, tmp_path):
+    writer = ConversationWriter(app, batch_size=10, flush_interval=0.05, spool_path=tmp_path / 'spool.jsonl')
+    yield writer
+    writer.stop()
+
+
+def _unavailable(batch):
+    raise OperationalError('INSERT INTO conversations', {}, Exception('database is down'))
+
+
+def _spool_lines(writer, rows):
+    with open(writer.spool_path, 'a', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps({'table': 'conversations', 'row': row}, default=_json_default) + '\n')
+
+
+def _dead_letters(writer):
+    with open(writer.dead_letter_path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def _questions():
+    db.session.expire_all()
+    return sorted(c.question for c in Conversation.query)
+
+
+def test_flush_writes_queued_rows(writer):
+    for n in range(3):
+        writer.enqueue('conversations', conversation_row(f'q{n}', 'a', 's'))
+
+    assert writer.flush()
+    assert _questions() == ['q0', 'q1', 'q2']
+    assert writer.stats['flushed'] == 3
+
+
+def test_flush_waits_for_the_batch_the_thread_is_writing(writer):
+    insert = writer._insert
+    started = threading.Event()
+
+    def slow_insert(batch):
+        started.set()
+        time.sleep(0.5)
+        insert(batch)
+
+    writer._insert = slow_insert
+    writer.enqueue('conversations', conversation_row('slow', 'a', 's'))
+    assert started.wait(2)
+    assert writer.pending() == 0
+
+    assert writer.flush()
+    assert _questions() == ['slow']
+
+
+def test_unavailable_database_spools_rows_and_replay_writes_them(writer, monkeypatch):
+    monkeypatch.setattr(writer, '_insert', _unavailable)
+    for n in range(3):
+        writer.enqueue('conversations', conversation_row(f'q{n}', 'a', 's'))
+    writer.flush()
+
+    assert _questions() == []
+    assert writer.stats['spooled'] == 3
+    assert len(writer.spool_path.read_text().splitlines()) == 3
+
+    monkeypatch.undo()
+    assert writer.replay_spool() == 3
+    assert _questions() == ['q0', 'q1', 'q2']
+    assert not writer.spool_path.exists()
+
+
+def test_replay_respools_what_it_cannot_write(writer, monkeypatch):
+    _spool_lines(writer, [conversation_row(f'q{n}', 'a', 's') for n in range(25)])
+    monkeypatch.setattr(writer, '_insert', _unavailable)
+
+    assert writer.replay_spool() == 0
+    assert len(writer.spool_path.read_text().splitlines()) == 25
+    assert not list(writer.spool_path.parent.glob('*.replay'))
+
+
+def test_rejected_row_is_dead_lettered_and_the_rest_written(writer):
+    writer.enqueue('conversations', conversation_row('good', 'a', 's'))
+    writer.enqueue('conversations', conversation_row(None, 'a', 's'))  # question is NOT NULL
+    writer.enqueue('conversations', conversation_row('also good', 'a', 's'))
+    writer.flush()
+
+    assert _questions() == ['also good', 'good']
+    [letter] = _dead_letters(writer)
+    assert letter['table'] == 'conversations'
+    assert letter['row']['question'] is None
+    assert 'NOT NULL' in letter['error']
+    assert writer.stats['dead_lettered'] == 1
+
+
+def test_replay_keeps_going_past_rejected_rows_and_torn_lines(writer):
+    _spool_lines(writer, [conversation_row('first', 'a', 's'), conversation_row(None, 'a', 's')])
+    with open(writer.spool_path, 'a', encoding='utf-8') as f:
+        f.write('{"table": "conversations", "row": {"quest\n')
+    _spool_lines(writer, [conversation_row('last', 'a', 's')])
+
+    writer.replay_spool()
+
+    assert _questions() == ['first', 'last']
+    letters = _dead_letters(writer)
+    assert sorted(next(iter(letter)) for letter in letters) == ['line', 'table']
+    assert not writer.spool_path.exists()
+    assert not list(writer.spool_path.parent.glob('*.replay'))
+
+
+def test_replay_from_several_writers_inserts_each_row_once(app, writer, tmp_path):
+    _spool_lines(writer, [conversation_row(f'q{n}', 'a', 's') for n in range(50)])
+    others = [ConversationWriter(app, batch_size=10, spool_path=writer.spool_path) for _ in range(3)]
+
+    threads = [threading.Thread(target=other.replay_spool) for other in [writer] + others]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(_questions()) == 50
+
+
+def test_replay_fills_columns_missing_from_older_spooled_rows(writer):
+    old = conversation_row('old', 'a', 's')
+    del old['context_level']
+    _spool_lines(writer, [old, conversation_row('new', 'a', 's', adjustment={'level': 2})])
+
+    assert writer.replay_spool() == 2
+    levels = {c.question: c.context_level for c in Conversation.query}
+    assert levels == {'old': None, 'new': 2}
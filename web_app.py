@@ -9,9 +9,10 @@ from pathlib import Path
 from datetime import datetime
 import json
 import uuid
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
 from dotenv import load_dotenv
-from mistralai import Mistral
+from llm import get_provider
+from file_store import ConversationLog, UserStore
 import PyPDF2
 import docx
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -116,19 +117,20 @@ class ChatbotManager:
     """Manages chatbot conversations and AI interactions."""
     
     def __init__(self):
-        self.api_key = os.getenv("MISTRAL_API_KEY")
-        if not self.api_key or self.api_key == "your_mistral_api_key_here":
-            print("ERROR: MISTRAL_API_KEY not found in .env file")
+        # Backend is chosen by LLM_PROVIDER (mistral, local, or module:Class)
+        try:
+            self.provider = get_provider()
+        except ValueError as e:
+            print(f"ERROR: {e}")
             sys.exit(1)
         
-        self.client = Mistral(api_key=self.api_key)
-        self.model = "mistral-small-latest"
+        self.model = self.provider.default_model
         self.corpus = ChatbotCorpus()
-        self.storage_file = Path("qa_conversations.json")
+        self.conversations = ConversationLog()
         self.corpus.load_corpus()
     
     def get_ai_response(self, question):
-        """Get response from Mistral AI."""
+        """Get response from the configured LLM provider."""
         try:
             system_message = (
                 "You are a helpful teaching assistant for INFO 6200, a Python coding course. "
@@ -145,12 +147,7 @@ class ChatbotManager:
                 {"role": "user", "content": question}
             ]
             
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=messages
-            )
-            
-            return response.choices[0].message.content
+            return self.provider.complete(messages, model=self.model)
             
         except Exception as e:
             return f"I apologize, but I encountered an error: {str(e)}\nPlease try again."
@@ -158,28 +155,15 @@ class ChatbotManager:
     def save_conversation(self, question, answer, user_info=None, session_id=None):
         """Save a Q&A pair to persistent storage with user metadata."""
         try:
-            # Load existing conversations
-            conversations = []
-            if self.storage_file.exists():
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    conversations = json.load(f)
-            
-            # Add new conversation with user info
-            qa_pair = {
-                "id": len(conversations) + 1,
+            # Append-only: the log assigns the id under its file lock
+            self.conversations.append({
                 "question": question,
                 "answer": answer,
                 "timestamp": datetime.now().isoformat(),
                 "saved_at": datetime.now().isoformat(),
                 "session_id": session_id or str(uuid.uuid4()),
                 "user_info": user_info or {}
-            }
-            conversations.append(qa_pair)
-            
-            # Save to file
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(conversations, f, indent=2, ensure_ascii=False)
-            
+            })
             return True
         except Exception as e:
             print(f"Error saving conversation: {e}")
@@ -189,20 +173,8 @@ class ChatbotManager:
 # Initialize chatbot
 chatbot = ChatbotManager()
 
-# User database file
-USERS_DB_FILE = Path("users_db.json")
-
-def load_users():
-    """Load users from JSON file."""
-    if USERS_DB_FILE.exists():
-        with open(USERS_DB_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
-
-def save_users(users):
-    """Save users to JSON file."""
-    with open(USERS_DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(users, f, indent=2, ensure_ascii=False)
+# Registered users, loaded once from users_db.json and reloaded when it changes
+users = UserStore()
 
 
 @app.route('/')
@@ -220,10 +192,9 @@ def login():
         email = request.form.get('email', '').strip().lower()
         password = request.form.get('password', '')
         
-        users = load_users()
+        user = users.get(email)
         
-        if email in users:
-            user = users[email]
+        if user:
             if check_password_hash(user['password_hash'], password):
                 # Successful login
                 session['user_info'] = {
@@ -270,13 +241,11 @@ def register():
         if len(password) < 6:
             return render_template('register.html', error='Password must be at least 6 characters')
         
-        users = load_users()
-        
         if email in users:
             return render_template('register.html', error='Email already registered')
         
         # Create new user
-        users[email] = {
+        new_user = {
             'firstName': firstName,
             'lastName': lastName,
             'studentId': studentId,
@@ -287,7 +256,9 @@ def register():
             'created_at': datetime.now().isoformat()
         }
         
-        save_users(users)
+        if not users.add(email, new_user):
+            # Another worker registered the same email first
+            return render_template('register.html', error='Email already registered')
         
         # Auto-login after registration
         session['user_info'] = {
@@ -379,6 +350,20 @@ def ask():
     })
 
 
+def stream_json(list_key, items, **fields):
+    """Stream a JSON object whose `list_key` array is written one item at a time."""
+    def generate():
+        yield '{'
+        for key, value in fields.items():
+            yield f'{json.dumps(key)}: {json.dumps(value)}, '
+        yield f'{json.dumps(list_key)}: ['
+        for i, item in enumerate(items):
+            yield (', ' if i else '') + json.dumps(item, ensure_ascii=False)
+        yield ']}'
+    
+    return Response(generate(), mimetype='application/json')
+
+
 @app.route('/history', methods=['GET'])
 def get_history():
     """API endpoint to retrieve conversation history (only for registered users)."""
@@ -387,23 +372,13 @@ def get_history():
         if 'user_info' not in session or not session.get('user_info', {}).get('is_registered'):
             return jsonify({'error': 'History is only available for registered users'}), 403
         
-        user_email = session.get('user_email')
-        conversations = []
-        
-        if chatbot.storage_file.exists():
-            with open(chatbot.storage_file, 'r', encoding='utf-8') as f:
-                all_conversations = json.load(f)
-                
-            # Filter conversations for this user only
-            conversations = [
-                c for c in all_conversations 
-                if c.get('user_info', {}).get('email', '').lower() == user_email
-            ]
-        
-        return jsonify({
-            'conversations': conversations,
-            'count': len(conversations)
-        })
+        # Served from the log's email index, streamed record by record
+        user_email = session.get('user_email', '')
+        return stream_json(
+            'conversations',
+            chatbot.conversations.iter_email(user_email),
+            count=chatbot.conversations.count(email=user_email)
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -412,17 +387,13 @@ def get_history():
 def export_data():
     """Export all conversation data (admin/backend route)."""
     try:
-        conversations = []
-        if chatbot.storage_file.exists():
-            with open(chatbot.storage_file, 'r', encoding='utf-8') as f:
-                conversations = json.load(f)
-        
-        # Return as downloadable JSON
-        return jsonify({
-            'total_conversations': len(conversations),
-            'data': conversations,
-            'export_timestamp': datetime.now().isoformat()
-        })
+        # Streamed so exports never hold the whole history in memory
+        return stream_json(
+            'data',
+            chatbot.conversations.iter_all(),
+            total_conversations=chatbot.conversations.count(),
+            export_timestamp=datetime.now().isoformat()
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
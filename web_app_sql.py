@@ -7,18 +7,26 @@ import os
 import sys
 from pathlib import Path
 from datetime import datetime
+import time
 import uuid
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from sqlalchemy.orm import joinedload
 from dotenv import load_dotenv
-from mistralai import Mistral
 import PyPDF2
 import docx
 
 # Import database models and utilities
-from models import db, User, Conversation, AdminUser
+from models import db, User, Conversation, ArchivedConversation, AdminUser, ContextAdjustment
 from database import init_db
+from db_routing import use_replica
+from persistence import init_write_behind, get_conversation_writer, conversation_row, adjustment_row
 from admin import admin_bp
 from api import api_bp  # Import API blueprint
+from llm import HedgedCompleter, get_provider
+from corpus_index import CorpusIndex, build_fallback_answer
+from router import IntentRouter, ModelRouter
+from prompt_builder import PromptBuilder
+from exports import iter_conversation_dicts, json_document_chunks, ndjson_chunks, export_response, export_options
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +41,7 @@ app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour session timeout
 
 # Initialize database
 init_db(app)
+init_write_behind(app)
 
 # Register blueprints
 app.register_blueprint(admin_bp)
@@ -45,6 +54,8 @@ class ChatbotCorpus:
     def __init__(self, corpus_dir="corpus"):
         self.corpus_dir = Path(corpus_dir)
         self.corpus_text = ""
+        self.documents = []  # (file name, text) pairs
+        self.index = None
         
     def load_corpus(self):
         """Load all documents from the corpus directory."""
@@ -59,16 +70,19 @@ class ChatbotCorpus:
         for txt_file in self.corpus_dir.glob("*.txt"):
             print(f"Loading TXT: {txt_file.name}")
             corpus_parts.append(self._read_txt(txt_file))
+            self.documents.append((txt_file.name, corpus_parts[-1]))
         
         # Load PDFs
         for pdf_file in self.corpus_dir.glob("*.pdf"):
             print(f"Loading PDF: {pdf_file.name}")
             corpus_parts.append(self._read_pdf(pdf_file))
+            self.documents.append((pdf_file.name, corpus_parts[-1]))
         
         # Load DOCX files
         for docx_file in self.corpus_dir.glob("*.docx"):
             print(f"Loading DOCX: {docx_file.name}")
             corpus_parts.append(self._read_docx(docx_file))
+            self.documents.append((docx_file.name, corpus_parts[-1]))
         
         # Load MP4 files (extract metadata/info)
         for mp4_file in self.corpus_dir.glob("*.mp4"):
@@ -77,6 +91,9 @@ class ChatbotCorpus:
         
         self.corpus_text = "\n\n".join(corpus_parts)
         
+        # Sentence index used for extractive fallback answers
+        self.index = CorpusIndex(self.documents)
+        
         if self.corpus_text.strip():
             print(f"Corpus loaded successfully! ({len(corpus_parts)} files)")
         else:
@@ -132,69 +149,113 @@ class ChatbotManager:
     """Manages chatbot conversations and AI interactions."""
     
     def __init__(self):
-        self.api_key = os.getenv("MISTRAL_API_KEY")
-        if not self.api_key or self.api_key == "your_mistral_api_key_here":
-            print("ERROR: MISTRAL_API_KEY not found in .env file")
+        # Backend is chosen by LLM_PROVIDER (mistral, local, or module:Class)
+        try:
+            self.provider = get_provider()
+        except ValueError as e:
+            print(f"ERROR: {e}")
             sys.exit(1)
         
-        self.client = Mistral(api_key=self.api_key)
-        self.model = "mistral-small-latest"
+        self.model = self.provider.default_model
+        self.llm = HedgedCompleter(self.provider.complete)
+        # Seconds to wait for the upstream before answering from the corpus instead (0 = no deadline)
+        self.answer_deadline = float(os.getenv('LLM_ANSWER_DEADLINE', 0)) or None
+        self.router = IntentRouter()
         self.corpus = ChatbotCorpus()
         self.corpus.load_corpus()
+        self.prompts = PromptBuilder(self.corpus)
+        self.model_router = ModelRouter(self.model, self.corpus.index)
     
-    def get_ai_response(self, question):
-        """Get response from Mistral AI."""
+    def get_ai_response(self, question, model=None):
+        """Get response text from the LLM provider (or the corpus fallback)."""
+        return self.get_answer(question, model=model)['answer']
+    
+    def get_answer(self, question, model=None, history_length=0):
+        """
+        Answer a question with the given model (default: a tier picked from the
+        question's complexity), degrading to an extractive corpus answer when
+        the upstream is unavailable or misses the deadline.
+        
+        Returns a dict with 'answer', 'fallback', 'sources', 'intent', 'model'
+        and 'context' (the prompt context profile used, if any). Fallback answers
+        are flagged so callers never treat them as a real LLM answer (e.g. cache them).
+        """
+        # Small talk is answered locally without calling the LLM
+        decision = self.router.route(question)
+        if decision['route'] == 'template':
+            return {
+                'answer': self.router.template_answer(decision['intent']),
+                'fallback': False,
+                'sources': [],
+                'intent': decision['intent'],
+                'model': None,
+                'context': None
+            }
+        
+        # An explicit model wins; otherwise pick a cheaper tier for simple questions
+        if model:
+            tier = {'tier': None, 'model': model}
+        else:
+            tier = self.model_router.choose(question, history_length)
+        
+        # Context size adapts to current upstream latency and queue depth
+        messages, profile = self.prompts.build(question)
+        
         try:
-            system_message = (
-                "You are a helpful teaching assistant for INFO 6200, a Python coding course. "
-                "Answer student questions clearly and concisely based on the course materials provided. "
-                "If the answer isn't in the course materials, provide general Python guidance but mention "
-                "that students should verify with their professor."
-            )
-            
-            if self.corpus.corpus_text:
-                system_message += f"\n\nCourse Materials:\n{self.corpus.corpus_text}"
-            
-            messages = [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": question}
-            ]
-            
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=messages
-            )
+            start = time.monotonic()
+            with self.prompts.track():
+                answer = self.llm.complete(
+                    messages=messages,
+                    model=tier['model'],
+                    max_tokens=profile['max_tokens'],
+                    deadline=self.answer_deadline
+                )
+            self.model_router.record_latency(tier['tier'], time.monotonic() - start)
             
-            return response.choices[0].message.content
+            return {
+                'answer': answer,
+                'fallback': False,
+                'sources': [],
+                'intent': decision['intent'],
+                'model': tier['model'],
+                'context': profile
+            }
              
         except Exception as e:
-            return f"I apologize, but I encountered an error: {str(e)}\nPlease try again."
+            print(f"LLM unavailable, answering from corpus: {e}")
+            answer, sources = build_fallback_answer(self.corpus.index, question)
+            return {
+                'answer': answer,
+                'fallback': True,
+                'sources': sources,
+                'intent': decision['intent'],
+                'model': None,
+                'context': profile
+            }
     
-    def save_conversation(self, question, answer, user_id=None, session_id=None, user_info=None):
-        """Save a Q&A pair to database."""
+    def save_conversation(self, question, answer, user_id=None, session_id=None, user_info=None, context=None):
+        """
+        Save a Q&A pair (and any context adjustment applied to it) to database.
+        
+        With write-behind enabled the rows are queued and written in batches
+        off the request path; otherwise they are committed inline.
+        """
+        session_id = session_id or str(uuid.uuid4())
+        adjustment = adjustment_row(session_id, context)
+        row = conversation_row(question, answer, session_id, user_id=user_id, user_info=user_info,
+                               adjustment=adjustment)
+        
+        writer = get_conversation_writer()
+        if writer:
+            writer.enqueue(Conversation.__tablename__, row)
+            if adjustment:
+                writer.enqueue(ContextAdjustment.__tablename__, adjustment)
+            return True
+        
         try:
-            conversation = Conversation(
-                question=question,
-                answer=answer,
-                session_id=session_id or str(uuid.uuid4())
-            )
-            
-            if user_id:
-                # Registered user
-                conversation.user_id = user_id
-                conversation.is_guest = False
-            else:
-                # Guest user
-                conversation.is_guest = True
-                if user_info:
-                    conversation.guest_first_name = user_info.get('firstName', '')
-                    conversation.guest_last_name = user_info.get('lastName', '')
-                    conversation.guest_student_id = user_info.get('studentId', '')
-                    conversation.guest_email = user_info.get('email', '')
-                    conversation.guest_course_section = user_info.get('courseSection', '')
-                    conversation.guest_semester = user_info.get('semester', '')
-            
-            db.session.add(conversation)
+            db.session.add(Conversation(**row))
+            if adjustment:
+                db.session.add(ContextAdjustment(**adjustment))
             db.session.commit()
             return True
             
@@ -388,8 +449,10 @@ def ask():
     if len(question) > 1000:
         return jsonify({'error': 'Question too long (max 1000 characters)'}), 400
     
-    # Get AI response
-    answer = chatbot.get_ai_response(question)
+    # Get AI response (questions earlier in this session hint at follow-up complexity)
+    result = chatbot.get_answer(question, history_length=session.get('question_count', 0))
+    answer = result['answer']
+    session['question_count'] = session.get('question_count', 0) + 1
     
     # Save conversation with user info
     user_id = session.get('user_id') if session.get('user_info', {}).get('is_registered') else None
@@ -398,12 +461,15 @@ def ask():
         answer, 
         user_id=user_id,
         session_id=session.get('session_id'),
-        user_info=session.get('user_info') if not user_id else None
+        user_info=session.get('user_info') if not user_id else None,
+        context=result['context']
     )
     
     return jsonify({
         'question': question,
         'answer': answer,
+        'fallback': result['fallback'],
+        'sources': result['sources'],
         'timestamp': datetime.now().isoformat()
     })
 
@@ -419,7 +485,9 @@ def get_history():
         user_id = session.get('user_id')
         
         # Get user's conversations
-        conversations = Conversation.query.filter_by(
+        conversations = Conversation.query.options(
+            joinedload(Conversation.user)
+        ).filter_by(
             user_id=user_id
         ).order_by(Conversation.timestamp.desc()).all()
         
@@ -432,6 +500,7 @@ def get_history():
 
 
 @app.route('/export_data', methods=['GET'])
+@use_replica
 def export_data():
     """Export all conversation data (admin/backend route - PROTECTED)."""
     # Check if admin is logged in
@@ -439,13 +508,22 @@ def export_data():
         return jsonify({'error': 'Admin authentication required'}), 403
     
     try:
-        conversations = Conversation.query.all()
-        
-        return jsonify({
-            'total_conversations': len(conversations),
-            'data': [conv.to_dict() for conv in conversations],
-            'export_timestamp': datetime.now().isoformat()
-        })
+        # Streamed from a server-side cursor; ?format=ndjson, ?gzip=1 and ?archive=1 are also accepted
+        fmt, compress = export_options(request, default='json', allowed=('json', 'ndjson'))
+        include_archive = request.args.get('archive') == '1'
+        rows = iter_conversation_dicts(include_archive=include_archive)
+        if fmt == 'ndjson':
+            chunks = ndjson_chunks(rows)
+        else:
+            total = Conversation.query.count()
+            if include_archive:
+                total += ArchivedConversation.query.count()
+            chunks = json_document_chunks(
+                'data', rows,
+                total_conversations=total,
+                export_timestamp=datetime.now().isoformat()
+            )
+        return export_response(chunks, fmt, None, compress)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 